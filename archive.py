@@ -0,0 +1,199 @@
+"""Hot and archive storage for events, activities and completed tasks.
+
+``events``, ``activities`` and ``tasks`` hold only what the bot still
+answers about. The mover copies older rows into ``*_archive`` tables (models.py,
+same columns plus ``archived_at``) and deletes them from the hot tables:
+
+  * events and activities that ended more than ARCHIVE_SETTINGS['event_days'] ago,
+    together with their participant rows;
+  * tasks that have been DONE for more than ARCHIVE_SETTINGS['task_days']
+    (last update). Their task_tags rows are dropped; the ``tags`` column
+    travels with the row, so the links can be rebuilt from the archive.
+
+Each batch of ``batch_size`` rows is one transaction: copy, then delete,
+on the primary. Readers never see a row in both places or in neither.
+Queries keep using the ORM models, so they read the hot tables by default and
+their ``status == 'active'`` / ``start_time >= now`` / DONE filters scan only
+the retention window. History is read explicitly with ``archived``.
+
+The same archive tables are used on SQLite and Postgres. Native Postgres
+partitioning would need the time column in the primary key of ``events`` and
+``tasks``, which breaks the foreign keys from the participant and tag tables
+and the ORM identity by ``id``. A hot table plus an archive table bounds the
+hot size on both dialects without that migration. The archive rows keep no
+foreign keys, so deleting an employee later does not touch history.
+
+The Telegram bot runs the mover as a background job (ARCHIVE_SETTINGS).
+
+Usage:
+    python archive.py --database-url sqlite:///eval.db --status
+    python archive.py --database-url sqlite:///eval.db --run
+    python archive.py --database-url sqlite:///eval.db --bench   # moves rows: run it on a copy
+"""
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import DateTime, Table, and_, delete, func, insert, literal, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+import cli
+from config import ARCHIVE_SETTINGS
+from employee_summary import local_now
+from models import (
+    Activity, Event, Task, TaskStatus, activities_archive, activity_participants, activity_participants_archive,
+    event_participants, event_participants_archive, events_archive, task_tags, tasks_archive
+)
+from snapshot import invalidate_all
+
+logger = logging.getLogger(__name__)
+
+
+class ArchivePolicy(NamedTuple):
+    table: Table  # горячая таблица
+    archive: Table
+    retention: str  # ключ ARCHIVE_SETTINGS со сроком в днях
+    expired: Callable[[datetime], object]  # граница -> условие WHERE для переноса
+    time_column: str  # по нему читается архив
+    children: Tuple[Tuple[Table, Table, str], ...] = ()  # (таблица участников, ее архив, столбец владельца)
+    dropped: Tuple[Tuple[Table, str], ...] = ()  # производные связи, удаляются вместе с владельцем
+
+
+POLICIES = {
+    'events': ArchivePolicy(
+        Event.__table__, events_archive, 'event_days', lambda cutoff: Event.end_time < cutoff, 'start_time',
+        children=((event_participants, event_participants_archive, 'event_id'),),
+    ),
+    'activities': ArchivePolicy(
+        Activity.__table__, activities_archive, 'event_days', lambda cutoff: Activity.end_time < cutoff, 'start_time',
+        children=((activity_participants, activity_participants_archive, 'activity_id'),),
+    ),
+    'tasks': ArchivePolicy(
+        Task.__table__, tasks_archive, 'task_days',
+        lambda cutoff: and_(Task.status == TaskStatus.DONE, func.coalesce(Task.updated_at, Task.created_at) < cutoff),
+        'updated_at',
+        dropped=((task_tags, 'task_id'),),
+    ),
+}
+
+
+def _copy(conn: Connection, source: Table, target: Table, condition, archived_at: datetime):
+    names = [column.name for column in source.columns]
+    conn.execute(insert(target).from_select(
+        names + ['archived_at'], select(*source.columns, literal(archived_at, DateTime)).where(condition)
+    ))
+
+
+def move_batch(conn: Connection, policy: ArchivePolicy, cutoff: datetime, batch_size: int,
+               archived_at: datetime) -> int:
+    """Move up to ``batch_size`` expired rows (and their child rows) into the archive; returns rows moved."""
+    table = policy.table
+    ids = conn.execute(
+        select(table.c.id).where(policy.expired(cutoff)).order_by(table.c.id).limit(batch_size)
+    ).scalars().all()
+    if not ids:
+        return 0
+    for child, child_archive, owner in policy.children:
+        _copy(conn, child, child_archive, child.c[owner].in_(ids), archived_at)
+        conn.execute(delete(child).where(child.c[owner].in_(ids)))
+    for link, owner in policy.dropped:
+        conn.execute(delete(link).where(link.c[owner].in_(ids)))
+    _copy(conn, table, policy.archive, table.c.id.in_(ids), archived_at)
+    conn.execute(delete(table).where(table.c.id.in_(ids)))
+    return len(ids)
+
+
+def run(bind: Engine, now: Optional[datetime] = None, settings: dict = ARCHIVE_SETTINGS) -> Dict[str, int]:
+    """Move everything past retention, batch by batch; returns rows moved per table."""
+    now = now or local_now()
+    moved = {}
+    for name, policy in POLICIES.items():
+        started = time.perf_counter()
+        cutoff = now - timedelta(days=settings[policy.retention])
+        moved[name] = 0
+        while True:
+            with bind.begin() as conn:
+                count = move_batch(conn, policy, cutoff, settings['batch_size'], now)
+            moved[name] += count
+            if count < settings['batch_size']:
+                break
+        if moved[name]:
+            logger.info("Archived %d %s older than %s in %.2fs",
+                        moved[name], name, cutoff.date(), time.perf_counter() - started)
+    if any(moved.values()):
+        # Core-удаления обходят события маппера, которые помечают индекс поиска устаревшим
+        invalidate_all()
+    return moved
+
+
+def archived(session: Session, name: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+             limit: int = 100) -> List:
+    """Archived rows of ``name`` ('events', 'activities', 'tasks') in a time range, newest first."""
+    archive = POLICIES[name].archive
+    column = archive.c[POLICIES[name].time_column]
+    query = select(archive)
+    if since is not None:
+        query = query.where(column >= since)
+    if until is not None:
+        query = query.where(column < until)
+    return session.execute(query.order_by(column.desc()).limit(limit)).all()
+
+
+def status(bind: Engine) -> Dict[str, Tuple[int, int]]:
+    """(hot rows, archived rows) per table."""
+    with bind.connect() as conn:
+        return {
+            name: (conn.execute(select(func.count()).select_from(policy.table)).scalar(),
+                   conn.execute(select(func.count()).select_from(policy.archive)).scalar())
+            for name, policy in POLICIES.items()
+        }
+
+
+def main():
+    parser = cli.parser(__doc__, bench='time the hot-table queries before and after a run')
+    parser.add_argument('--status', action='store_true', help='hot and archived rows per table')
+    parser.add_argument('--run', action='store_true', help='move everything past retention now')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    bind = cli.connect(args)
+    now = local_now()
+    # Запросы поиска по горячим таблицам (telegram_bot, bot.search_tasks "выполненные", reminders)
+    queries = {
+        'active upcoming events': select(Event.id).where(Event.status == 'active', Event.start_time >= now),
+        'active activities': select(Activity.id).where(Activity.status == 'active'),
+        'done tasks': select(Task.id).where(Task.status == TaskStatus.DONE),
+        'open tasks': select(Task.id).where(Task.status != TaskStatus.DONE),
+    }
+
+    def timed() -> Dict[str, Tuple[int, float]]:
+        results = {}
+        with bind.connect() as conn:
+            for label, query in queries.items():
+                best, rows = float('inf'), 0
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    rows = len(conn.execute(query).all())
+                    best = min(best, time.perf_counter() - started)
+                results[label] = (rows, best)
+        return results
+
+    before = timed() if args.bench else None
+    if args.run or args.bench:
+        started = time.perf_counter()
+        moved = run(bind, now)
+        print(f"moved {moved} in {time.perf_counter() - started:.2f}s")
+    if args.bench:
+        after = timed()
+        print(f"{'query':<24} {'rows before':>11} {'ms':>7} {'rows after':>10} {'ms':>7}")
+        for label in queries:
+            (rows_before, time_before), (rows_after, time_after) = before[label], after[label]
+            print(f"{label:<24} {rows_before:>11} {time_before * 1000:>7.2f} {rows_after:>10} {time_after * 1000:>7.2f}")
+    if args.status or args.bench:
+        for name, (hot, cold) in status(bind).items():
+            print(f"{name:<12} hot {hot:>7}  archived {cold:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""Async data access for the Telegram handlers.
+
+Handlers used to run each search in a worker thread with a synchronous
+session (``asyncio.to_thread(answer_query, ...)``). The thread stays busy for
+as long as the database does. The default executor has min(32, cpu + 4)
+threads, so under load concurrent chats queued for a thread, not for the
+database. ``AsyncRepository`` runs the same queries on an ``AsyncSession``.
+While a query waits on I/O, the event loop serves other chats.
+
+  * ``async_url`` maps DATABASE_URL / READ_DATABASE_URL to the async drivers:
+    sqlite -> sqlite+aiosqlite, postgresql -> postgresql+asyncpg;
+  * sessions are the same ``RoutingSession`` as ``models.Session``: reads go
+    to the replica while it is fresh, writes and pinned sessions go to the
+    primary;
+  * every ``search_*`` access pattern has a statement builder below. The sync
+    search functions and the repository execute the same statement, limited
+    to the rows the reply can show; ``fetch_page`` adds the total from a
+    ``*_count`` statement when the limit was reached. The
+    relationships the formatters read (organizer, assignee, participants) are
+    loaded eagerly, because an AsyncSession cannot lazy-load them while the
+    reply is formatted;
+  * only the statements run on the event loop. Formatting the cards runs in
+    a thread (``answer_query_async``), and so does everything that is CPU:
+    birthdays and availability (in-memory indexes and a listing scan),
+    employee and general-info search (BM25 and embeddings).
+
+``ASYNC_DB_ENABLED`` is ``auto`` by default: on for Postgres (asyncpg, no
+threads at all), off for SQLite. aiosqlite gives every connection its own
+thread, so it adds a hop to the thread path instead of removing one and is
+slower on bench_async_db.py; ``true`` turns it on anyway. Without the driver
+installed, or with ``false``, ``create_repository`` returns None and the
+handlers keep the thread path.
+
+    python bench_async_db.py --database-url sqlite:///eval.db --chats 200
+"""
+import logging
+from datetime import datetime
+from typing import Callable, Iterable, List, Optional, Tuple, TypeVar
+
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.sql import Select
+
+from config import ASYNC_DB_SETTINGS, DATABASE_URL, READ_DATABASE_URL
+from models import Activity, Event, Tag, Task, TaskStatus
+from replica import ReplicaMonitor, RoutingSession
+from taxonomy import known_labels, tag_filter
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Синхронный драйвер -> асинхронный для того же диалекта
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'sqlite+pysqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+}
+
+
+def async_url(url: str) -> str:
+    """The same database through its async driver; ValueError for dialects without one here."""
+    parsed = make_url(url)
+    if parsed.drivername in ASYNC_DRIVERS.values():
+        return url
+    if parsed.drivername not in ASYNC_DRIVERS:
+        raise ValueError(f"no async driver configured for {parsed.drivername}")
+    return parsed.set(drivername=ASYNC_DRIVERS[parsed.drivername]).render_as_string(hide_password=False)
+
+
+# --- statements shared by the sync and async search paths ------------------
+
+def _upcoming_events(now: datetime) -> tuple:
+    return Event.start_time >= now, Event.status == 'active'
+
+
+def upcoming_events_query(now: datetime, limit: Optional[int] = None) -> Select:
+    return (
+        select(Event)
+        .where(*_upcoming_events(now))
+        .options(joinedload(Event.organizer), selectinload(Event.participants))
+        .order_by(Event.start_time)
+        .limit(limit)
+    )
+
+
+def upcoming_events_count(now: datetime) -> Select:
+    return select(func.count(Event.id)).where(*_upcoming_events(now))
+
+
+def _open_tasks(now: datetime, tags: Iterable[str]) -> tuple:
+    tags = list(tags)
+    conditions = (Task.status != TaskStatus.DONE, Task.due_date >= now)
+    return conditions + (tag_filter(*tags),) if tags else conditions
+
+
+def open_tasks_query(now: datetime, tags: Iterable[str] = (), limit: Optional[int] = None) -> Select:
+    return (
+        select(Task)
+        .where(*_open_tasks(now, tags))
+        .options(joinedload(Task.assignee))
+        .order_by(Task.priority.desc(), Task.due_date)
+        .limit(limit)
+    )
+
+
+def open_tasks_count(now: datetime, tags: Iterable[str] = ()) -> Select:
+    return select(func.count(Task.id)).where(*_open_tasks(now, tags))
+
+
+def _upcoming_activities(now: datetime) -> tuple:
+    return Activity.start_time >= now, Activity.status == 'active'
+
+
+def upcoming_activities_query(now: datetime, limit: Optional[int] = None) -> Select:
+    return (
+        select(Activity)
+        .where(*_upcoming_activities(now))
+        .options(joinedload(Activity.organizer))
+        .order_by(Activity.start_time)
+        .limit(limit)
+    )
+
+
+def upcoming_activities_count(now: datetime) -> Select:
+    return select(func.count(Activity.id)).where(*_upcoming_activities(now))
+
+
+def fetch_page(session: Session, query: Select, count: Select, limit: Optional[int]) -> Tuple[list, int]:
+    """Rows of ``query`` (built with ``limit``) and the total; ``count`` runs only when the limit was reached."""
+    rows = session.execute(query).scalars().all()
+    if limit is None or len(rows) < limit:
+        return rows, len(rows)
+    return rows, session.execute(count).scalar_one()
+
+
+async def _fetch_page_async(session: AsyncSession, query: Select, count: Select,
+                            limit: Optional[int]) -> Tuple[list, int]:
+    rows = (await session.execute(query)).scalars().all()
+    if limit is None or len(rows) < limit:
+        return rows, len(rows)
+    return rows, (await session.execute(count)).scalar_one()
+
+
+class AsyncRepository:
+    """Async counterparts of the ``search_*`` queries; one short AsyncSession per call."""
+
+    def __init__(self, engine: AsyncEngine, read_engine: Optional[AsyncEngine] = None):
+        self.engine = engine
+        self.read_engine = read_engine
+        monitor = ReplicaMonitor(engine.sync_engine, read_engine.sync_engine) if read_engine is not None else None
+        self.sessions = async_sessionmaker(
+            engine, expire_on_commit=False, sync_session_class=RoutingSession,
+            read_bind=read_engine.sync_engine if read_engine is not None else None, monitor=monitor,
+        )
+
+    async def upcoming_events(self, now: datetime, limit: Optional[int] = None) -> Tuple[List[Event], int]:
+        """(the first ``limit`` upcoming events, how many there are in all)."""
+        async with self.sessions() as session:
+            return await _fetch_page_async(
+                session, upcoming_events_query(now, limit), upcoming_events_count(now), limit)
+
+    async def open_tasks(self, now: datetime, candidates: Iterable[str] = (),
+                         limit: Optional[int] = None) -> Tuple[List[str], List[Task], int]:
+        """(tags named among the candidate phrases, open tasks with any of them or all open tasks, their total)."""
+        async with self.sessions() as session:
+            tags = await session.run_sync(known_labels, Tag, candidates)
+            tasks, total = await _fetch_page_async(
+                session, open_tasks_query(now, tags, limit), open_tasks_count(now, tags), limit)
+            return tags, tasks, total
+
+    async def upcoming_activities(self, now: datetime, limit: Optional[int] = None) -> Tuple[List[Activity], int]:
+        async with self.sessions() as session:
+            return await _fetch_page_async(
+                session, upcoming_activities_query(now, limit), upcoming_activities_count(now), limit)
+
+    async def run_sync(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """``fn(session, *args)`` with a synchronous view of an async session (index-backed lookups)."""
+        async with self.sessions() as session:
+            return await session.run_sync(fn, *args, **kwargs)
+
+    async def dispose(self):
+        await self.engine.dispose()
+        if self.read_engine is not None:
+            await self.read_engine.dispose()
+
+
+def _create_engine(url: str, settings: dict) -> AsyncEngine:
+    # aiosqlite по умолчанию без пула (NullPool): поток и соединение на каждый запрос
+    return create_async_engine(async_url(url), poolclass=AsyncAdaptedQueuePool, pool_size=settings['pool_size'])
+
+
+def create_repository(database_url: str = DATABASE_URL, read_database_url: Optional[str] = READ_DATABASE_URL,
+                      settings: dict = ASYNC_DB_SETTINGS) -> Optional[AsyncRepository]:
+    """Repository for the configured databases, or None when async access is off or its driver is missing."""
+    mode = settings['enabled']
+    if mode == 'auto':
+        # Выигрыш только у asyncpg; aiosqlite - тот же поток на соединение плюс переходы между циклом и им
+        mode = 'true' if make_url(database_url).get_backend_name() == 'postgresql' else 'false'
+    if mode != 'true':
+        return None
+    try:
+        engine = _create_engine(database_url, settings)
+        read_engine = _create_engine(read_database_url, settings) if read_database_url else None
+    except (ImportError, ValueError) as e:
+        logger.warning("Async database access disabled, searches use worker threads: %s", e)
+        return None
+    logger.info("Async database access via %s", engine.url.drivername)
+    return AsyncRepository(engine, read_engine)
@@ -0,0 +1,197 @@
+"""Benchmark: Telegram search answers under concurrency, thread path vs AsyncRepository.
+
+``--chats`` concurrent chats each ask one question from a fixed mix (events,
+tasks, tasks by tag, activities, birthdays). Both paths run on the same event loop:
+
+  * threads: ``asyncio.to_thread(...)`` with a synchronous session, as the
+    handler did before (default executor, min(32, cpu + 4) threads);
+  * async:   ``AsyncRepository``.
+
+By default only the data access is timed: the same statements, with no reply
+text. ``--answers`` times whole answers (``answer_query`` vs
+``answer_query_async``). Formatting is CPU work and runs in a thread on
+either path (answers render at most page_size * cached_pages cards,
+rendering.py); birthday answers take the thread path on both.
+
+SQLite answers in microseconds, which is not what a database server on the
+network does. ``--latency-ms`` adds a round trip to every statement. The
+thread path sleeps in its worker thread, the way a blocking driver waits on
+the socket. The async path awaits the sleep, the way asyncpg does.
+
+Reported per path: wall time, answers/sec, p50/p95 latency per chat and the
+peak number of live threads. On the async path with SQLite the threads are
+aiosqlite's, one per pooled connection; asyncpg would add none. The script
+first checks that both paths give identical answers.
+
+Usage:
+    python bench_async_db.py --database-url sqlite:///eval.db --chats 50 200 --latency-ms 0 5 20
+    python bench_async_db.py --database-url sqlite:///eval.db --chats 50 --latency-ms 0 --answers
+"""
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+from sqlalchemy.util import await_only
+
+from async_repository import (
+    AsyncRepository, _create_engine, fetch_page, open_tasks_count, open_tasks_query, upcoming_activities_count,
+    upcoming_activities_query, upcoming_events_count, upcoming_events_query
+)
+from birthdays import query_month
+from config import ASYNC_DB_SETTINGS, CONVERSATION_SETTINGS
+from models import Tag, init_db
+from taxonomy import known_labels
+from text_pipeline import analyze
+
+QUESTIONS = [
+    ("информация о мероприятии", "какие мероприятия на этой неделе"),
+    ("информация о задаче", "какие у меня задачи"),
+    ("информация о задаче", "задачи по docker"),
+    ("социальные активности", "какие активности запланированы"),
+    ("день рождения", "у кого день рождения в этом месяце"),
+]
+
+
+def add_latency(engine, latency: dict, is_async: bool):
+    """Sleep ``latency['seconds']`` before every statement (changed between runs)."""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _round_trip(conn, cursor, statement, parameters, context, executemany):
+        seconds = latency['seconds']
+        if seconds:
+            if is_async:
+                await_only(asyncio.sleep(seconds))  # ожидание в цикле событий, как у asyncpg
+            else:
+                time.sleep(seconds)  # поток занят, как у блокирующего драйвера
+
+
+class ThreadSampler:
+    """Peak ``threading.active_count()`` while the run is in progress."""
+
+    def __init__(self):
+        self.peak = threading.active_count()
+        self._task = None
+
+    async def _sample(self):
+        while True:
+            self.peak = max(self.peak, threading.active_count())
+            await asyncio.sleep(0.005)
+
+    def __enter__(self):
+        self._task = asyncio.get_running_loop().create_task(self._sample())
+        return self
+
+    def __exit__(self, *exc):
+        self.peak = max(self.peak, threading.active_count())
+        self._task.cancel()
+
+
+# Как telegram_bot.RESULT_ROWS: строки, которые ответ может показать
+LIMIT = CONVERSATION_SETTINGS['page_size'] * CONVERSATION_SETTINGS['cached_pages']
+
+
+def fetch(session: Session, question: str, category: str, now) -> int:
+    """Rows behind the answer, synchronously (what ``answer_query`` reads before formatting)."""
+    if category == "информация о мероприятии":
+        return len(fetch_page(session, upcoming_events_query(now, LIMIT), upcoming_events_count(now), LIMIT)[0])
+    if category == "информация о задаче":
+        tags = known_labels(session, Tag, analyze(question).ngrams)
+        return len(fetch_page(session, open_tasks_query(now, tags, LIMIT), open_tasks_count(now, tags), LIMIT)[0])
+    if category == "социальные активности":
+        return len(fetch_page(
+            session, upcoming_activities_query(now, LIMIT), upcoming_activities_count(now), LIMIT)[0])
+    return len(query_month(session, now.month))
+
+
+async def fetch_async(repository: AsyncRepository, question: str, category: str, now) -> int:
+    if category == "информация о мероприятии":
+        return len((await repository.upcoming_events(now, LIMIT))[0])
+    if category == "информация о задаче":
+        return len((await repository.open_tasks(now, analyze(question).ngrams, LIMIT))[1])
+    if category == "социальные активности":
+        return len((await repository.upcoming_activities(now, LIMIT))[0])
+    return len(await repository.run_sync(query_month, now.month))
+
+
+async def run(path: str, chats: int, bind, telegram_bot, answers: bool) -> dict:
+    now = telegram_bot._now()
+
+    def sync_chat(question, category):
+        with Session(bind=bind) as session:
+            if answers:
+                return telegram_bot.answer_query(question, category, session)
+            return fetch(session, question, category, now)
+
+    async def chat(i: int) -> float:
+        category, question = QUESTIONS[i % len(QUESTIONS)]
+        started = time.perf_counter()
+        if path == 'threads':
+            await asyncio.to_thread(sync_chat, question, category)
+        elif answers:
+            with Session(bind=bind) as session:  # для категорий, которые answer_query_async отдает в поток
+                await telegram_bot.answer_query_async(question, category, session)
+        else:
+            await fetch_async(telegram_bot.repository, question, category, now)
+        return time.perf_counter() - started
+
+    with ThreadSampler() as threads:
+        started = time.perf_counter()
+        latencies = sorted(await asyncio.gather(*(chat(i) for i in range(chats))))
+        wall = time.perf_counter() - started
+    return {
+        'wall': wall, 'rate': chats / wall, 'p50': statistics.median(latencies),
+        'p95': latencies[int(0.95 * (len(latencies) - 1))], 'threads': threads.peak,
+    }
+
+
+async def main_async(args):
+    import telegram_bot
+
+    bind = create_engine(args.database_url, pool_size=ASYNC_DB_SETTINGS['pool_size'])
+    init_db(bind)
+    repository = AsyncRepository(_create_engine(args.database_url, ASYNC_DB_SETTINGS))
+    telegram_bot.repository = repository
+    latency = {'seconds': 0.0}
+    add_latency(bind, latency, is_async=False)
+    add_latency(repository.engine.sync_engine, latency, is_async=True)
+    try:
+        for category, question in QUESTIONS:
+            with Session(bind=bind) as session:
+                expected = await asyncio.to_thread(telegram_bot.answer_query, question, category, session)
+                got = await telegram_bot.answer_query_async(question, category, session)
+            status = 'same' if got == expected else 'DIFFERENT'
+            print(f"{question!r}: {status} ({len(got)} chars)")
+
+        print('whole answers' if args.answers else 'data access only')
+        print(f"{'latency':>8} {'chats':>6} {'path':<8} {'wall s':>7} {'ans/s':>7} "
+              f"{'p50 ms':>8} {'p95 ms':>8} {'threads':>7}")
+        for latency_ms in args.latency_ms:
+            latency['seconds'] = latency_ms / 1000
+            for chats in args.chats:
+                for path in ('threads', 'async'):
+                    # Пулы пустые перед каждым прогоном: потоки aiosqlite одного прогона не попадают в другой
+                    bind.dispose()
+                    await repository.engine.dispose()
+                    result = await run(path, chats, bind, telegram_bot, args.answers)
+                    print(f"{latency_ms:>6}ms {chats:>6} {path:<8} {result['wall']:>7.2f} {result['rate']:>7.1f} "
+                          f"{result['p50'] * 1000:>8.1f} {result['p95'] * 1000:>8.1f} {result['threads']:>7}")
+    finally:
+        await repository.dispose()
+        bind.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--chats', type=int, nargs='+', default=[50, 200])
+    parser.add_argument('--latency-ms', type=float, nargs='+', default=[0, 5],
+                        help='simulated round trip per SQL statement')
+    parser.add_argument('--answers', action='store_true', help='time whole answers, formatting included')
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
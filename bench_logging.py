@@ -0,0 +1,108 @@
+"""Benchmark: per-message logging overhead before and after the logging overhaul.
+
+"before" reproduces the old hot path: synchronous StreamHandler, DEBUG
+enabled, eager f-strings for the similarity vector and the full response.
+"after" uses logging_setup: lazy %-formatting, INFO level, queue handler,
+payload cap and (optionally) sampling of per-message logs.
+
+Usage:
+    python bench_logging.py --messages 20000 --sample-rate 0.1
+"""
+import argparse
+import logging
+import logging.handlers
+import os
+import queue
+import tempfile
+import time
+
+import logging_setup
+
+RESPONSE = "Вот что я нашел:\n\n" + "👤 Иван Иванов\n📋 Должность: Разработчик\n🏢 Отдел: IT\n\n" * 40
+SIMILARITIES = [0.1234567 * i for i in range(10)]
+
+
+class FakeTensor:
+    """Stands in for a torch tensor whose repr is expensive."""
+
+    def __repr__(self):
+        return 'tensor([' + ', '.join(f'{v:.4f}' for v in SIMILARITIES) + '])'
+
+
+def reset_root():
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+
+
+def run_before(path: str, messages: int) -> float:
+    reset_root()
+    handler = logging.FileHandler(path, encoding='utf-8')
+    handler.setFormatter(logging.Formatter(logging_setup.TEXT_FORMAT))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(logging.DEBUG)
+    logger = logging.getLogger('bench.before')
+    similarities = FakeTensor()
+    started = time.perf_counter()
+    for i in range(messages):
+        query = f"кто знает python {i}"
+        logger.info(f"Received query: {query}")
+        logger.debug(f"Similarities: {similarities}")
+        logger.info(f"Classified query '{query}' as 'поиск сотрудника' with confidence {0.87:.2f}")
+        logger.info(f"Sending response: {RESPONSE}")
+    elapsed = time.perf_counter() - started
+    reset_root()
+    return elapsed
+
+
+def run_after(path: str, messages: int, sample_rate: float) -> float:
+    reset_root()
+    handler = logging.FileHandler(path, encoding='utf-8')
+    handler.setFormatter(logging_setup.TruncatingFormatter(max_payload=300))
+    root = logging.getLogger()
+    log_queue = queue.SimpleQueue()
+    root.addHandler(logging_setup.LazyQueueHandler(log_queue))
+    root.setLevel(logging.INFO)
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    listener.start()
+    logger = logging.getLogger('bench.after.messages')
+    if sample_rate < 1.0:
+        logger.addFilter(logging_setup.SamplingFilter(sample_rate))
+    similarities = FakeTensor()
+    started = time.perf_counter()
+    for i in range(messages):
+        query = f"кто знает python {i}"
+        logger.info("Received query: %s", query)
+        logger.debug("Similarities: %s", similarities)
+        logger.info("Classified query %r as %r with confidence %.2f", query, 'поиск сотрудника', 0.87)
+        logger.info("Sending response: %s", RESPONSE)
+    elapsed = time.perf_counter() - started
+    listener.stop()
+    reset_root()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--sample-rate', type=float, default=1.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before_path = os.path.join(tmp, 'before.log')
+        after_path = os.path.join(tmp, 'after.log')
+        before = run_before(before_path, args.messages)
+        after = run_after(after_path, args.messages, args.sample_rate)
+        before_size = os.path.getsize(before_path)
+        after_size = os.path.getsize(after_path)
+
+    print(f"messages:        {args.messages}")
+    print(f"before: {before * 1e6 / args.messages:8.1f} us/message in caller, {before_size / 1024:10.1f} KiB written")
+    print(f"after:  {after * 1e6 / args.messages:8.1f} us/message in caller, {after_size / 1024:10.1f} KiB written")
+    print(f"speedup (caller thread): {before / after:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""Benchmark: end-to-end updates/sec through the webhook server.
+
+Starts fake_bot_api (limits off, so the Bot API is not the bottleneck) and
+``webhook.py`` with a lightweight echo bot as a subprocess. It then POSTs
+synthetic Telegram updates the way Telegram does. Handler work is simulated
+as I/O wait (``--io-ms``, helped by concurrent_updates) plus CPU that holds
+the event loop (``--cpu-ms``, helped only by worker processes).
+
+Reported per configuration:
+  * ingest:     how fast the HTTP endpoint accepts updates;
+  * end-to-end: from the first POST until the last echo reached the Bot API.
+
+Usage:
+    python bench_webhook.py --updates 2000 --workers 1 4 --concurrency 1 16 --io-ms 20 --cpu-ms 2
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+import fake_bot_api
+
+
+async def echo(update, context):
+    from outbound import reply
+
+    await asyncio.sleep(float(os.environ.get('BENCH_IO_MS', '0')) / 1000)
+    busy_until = time.perf_counter() + float(os.environ.get('BENCH_CPU_MS', '0')) / 1000
+    while time.perf_counter() < busy_until:
+        pass
+    await reply(update, context, update.message.text)
+
+
+def build_echo_application(background_jobs: bool = True):
+    """Factory for ``webhook.py``: no models, no DB, one echo handler."""
+    from telegram.ext import Application, MessageHandler, filters
+
+    from config import TELEGRAM_API_BASE_URL, WEBHOOK_SETTINGS
+    from outbound import start_outbound, stop_outbound
+
+    application = (
+        Application.builder()
+        .token('0:bench')
+        .base_url(TELEGRAM_API_BASE_URL)
+        .concurrent_updates(WEBHOOK_SETTINGS['concurrent_updates'])
+        .post_init(start_outbound)
+        .post_shutdown(stop_outbound)
+        .build()
+    )
+    application.add_handler(MessageHandler(filters.TEXT, echo))
+    return application
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def make_update(update_id: int, chat_id: int) -> dict:
+    user = {'id': chat_id, 'is_bot': False, 'first_name': 'Bench'}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': int(time.time()), 'text': f'update {update_id}',
+            'chat': {'id': chat_id, 'type': 'private'}, 'from': user,
+        },
+    }
+
+
+async def post_updates(url: str, updates: int, connections: int) -> float:
+    limits = httpx.Limits(max_connections=connections)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        pending = iter(range(updates))
+
+        async def sender():
+            for i in pending:
+                # Каждый апдейт в свой чат: лимит 1 сообщение/с на чат не влияет на замер
+                response = await client.post(url, json=make_update(i, 1_000_000 + i))
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(sender() for _ in range(connections)))
+        return time.perf_counter() - started
+
+
+async def wait_ready(url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"webhook server at {url} did not start")
+
+
+def run_case(args, workers: int, concurrency: int, database_url: str) -> tuple:
+    api, flood = fake_bot_api.start_server(enforce=False)
+    port = free_port()
+    env = dict(
+        os.environ,
+        TELEGRAM_API_BASE_URL=f'http://127.0.0.1:{api.server_address[1]}/bot',
+        DATABASE_URL=database_url,
+        OUTBOUND_GLOBAL_RATE='1000000',
+        CONCURRENT_UPDATES=str(concurrency),
+        BENCH_IO_MS=str(args.io_ms),
+        BENCH_CPU_MS=str(args.cpu_ms),
+        WEBHOOK_URL='',
+        WEBHOOK_SECRET_TOKEN='',
+    )
+    server = subprocess.Popen(
+        [sys.executable, 'webhook.py', 'bench_webhook:build_echo_application',
+         '--workers', str(workers), '--host', '127.0.0.1', '--port', str(port)],
+        env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=None if args.verbose else subprocess.DEVNULL,
+        stderr=None if args.verbose else subprocess.DEVNULL,
+    )
+    try:
+        base = f'http://127.0.0.1:{port}'
+        asyncio.run(wait_ready(base + '/healthz'))
+        started = time.perf_counter()
+        ingest = asyncio.run(post_updates(base + '/telegram/webhook', args.updates, args.connections))
+        while flood.accepted < args.updates:
+            if time.perf_counter() - started > args.timeout:
+                break
+            time.sleep(0.01)
+        end_to_end = time.perf_counter() - started
+        return args.updates / ingest, flood.accepted / end_to_end, flood.accepted
+    finally:
+        server.terminate()
+        server.wait(30)
+        api.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--connections', type=int, default=40, help='parallel POSTs, like max_connections')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16], help='concurrent_updates per worker')
+    parser.add_argument('--io-ms', type=float, default=20.0)
+    parser.add_argument('--cpu-ms', type=float, default=2.0)
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--verbose', action='store_true', help='show the webhook server logs')
+    args = parser.parse_args()
+
+    print(f"{args.updates} updates, handler: {args.io_ms:g} ms I/O + {args.cpu_ms:g} ms CPU")
+    print(f"{'workers':>7} {'concurrency':>11} {'ingest/s':>9} {'end-to-end/s':>13} {'delivered':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+        for workers in args.workers:
+            for concurrency in args.concurrency:
+                ingest, end_to_end, delivered = run_case(args, workers, concurrency, database_url)
+                print(f"{workers:>7} {concurrency:>11} {ingest:>9.0f} {end_to_end:>13.0f} {delivered:>9}")
+
+
+if __name__ == '__main__':
+    main()
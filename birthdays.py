@@ -0,0 +1,173 @@
+"""Birthday lookups on the indexed ``Employee.birth_md`` (MMDD) key.
+
+``query_window`` answers "birthdays between today and today + N days" with at
+most two range scans: one when the window stays inside the calendar year, two
+(``>= start`` OR ``<= end``) when it wraps over New Year.
+
+``BirthdayIndex`` precomputes the upcoming birthdays once per local day for
+every timezone found in ``Employee.timezone`` and serves "next N",
+"next N days" and "by department" from memory. It is a
+``snapshot.SnapshotIndex`` on ``Employee``, also stale once a local day changes.
+"""
+import logging
+import re
+from datetime import date, datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional
+
+import pytz
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from models import Employee, birth_md_key
+from snapshot import SnapshotIndex
+
+logger = logging.getLogger(__name__)
+
+
+class BirthdayEntry(NamedTuple):
+    days_until: int
+    next_birthday: date
+    employee_id: int
+    name: str
+    surname: str
+    department: str
+    birthday: datetime
+    timezone: str
+
+
+def next_occurrence(birth_md: int, today: date) -> date:
+    """Next date (today included) with the given MMDD; 29.02 falls on 28.02 in non-leap years."""
+    month, day = divmod(birth_md, 100)
+    for year in (today.year, today.year + 1):
+        try:
+            candidate = date(year, month, day)
+        except ValueError:
+            candidate = date(year, 2, 28)
+        if candidate >= today:
+            return candidate
+    raise ValueError(f"Invalid birth_md {birth_md}")
+
+
+def window_condition(start: date, days: int):
+    """SQL condition on birth_md for [start, start + days) with calendar wrap."""
+    if days >= 366:
+        return Employee.birth_md.isnot(None)
+    end = start + timedelta(days=days - 1)
+    start_key, end_key = birth_md_key(start), birth_md_key(end)
+    if end.year == start.year:
+        return Employee.birth_md.between(start_key, end_key)
+    return or_(Employee.birth_md >= start_key, Employee.birth_md <= end_key)
+
+
+def month_condition(month: int):
+    return Employee.birth_md.between(month * 100 + 1, month * 100 + 31)
+
+
+_ALL_TIMEZONES = object()
+
+
+def query_window(session: Session, start: date, days: int, department: Optional[str] = None,
+                 timezone=_ALL_TIMEZONES) -> List[BirthdayEntry]:
+    """Employees whose birthday falls into [start, start + days), soonest first."""
+    conditions = [Employee.is_active == True, window_condition(start, days)]
+    if department:
+        conditions.append(Employee.department == department)
+    if timezone is not _ALL_TIMEZONES:
+        conditions.append(Employee.timezone == timezone if timezone else Employee.timezone.is_(None))
+    rows = session.query(
+        Employee.id, Employee.name, Employee.surname, Employee.department,
+        Employee.birthday, Employee.birth_md, Employee.timezone
+    ).filter(and_(*conditions)).all()
+    entries = []
+    for row in rows:
+        occurrence = next_occurrence(row.birth_md, start)
+        entries.append(BirthdayEntry(
+            (occurrence - start).days, occurrence, row.id, row.name, row.surname,
+            row.department, row.birthday, row.timezone or 'UTC'
+        ))
+    entries.sort()
+    return entries
+
+
+def query_month(session: Session, month: int, department: Optional[str] = None) -> List[BirthdayEntry]:
+    """Birthdays in a calendar month, ordered by day (countdown is relative to today)."""
+    today = date.today()
+    result = []
+    for entry in query_window(session, date(today.year, month, 1), 31, department):
+        if entry.next_birthday.month != month:
+            continue
+        occurrence = next_occurrence(birth_md_key(entry.birthday), today)
+        result.append(entry._replace(days_until=(occurrence - today).days, next_birthday=occurrence))
+    return result
+
+
+class BirthdayIndex(SnapshotIndex):
+    """Upcoming birthdays precomputed per timezone, rebuilt when a local day changes.
+
+    ``horizon_days`` bounds memory: requests reaching past it fall back to
+    ``query_window`` on the database.
+    """
+
+    models = (Employee,)
+
+    def __init__(self, horizon_days: int = 31):
+        super().__init__()
+        self.horizon_days = horizon_days
+        self._entries: List[BirthdayEntry] = []
+        self._built_for: Dict[str, date] = {}
+        self._departments: Dict[str, str] = {}
+
+    def _local_today(self, timezone: str, now: datetime) -> date:
+        try:
+            tz = pytz.timezone(timezone)
+        except pytz.UnknownTimeZoneError:
+            tz = pytz.utc
+        return now.astimezone(tz).date()
+
+    def is_stale(self, now: Optional[datetime] = None) -> bool:
+        if self._stale:
+            return True
+        now = now or datetime.now(pytz.utc)
+        return any(self._local_today(tz, now) != built for tz, built in self._built_for.items())
+
+    def _rebuild(self, session: Session, now: Optional[datetime] = None):
+        now = now or datetime.now(pytz.utc)
+        timezones = [tz for (tz,) in session.query(Employee.timezone).distinct()]
+        entries: List[BirthdayEntry] = []
+        built_for = {}
+        for timezone in timezones:
+            local_today = self._local_today(timezone or 'UTC', now)
+            built_for[timezone or 'UTC'] = local_today
+            entries.extend(query_window(session, local_today, self.horizon_days, timezone=timezone))
+        entries.sort()
+        departments = {dept.lower(): dept for (dept,) in session.query(Employee.department).distinct()}
+        self._entries = entries
+        self._built_for = built_for
+        self._departments = departments
+        logger.info("Birthday index rebuilt: %d entries, %d timezones", len(entries), len(timezones))
+
+    def find_department(self, text: str) -> Optional[str]:
+        words = ' '.join(re.findall(r'\w+', text.lower()))
+        for key, department in self._departments.items():
+            if f" {key} " in f" {words} ":
+                return department
+        return None
+
+    def upcoming(self, session: Session, days: int, department: Optional[str] = None) -> List[BirthdayEntry]:
+        """Birthdays in the next ``days`` days (each employee in their own timezone)."""
+        self.ensure_fresh(session)
+        if days > self.horizon_days:
+            return query_window(session, date.today(), days, department)
+        return [e for e in self._entries
+                if e.days_until < days and (department is None or e.department == department)]
+
+    def next_n(self, session: Session, n: int, department: Optional[str] = None) -> List[BirthdayEntry]:
+        """The next ``n`` birthdays, reaching past the horizon only when needed."""
+        self.ensure_fresh(session)
+        result = [e for e in self._entries if department is None or e.department == department][:n]
+        if len(result) < n:
+            result = query_window(session, date.today(), 366, department)[:n]
+        return result
+
+
+birthday_index = BirthdayIndex()
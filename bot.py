@@ -1,29 +1,34 @@
 import os
+import asyncio
 import logging
 from datetime import datetime, timedelta
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
-from models import init_db, get_session, Employee, Event, Task, TaskStatus, Activity, activity_participants
+from models import init_db, get_session, engine, read_engine, Session, Employee, Event, Task, TaskStatus, Activity, Tag, activity_participants
 from sqlalchemy import or_, and_
 import re
 from typing import List, Dict, Tuple, Optional
+import tracing
+from logging_setup import configure_logging
+from embeddings import attach_encoder, load_zero_shot_classifier
+from intent_router import FALLBACK_CATEGORY, IntentRouter
+from outbound import reply, start_outbound, stop_outbound
+from config import BOT_MODE, SEARCH_SETTINGS, STARTUP_SETTINGS, TELEGRAM_API_BASE_URL, WEBHOOK_SETTINGS
+from employee_search import EmployeeSearch
+from directory import directory
+from text_pipeline import analyze
+from taxonomy import known_labels, tag_filter
+from rendering import MessageBuilder, Template
+from conversation_context import chat_locks
 
 # Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+configure_logging()
 logger = logging.getLogger(__name__)
+# Per-message logs go through a separate logger so they can be sampled; fixed name, because
+# run as a script __name__ is '__main__' and LOG_SAMPLE_RATES would not match
+message_logger = logging.getLogger('bot.messages')
 
-# Initialize the AI models with better configuration
-classifier = pipeline(
-    "zero-shot-classification",
-    model="facebook/bart-large-mnli",
-    device=0 if os.environ.get("CUDA_VISIBLE_DEVICES") else -1
-)
-
-# Define categories for classification with examples and synonyms
+# Categories this bot answers (models are clients of inference_server when INFERENCE_SOCKET is set)
 categories = [
     "поиск сотрудника",
     "информация о мероприятии",
@@ -31,356 +36,34 @@ categories = [
     "социальные активности",
     "приветствие",
     "общая информация",
-    "неопределенный запрос"
+    FALLBACK_CATEGORY
 ]
 
-# Define example queries and synonyms for each category with improved patterns
-category_patterns = {
-    "приветствие": {
-        "keywords": [
-            'привет', 'здравствуй', 'добрый', 'начать', 'помощь', 'хеллоу',
-            'хай', 'здорово', 'приветствую', 'доброе', 'добрый'
-        ],
-        "synonyms": [
-            'здравствуйте', 'доброе утро', 'добрый день', 'добрый вечер',
-            'хеллоу', 'хай', 'приветствую', 'здорово', 'добро пожаловать',
-            'рад видеть', 'как дела', 'как жизнь'
-        ],
-        "examples": [
-            "привет",
-            "здравствуй",
-            "добрый день",
-            "начать",
-            "помощь",
-            "как пользоваться",
-            "что умеешь",
-            "как дела",
-            "доброе утро",
-            "добрый вечер",
-            "рад тебя видеть",
-            "как жизнь"
-        ]
-    },
-    "поиск сотрудника": {
-        "keywords": [
-            'отдел', 'отделе', 'it', 'hr', 'sales', 'marketing', 'проект', 'project',
-            'разработка', 'разработчик', 'менеджер', 'директор', 'руководитель',
-            'специалист', 'инженер', 'аналитик', 'дизайнер', 'тестировщик',
-            'кто', 'найти', 'показать', 'список', 'сотрудники', 'коллеги',
-            'работает', 'трудится', 'занимается', 'отвечает', 'знает',
-            'умеет', 'может', 'способен', 'опыт', 'навыки', 'умения'
-        ],
-        "synonyms": [
-            'найти', 'показать', 'кто', 'какие', 'список', 'сотрудники', 'работники',
-            'коллеги', 'люди', 'команда', 'группа', 'отдел', 'подразделение',
-            'искать', 'поиск', 'найти', 'показать', 'вывести', 'отобразить',
-            'работает', 'трудится', 'занимается', 'отвечает', 'знает',
-            'умеет', 'может', 'способен', 'опыт', 'навыки', 'умения',
-            'специалист', 'эксперт', 'профессионал', 'мастер', 'гуру'
-        ],
-        "examples": [
-            "кто работает в отделе",
-            "найти сотрудника",
-            "кто из отдела",
-            "покажи сотрудников",
-            "кто работает над проектом",
-            "список сотрудников",
-            "какие люди работают",
-            "кто в команде",
-            "покажи команду разработки",
-            "кто отвечает за проект",
-            "найти специалиста по",
-            "кто руководит отделом",
-            "кто занимается разработкой",
-            "покажи всех сотрудников отдела",
-            "кто знает python",
-            "кто умеет работать с базами данных",
-            "найти эксперта по тестированию",
-            "кто может помочь с проектом",
-            "кто имеет опыт в маркетинге",
-            "покажи специалистов по дизайну"
-        ]
-    },
-    "информация о мероприятии": {
-        "keywords": [
-            'мероприятие', 'мероприятия', 'корпоратив', 'тренинг', 'встреча',
-            'неделе', 'недели', 'месяц', 'месяца', 'день', 'дня', 'дата',
-            'время', 'расписание', 'план', 'календарь', 'событие', 'события',
-            'день рождения', 'дни рождения', 'праздник', 'праздники',
-            'конференция', 'семинар', 'вебинар', 'презентация', 'доклад',
-            'выступление', 'обучение', 'курс', 'лекция', 'мастер-класс'
-        ],
-        "synonyms": [
-            'когда', 'расписание', 'план', 'календарь', 'дата', 'время',
-            'запланировано', 'назначено', 'будет', 'пройдет', 'состоится',
-            'организовано', 'подготовлено', 'устроено', 'праздновать',
-            'отмечать', 'поздравлять', 'чествовать', 'проводить',
-            'организовывать', 'планировать', 'готовить', 'устраивать'
-        ],
-        "examples": [
-            "какие мероприятия",
-            "когда корпоратив",
-            "расписание мероприятий",
-            "какие встречи",
-            "когда тренинг",
-            "что запланировано",
-            "какие события",
-            "что будет на неделе",
-            "какие встречи запланированы",
-            "расписание на месяц",
-            "когда следующее мероприятие",
-            "что готовится в отделе",
-            "когда день рождения",
-            "какие праздники",
-            "когда конференция",
-            "расписание тренингов",
-            "какие семинары на этой неделе",
-            "когда мастер-класс",
-            "что запланировано на месяц",
-            "какие мероприятия в офисе"
-        ]
-    },
-    "информация о задаче": {
-        "keywords": [
-            'задача', 'задачи', 'дедлайн', 'проект', 'работа', 'поручение',
-            'обязанность', 'функция', 'роль', 'ответственность', 'контроль',
-            'проверка', 'тестирование', 'разработка', 'внедрение',
-            'срок', 'статус', 'прогресс', 'выполнение', 'todo', 'in progress', 'done',
-            'блокер', 'проблема', 'ошибка', 'баг', 'фича', 'улучшение',
-            'оптимизация', 'рефакторинг', 'документация', 'отчет'
-        ],
-        "synonyms": [
-            'сделать', 'выполнить', 'срок', 'статус', 'прогресс', 'ход',
-            'продвижение', 'этап', 'стадия', 'фаза', 'процесс', 'работа',
-            'дело', 'поручение', 'обязанность', 'контролировать',
-            'проверять', 'отслеживать', 'мониторить', 'в работе',
-            'текущие', 'к выполнению', 'сделано', 'выполнено',
-            'заблокировано', 'проблема', 'ошибка', 'исправить',
-            'улучшить', 'оптимизировать', 'переписать', 'документировать'
-        ],
-        "examples": [
-            "какие задачи",
-            "что нужно сделать",
-            "какие дедлайны",
-            "статус задачи",
-            "когда сдать",
-            "что в работе",
-            "текущие задачи",
-            "мои поручения",
-            "что на контроле",
-            "какие проекты в работе",
-            "статус разработки",
-            "ход выполнения",
-            "что нужно сделать до",
-            "какие задачи у",
-            "покажи задачи к выполнению",
-            "какие задачи в работе",
-            "покажи выполненные задачи",
-            "есть ли блокеры",
-            "какие проблемы",
-            "статус проекта"
-        ]
-    },
-    "социальные активности": {
-        "keywords": [
-            'обед', 'игра', 'игры', 'встреча', 'встречи', 'общение',
-            'команда', 'командный', 'вместе', 'совместно', 'активность',
-            'активности', 'досуг', 'отдых', 'развлечение', 'развлечения',
-            'йога', 'спорт', 'фитнес', 'танцы', 'музыка', 'кино',
-            'театр', 'концерт', 'выставка', 'музей', 'парк', 'прогулка',
-            'вечеринка', 'праздник', 'корпоратив', 'тимбилдинг'
-        ],
-        "synonyms": [
-            'поиграть', 'пообедать', 'встретиться', 'познакомиться',
-            'пообщаться', 'провести время', 'отдохнуть', 'развлечься',
-            'командная игра', 'совместный обед', 'групповая активность',
-            'заняться спортом', 'позаниматься йогой', 'потанцевать',
-            'сходить в кино', 'посетить выставку', 'погулять в парке',
-            'отпраздновать', 'провести тимбилдинг', 'организовать вечеринку'
-        ],
-        "examples": [
-            "кто хочет поиграть",
-            "кто идет на обед",
-            "кто хочет встретиться",
-            "найти партнера для игры",
-            "кто свободен на обед",
-            "кто хочет пообщаться",
-            "найти компанию для",
-            "кто хочет присоединиться",
-            "кто готов поиграть",
-            "кто хочет пообедать вместе",
-            "кто занимается йогой",
-            "кто хочет в кино",
-            "кто идет на выставку",
-            "кто хочет в парк",
-            "кто готов к тимбилдингу",
-            "кто хочет на вечеринку",
-            "кто занимается спортом",
-            "кто танцует",
-            "кто любит музыку",
-            "кто хочет в театр"
-        ]
-    },
-    "общая информация": {
-        "keywords": [
-            'что', 'как', 'где', 'когда', 'почему', 'зачем',
-            'информация', 'справка', 'помощь', 'подсказка',
-            'правила', 'политика', 'процедуры', 'процессы',
-            'структура', 'организация', 'компания', 'офис',
-            'рабочее место', 'оборудование', 'ресурсы',
-            'документы', 'файлы', 'база знаний', 'wiki'
-        ],
-        "synonyms": [
-            'расскажи', 'объясни', 'покажи', 'найди', 'дай',
-            'информацию', 'справку', 'помощь', 'подсказку',
-            'правила', 'политику', 'процедуры', 'процессы',
-            'структуру', 'организацию', 'компанию', 'офис',
-            'рабочее место', 'оборудование', 'ресурсы',
-            'документы', 'файлы', 'базу знаний', 'wiki'
-        ],
-        "examples": [
-            "как работает",
-            "где находится",
-            "когда открыто",
-            "что нужно знать",
-            "какие правила",
-            "как пользоваться",
-            "где найти",
-            "как получить доступ",
-            "что делать если",
-            "как решить проблему",
-            "где посмотреть",
-            "как узнать",
-            "что нового",
-            "какие изменения",
-            "как обновить",
-            "где документация",
-            "как настроить",
-            "что требуется",
-            "как начать",
-            "где справка"
-        ]
-    }
-}
+# Intent cascade shared with telegram_bot: rules -> embeddings -> NLI (BART is loaded on first use).
+# The encoder is attached in the background after startup (post_init), not at import time.
+router = IntentRouter(categories, nli_factory=load_zero_shot_classifier)
+employee_search = EmployeeSearch()
 
-def preprocess_query(query: str) -> str:
-    """Preprocess the query for better classification."""
-    # Convert to lowercase
-    query = query.lower()
-    
-    # Remove punctuation but keep important symbols
-    query = re.sub(r'[^\w\s\-]', ' ', query)
-    
-    # Remove extra spaces
-    query = ' '.join(query.split())
-    
-    # Remove common stop words
-    stop_words = {'и', 'в', 'на', 'с', 'по', 'для', 'не', 'ни', 'но', 'а', 'или', 'что', 'как', 'когда', 'где', 'почему', 'зачем'}
-    words = query.split()
-    query = ' '.join(word for word in words if word not in stop_words)
-    
-    return query
-
-def calculate_category_score(query: str, category: str) -> float:
-    """Calculate a score for how well the query matches a category."""
-    score = 0.0
-    patterns = category_patterns[category]
-    
-    # Проверяем наличие ключевых слов
-    for keyword in patterns["keywords"]:
-        if keyword in query:
-            score += 0.4
-        elif any(word.startswith(keyword) or keyword.startswith(word) for word in query.split()):
-            score += 0.2
-    
-    # Проверяем синонимы
-    for synonym in patterns["synonyms"]:
-        if synonym in query:
-            score += 0.3
-        elif any(word.startswith(synonym) or synonym.startswith(word) for word in query.split()):
-            score += 0.15
-    
-    # Проверяем примеры
-    for example in patterns["examples"]:
-        if example in query:
-            score += 0.6
-        elif any(word in example for word in query.split()):
-            score += 0.3
-    
-    # Дополнительные проверки для поиска сотрудников
-    if category == "поиск сотрудника":
-        if any(word in query for word in ['знает', 'умеет', 'может', 'навыки', 'опыт']):
-            score += 1.0
-        if any(word in query for word in ['python', 'java', 'javascript', 'react', 'django']):
-            score += 1.0
-        if any(word in query for word in ['кто', 'найти', 'показать', 'список']):
-            score += 0.5
-    
-    # Дополнительные проверки для мероприятий
-    if category == "информация о мероприятии":
-        if any(word in query for word in ['неделе', 'недели', 'сегодня', 'завтра']):
-            score += 1.0
-        if any(word in query for word in ['мероприятия', 'события', 'встречи']):
-            score += 0.5
-    
-    # Дополнительные проверки для задач
-    if category == "информация о задаче":
-        if any(word in query for word in ['задача', 'задачи', 'задачу', 'задач']):
-            score += 0.5
-        if any(word in query for word in ['сделать', 'выполнить', 'сделано', 'выполнено']):
-            score += 0.5
-        if any(word in query for word in ['в работе', 'текущие', 'к выполнению']):
-            score += 0.5
-        if any(word in query for word in ['todo', 'in progress', 'done']):
-            score += 0.5
-    
-    # Дополнительные проверки для социальных активностей
-    if category == "социальные активности":
-        if any(word in query for word in ['игра', 'игры', 'поиграть', 'настольные']):
-            score += 0.5
-        if any(word in query for word in ['обед', 'пообедать', 'вместе']):
-            score += 0.5
-        if any(word in query for word in ['активность', 'активности']):
-            score += 0.5
-        if any(word in query for word in ['йога', 'спорт', 'фитнес', 'танцы']):
-            score += 0.5
-        if any(word in query for word in ['кино', 'театр', 'концерт', 'выставка']):
-            score += 0.5
-    
-    return score
+# List items (rendering.Template): "?" drops the line when the value is empty.
+# Answers are cut at Telegram's message limit with an "…и ещё N" line.
+EMPLOYEE_ITEM = Template(
+    "• {name} - {position}\n"
+    "  🛠️ Навыки: {skills:?}\n"
+    "  🎯 Интересы: {interests:?}"
+)
+TASK_ITEM = Template(
+    "• {title}\n"
+    "  {description:?300}\n"
+    "  📅 Срок: {due}\n"
+    "  👤 Исполнитель: {assignee}\n"
+    "  🏷️ Теги: {tags:?}",
+    due=lambda task: task.due_date.strftime('%d.%m.%Y') if task.due_date else 'не указан',
+    assignee=lambda task: task.assignee.name if task.assignee else 'не назначен',
+)
 
 def classify_query(query: str) -> Tuple[str, float]:
     """Classify the user query into one of the predefined categories with confidence score."""
-    query = preprocess_query(query)
-    logger.info(f"Processing query: {query}")
-    
-    # Calculate scores for each category
-    category_scores = {
-        category: calculate_category_score(query, category)
-        for category in categories if category != "неопределенный запрос"
-    }
-    
-    # Get the category with the highest score
-    max_score_category = max(category_scores.items(), key=lambda x: x[1])
-    
-    # If the highest score is too low, use the AI model
-    if max_score_category[1] < 0.3:
-        logger.info("Using AI model for classification")
-        result = classifier(query, categories)
-        max_score_index = result['scores'].index(max(result['scores']))
-        category = result['labels'][max_score_index]
-        confidence = result['scores'][max_score_index]
-        logger.info(f"AI model classified as: {category} with confidence {confidence:.2f}")
-    else:
-        category = max_score_category[0]
-        confidence = max_score_category[1]
-        logger.info(f"Rule-based classification: {category} with confidence {confidence:.2f}")
-    
-    # If confidence is too low, return "неопределенный запрос"
-    if confidence < 0.2:
-        return "неопределенный запрос", confidence
-    
-    return category, confidence
+    return router.classify(query)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send a message when the command /start is issued."""
@@ -421,152 +104,20 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(help_text)
 
 def search_employees(query: str) -> str:
-    """Search for employees based on the query."""
+    """Search for employees: lexical and skill candidates reranked by embeddings (employee_search.py)."""
     session = get_session()
     query_lower = query.lower()
-    logger.info(f"Searching employees with query: {query_lower}")
+    message_logger.debug("Searching employees with query: %s", query_lower)
     
     try:
-        # Определяем ключевые слова для поиска (русские и английские)
-        role_keywords = {
-            'разработка': [
-                'разработка', 'разработчик', 'программист', 'код', 'кодить',
-                'developer', 'programmer', 'coder', 'software', 'engineer'
-            ],
-            'руководство': [
-                'руководитель', 'директор', 'менеджер', 'глава', 'начальник',
-                'manager', 'director', 'head', 'lead', 'chief', 'senior'
-            ],
-            'тестирование': [
-                'тестирование', 'тестировщик', 'qa', 'контроль качества',
-                'tester', 'qa engineer', 'quality', 'testing'
-            ],
-            'дизайн': [
-                'дизайн', 'дизайнер', 'ui', 'ux', 'интерфейс',
-                'designer', 'ui/ux', 'interface', 'frontend'
-            ],
-            'аналитика': [
-                'аналитик', 'анализ', 'исследование', 'исследователь',
-                'analyst', 'researcher', 'research', 'analysis'
-            ]
-        }
-        
-        # Определяем отделы (русские и английские названия)
-        departments = {
-            'it': ['it', 'айти', 'информационные технологии', 'разработка', 'development'],
-            'hr': ['hr', 'эйчар', 'кадры', 'персонал', 'human resources'],
-            'sales': ['sales', 'продажи', 'сейлз', 'коммерция'],
-            'marketing': ['marketing', 'маркетинг', 'реклама', 'продвижение']
-        }
-        
-        # Извлекаем поисковые термины
-        search_terms = []
-        search_roles = []
-        search_departments = []
-        search_skills = []
-        search_interests = []
-        
-        # Проверяем навыки (расширенный список)
-        tech_skills = {
-            'python': ['python', 'питон'],
-            'java': ['java', 'джава'],
-            'javascript': ['javascript', 'js', 'джаваскрипт'],
-            'react': ['react', 'реакт'],
-            'django': ['django', 'джанго'],
-            'docker': ['docker', 'докер'],
-            'postgresql': ['postgresql', 'postgres', 'постгрес'],
-            'mongodb': ['mongodb', 'монго'],
-            'selenium': ['selenium', 'селениум'],
-            'pytest': ['pytest', 'питест'],
-            'postman': ['postman', 'постман'],
-            'jira': ['jira', 'джира'],
-            'agile': ['agile', 'аджайл'],
-            'scrum': ['scrum', 'скрам'],
-            'fastapi': ['fastapi', 'фастапи']
-        }
-        
-        # Проверяем навыки
-        for skill, keywords in tech_skills.items():
-            if any(keyword in query_lower for keyword in keywords):
-                search_skills.append(skill)
-                logger.info(f"Found skill: {skill}")
-        
-        # Проверяем интересы
-        if 'йога' in query_lower:
-            search_interests.append('йога')
-        if 'игра' in query_lower or 'игры' in query_lower:
-            search_interests.append('настольные игры')
-        if 'путешествия' in query_lower:
-            search_interests.append('путешествия')
-        if 'танцы' in query_lower:
-            search_interests.append('танцы')
-        if 'теннис' in query_lower:
-            search_interests.append('теннис')
-        
-        # Проверяем роли
-        for role, keywords in role_keywords.items():
-            if any(keyword in query_lower for keyword in keywords):
-                search_roles.append(role)
-                logger.info(f"Found role: {role}")
-        
-        # Проверяем отделы
-        for dept, keywords in departments.items():
-            if any(keyword in query_lower for keyword in keywords):
-                search_departments.append(dept)
-                logger.info(f"Found department: {dept}")
-        
-        # Формируем запрос
-        query_filters = []
-        
-        # Если найдены навыки
-        if search_skills:
-            skill_conditions = []
-            for skill in search_skills:
-                skill_conditions.append(Employee.skills.ilike(f'%{skill}%'))
-            query_filters.append(or_(*skill_conditions))
-        
-        # Если найдены интересы
-        if search_interests:
-            interest_conditions = []
-            for interest in search_interests:
-                interest_conditions.append(Employee.interests.ilike(f'%{interest}%'))
-            query_filters.append(or_(*interest_conditions))
-        
-        # Если найдены роли
-        if search_roles:
-            role_conditions = []
-            for role in search_roles:
-                role_keywords_list = role_keywords[role]
-                role_conditions.append(or_(
-                    *[Employee.position.ilike(f'%{keyword}%') for keyword in role_keywords_list]
-                ))
-            query_filters.append(or_(*role_conditions))
-        
-        # Если найдены отделы
-        if search_departments:
-            dept_conditions = []
-            for dept in search_departments:
-                dept_keywords_list = departments[dept]
-                dept_conditions.append(or_(
-                    *[Employee.department.ilike(f'%{keyword}%') for keyword in dept_keywords_list]
-                ))
-            query_filters.append(or_(*dept_conditions))
-        
+        # Записи берутся из снимка справочника (directory.py), ORM-объекты сотрудников не создаются
+        directory.ensure_fresh(session)
         # Если запрос содержит "все" или "всех", показываем всех сотрудников
         if 'все' in query_lower or 'всех' in query_lower:
-            employees = session.query(Employee).all()
-        # Если нет конкретных критериев, ищем по всему тексту
-        elif not query_filters:
-            employees = session.query(Employee).filter(or_(
-                Employee.name.ilike(f'%{query}%'),
-                Employee.position.ilike(f'%{query}%'),
-                Employee.department.ilike(f'%{query}%'),
-                Employee.interests.ilike(f'%{query}%'),
-                Employee.skills.ilike(f'%{query}%')
-            )).all()
+            employees = directory.entries()
         else:
-            # Выполняем поиск с фильтрами
-            employees = session.query(Employee).filter(and_(*query_filters)).all()
+            matches = employee_search.search(session, query, limit=SEARCH_SETTINGS['max_results'] * 4)
+            employees = directory.lookup(match.employee_id for match in matches)
         
         if employees:
             # Группируем сотрудников по отделам
@@ -576,18 +127,12 @@ def search_employees(query: str) -> str:
                     dept_employees[emp.department] = []
                 dept_employees[emp.department].append(emp)
             
-            # Формируем ответ
-            response = "Найдены следующие сотрудники:\n\n"
+            # Формируем ответ (строки после лимита сообщения не форматируются)
+            message = MessageBuilder()
+            message.add("Найдены следующие сотрудники:", counted=False)
             for dept, emps in dept_employees.items():
-                response += f"📌 {dept}:\n"
-                for emp in emps:
-                    response += f"• {emp.name} - {emp.position}\n"
-                    if emp.skills:
-                        response += f"  🛠️ Навыки: {emp.skills}\n"
-                    if emp.interests:
-                        response += f"  🎯 Интересы: {emp.interests}\n"
-                response += "\n"
-            return response
+                message.add_rows(emps, EMPLOYEE_ITEM, separator="\n", heading=f"📌 {dept}:")
+            return message.text()
         
         return "Сотрудники не найдены. Попробуйте уточнить критерии поиска."
     finally:
@@ -597,7 +142,7 @@ def search_events(query: str) -> str:
     """Search for events based on the query."""
     session = get_session()
     query_lower = query.lower()
-    logger.info(f"Searching events with query: {query_lower}")
+    message_logger.debug("Searching events with query: %s", query_lower)
     
     try:
         from datetime import datetime, timedelta
@@ -609,7 +154,7 @@ def search_events(query: str) -> str:
         
         # Проверяем, есть ли в запросе упоминание сотрудника
         employee_name = None
-        for word in query_lower.split():
+        for word in analyze(query).words:
             if len(word) > 3:  # Игнорируем короткие слова
                 employee = session.query(Employee).filter(
                     Employee.name.ilike(f'%{word}%')
@@ -682,12 +227,12 @@ def search_tasks(query: str) -> str:
     """Search for tasks based on the query."""
     session = get_session()
     query_lower = query.lower()
-    logger.info(f"Searching tasks with query: {query_lower}")
+    message_logger.debug("Searching tasks with query: %s", query_lower)
     
     try:
         # Проверяем, есть ли в запросе упоминание сотрудника
         employee_name = None
-        for word in query_lower.split():
+        for word in analyze(query).words:
             if len(word) > 3:  # Игнорируем короткие слова
                 employee = session.query(Employee).filter(
                     Employee.name.ilike(f'%{word}%')
@@ -723,13 +268,13 @@ def search_tasks(query: str) -> str:
                 Task.status == TaskStatus.BLOCKED
             ).all()
         else:
-            # Поиск по названию, тегам или статусу
+            # Поиск по названию или тегам (теги - точное совпадение через task_tags)
+            tags = known_labels(session, Tag, analyze(query).ngrams)
             tasks = session.query(Task).filter(
                 or_(
                     Task.title.ilike(f'%{query}%'),
-                    Task.tags.ilike(f'%{query}%'),
-                    Task.status.ilike(f'%{query}%')
-                )
+                    tag_filter(*tags)
+                ) if tags else Task.title.ilike(f'%{query}%')
             ).all()
         
         if tasks:
@@ -740,20 +285,12 @@ def search_tasks(query: str) -> str:
                     status_tasks[task.status] = []
                 status_tasks[task.status].append(task)
             
-            # Формируем ответ
-            response = "Найдены следующие задачи:\n\n"
+            # Формируем ответ (строки после лимита сообщения не форматируются)
+            message = MessageBuilder()
+            message.add("Найдены следующие задачи:", counted=False)
             for status, tsk in status_tasks.items():
-                response += f"📌 {status.value}:\n"
-                for task in tsk:
-                    response += f"• {task.title}\n"
-                    if task.description:
-                        response += f"  {task.description}\n"
-                    response += f"  📅 Срок: {task.deadline}\n"
-                    response += f"  👤 Исполнитель: {task.assignee.name}\n"
-                    if task.tags:
-                        response += f"  🏷️ Теги: {task.tags}\n"
-                    response += "\n"
-            return response
+                message.add_rows(tsk, TASK_ITEM, heading=f"📌 {status.value}:")
+            return message.text()
         
         return "Задачи не найдены."
     finally:
@@ -763,7 +300,7 @@ def search_activities(query: str) -> str:
     """Search for social activities based on the query."""
     session = get_session()
     query_lower = query.lower()
-    logger.info(f"Searching activities with query: {query_lower}")
+    message_logger.debug("Searching activities with query: %s", query_lower)
     
     try:
         from datetime import datetime, timedelta
@@ -775,7 +312,7 @@ def search_activities(query: str) -> str:
         
         # Проверяем, есть ли в запросе упоминание сотрудника
         employee_name = None
-        for word in query_lower.split():
+        for word in analyze(query).words:
             if len(word) > 3:  # Игнорируем короткие слова
                 employee = session.query(Employee).filter(
                     Employee.name.ilike(f'%{word}%')
@@ -914,12 +451,13 @@ def search_general_info(query: str) -> str:
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle user messages and respond accordingly."""
-    query = update.message.text
-    logger.info(f"Received message: {query}")
-    
-    category, confidence = classify_query(query)
-    logger.info(f"Classified as: {category} with confidence {confidence:.2f}")
-    
+    # При concurrent_updates сообщения одного чата все равно обрабатываются по очереди
+    async with chat_locks.hold(update.effective_chat.id):
+        with tracing.request('bot.handle_message'):
+            await _handle_message(update, context)
+
+def answer_query(query: str, category: str) -> str:
+    """Build the reply for a classified query."""
     if category == "неопределенный запрос":
         # Пробуем найти ответ в общей информации
         response = search_general_info(query)
@@ -946,25 +484,72 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         response = search_general_info(query)
     else:
         response = "Извините, я не совсем понял ваш вопрос. Попробуйте переформулировать или используйте /help для получения подсказок."
+    return response
+
+async def _handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.message.text
+    message_logger.info("Received message: %s", query)
     
-    logger.info(f"Sending response: {response}")
-    await update.message.reply_text(response)
+    # Classification and search are blocking (BART, DB), so they run in a worker thread
+    # and concurrent updates are not serialized behind them
+    with tracing.span('classify'):
+        category, confidence = await asyncio.to_thread(classify_query, query)
+    message_logger.info("Classified as: %s with confidence %.2f", category, confidence)
+    
+    with tracing.span('search'):
+        response = await asyncio.to_thread(answer_query, query, category)
+    
+    message_logger.info("Sending response: %s", response)  # обрезается до LOG_MAX_PAYLOAD
+    with tracing.span('reply'):
+        await reply(update, context, response)
 
-def main():
-    """Start the bot."""
-    # Initialize database
-    init_db()
+async def post_init(application: Application):
+    await start_outbound(application)
+    # Until the model is loaded, queries are answered by the rules and the lexical search
+    if STARTUP_SETTINGS['load_models']:
+        application.bot_data['model_loading'] = asyncio.create_task(
+            asyncio.to_thread(attach_encoder, [router, employee_search])
+        )
+
+def build_application(background_jobs: bool = True) -> Application:
+    """Create the Application with its handlers (shared by polling and webhook mode)."""
+    # Tracing (no-op unless TRACING_ENABLED=true), once per process
+    tracing.instrument_engine(engine, Session)
+    if read_engine is not None:
+        tracing.instrument_engine(read_engine)
     
-    # Create the Application
-    application = Application.builder().token("8181926764:AAE0RsZomH3bdhLnGqatSi5W7HH3fwjiEQQ").build()
+    builder = (
+        Application.builder()
+        .token("8181926764:AAE0RsZomH3bdhLnGqatSi5W7HH3fwjiEQQ")
+        .concurrent_updates(WEBHOOK_SETTINGS['concurrent_updates'])
+        .post_init(post_init)
+        .post_shutdown(stop_outbound)
+    )
+    if TELEGRAM_API_BASE_URL:
+        builder = builder.base_url(TELEGRAM_API_BASE_URL)
+    application = builder.build()
+    application.bot_data['background_jobs'] = background_jobs
 
     # Add handlers
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    return application
 
+def main():
+    """Start the bot."""
+    # Initialize database
+    init_db()
+    
+    # /metrics (no-op unless TRACING_ENABLED=true)
+    tracing.start_metrics_server()
+    
     # Start the Bot
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if BOT_MODE == 'webhook':
+        from webhook import run_webhook
+        run_webhook(build_application)
+    else:
+        build_application().run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == '__main__':
     main() 
@@ -0,0 +1,42 @@
+"""Command-line plumbing shared by the maintenance and benchmark scripts.
+
+Most modules end with a ``main()`` for operations and measurements
+(``--rebuild``, ``--bench``, ``--load`` ...). The common part lives here:
+
+  * ``parser(doc)`` - an ArgumentParser described by the first line of the
+    module docstring, with ``--database-url`` and, given its help text,
+    ``--bench``;
+  * ``connect(args)`` - INFO logging and the engine for ``--database-url``
+    (``models.engine`` when it is not given) with the schema created.
+"""
+import argparse
+import logging
+from typing import Optional
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+def parser(doc: str, bench: Optional[str] = None) -> argparse.ArgumentParser:
+    """ArgumentParser with ``--database-url`` and, when ``bench`` (its help) is given, ``--bench``."""
+    parser = argparse.ArgumentParser(description=doc.splitlines()[0])
+    parser.add_argument('--database-url', default=None, help='defaults to DATABASE_URL')
+    if bench is not None:
+        parser.add_argument('--bench', action='store_true', help=bench)
+    return parser
+
+
+def setup_logging():
+    logging.basicConfig(format=LOG_FORMAT, level=logging.INFO)
+
+
+def connect(args: argparse.Namespace, init: bool = True):
+    """INFO logging, then the engine for ``args.database_url``; ``init=False`` skips ``init_db``."""
+    setup_logging()
+    from sqlalchemy import create_engine
+
+    from models import engine, init_db
+
+    bind = create_engine(args.database_url) if args.database_url else engine
+    if init:
+        init_db(bind)
+    return bind
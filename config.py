@@ -6,18 +6,58 @@ load_dotenv()
 
 # Telegram Bot Configuration
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN', '8181926764:AAE0RsZomH3bdhLnGqatSi5W7HH3fwjiEQQ')  # Using the token from the error message
+# Альтернативный адрес Bot API (локальный сервер или fake_bot_api.py для нагрузочных тестов)
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL')
 
 # Database Configuration
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///corporate_bot.db')
+READ_DATABASE_URL = os.getenv('READ_DATABASE_URL')  # optional read replica for searches (replica.py)
 
 # AI Model Configuration
 MODEL_NAME = os.getenv('MODEL_NAME', 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
+NLI_MODEL_NAME = os.getenv('NLI_MODEL_NAME', 'facebook/bart-large-mnli')
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch')  # torch | onnx
+ONNX_SETTINGS = {
+    'model_dir': os.getenv('ONNX_MODEL_DIR', os.path.join('onnx_models', MODEL_NAME.split('/')[-1])),
+    'quantized': os.getenv('ONNX_QUANTIZED', 'True').lower() == 'true',
+    'threads': int(os.getenv('ONNX_THREADS', '0')),  # 0 - решает ONNX Runtime
+}
+
+# Shared inference server (inference_server.py); empty - load models in-process
+INFERENCE_SOCKET = os.getenv('INFERENCE_SOCKET', '')
+INFERENCE_SETTINGS = {
+    'max_batch_size': int(os.getenv('INFERENCE_MAX_BATCH_SIZE', '64')),
+    'max_wait_ms': float(os.getenv('INFERENCE_MAX_WAIT_MS', '5')),
+    'shm_threshold': 64 * 1024,  # ответы больше этого размера передаются через shared memory
+    'timeout': float(os.getenv('INFERENCE_TIMEOUT', '30')),
+}
 
 # Application Settings
-DEBUG = os.getenv('DEBUG', 'True').lower() == 'true'
+DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
 TIMEZONE = os.getenv('TIMEZONE', 'UTC')
 DEFAULT_LANGUAGE = os.getenv('DEFAULT_LANGUAGE', 'ru')
 
+# Startup: модели грузятся в фоне после старта; startup_profile.py проверяет бюджет времени импорта
+STARTUP_SETTINGS = {
+    'load_models': os.getenv('LOAD_MODELS', 'True').lower() == 'true',
+    'import_budget_seconds': float(os.getenv('STARTUP_IMPORT_BUDGET', '3.0')),
+}
+# Подготовленный каталог данных NLTK (python download_nltk_data.py); во время работы ничего не скачивается
+NLTK_DATA_DIR = os.getenv('NLTK_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nltk_data'))
+
+# Observability Settings
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'False').lower() == 'true'
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+
+# Logging Settings
+LOGGING_SETTINGS = {
+    'format': os.getenv('LOG_FORMAT', 'text'),  # text | json
+    'async': os.getenv('LOG_ASYNC', 'True').lower() == 'true',
+    'max_payload': int(os.getenv('LOG_MAX_PAYLOAD', '300')),
+    # logger=rate pairs for per-message logs, e.g. "telegram_bot.messages=0.1"
+    'sample_rates': os.getenv('LOG_SAMPLE_RATES', 'telegram_bot.messages=1.0,bot.messages=1.0,intent_router.messages=1.0'),
+}
+
 # Security Settings
 ADMIN_USER_IDS = [int(id.strip()) for id in os.getenv('ADMIN_USER_IDS', '').split(',') if id.strip()]
 
@@ -72,11 +112,100 @@ ERROR_MESSAGES = {
     'model_error': "Произошла ошибка при обработке запроса.",
 }
 
+# Read replica: reads fall back to the primary while the heartbeat lag exceeds max_lag_seconds.
+# The measured lag includes up to one check_interval, so keep max_lag_seconds above it.
+REPLICA_SETTINGS = {
+    'max_lag_seconds': float(os.getenv('REPLICA_MAX_LAG', '5')),
+    'check_interval': float(os.getenv('REPLICA_CHECK_INTERVAL', '1')),
+}
+
+# Async data access for the Telegram handlers (async_repository.py): aiosqlite for SQLite, asyncpg for Postgres.
+# auto: only for Postgres. aiosqlite runs every connection in its own thread and is slower than the thread path,
+# so SQLite uses it only with ASYNC_DB_ENABLED=true. Without the driver the handlers use worker threads.
+ASYNC_DB_SETTINGS = {
+    'enabled': os.getenv('ASYNC_DB_ENABLED', 'auto').lower(),  # auto | true | false
+    'pool_size': int(os.getenv('ASYNC_DB_POOL_SIZE', '20')),
+}
+
+# Archival (archive.py): events and activities that ended more than event_days ago and tasks done more than
+# task_days ago move to *_archive tables, in batches, every interval_seconds
+ARCHIVE_SETTINGS = {
+    'enabled': os.getenv('ARCHIVE_ENABLED', 'True').lower() == 'true',
+    'event_days': int(os.getenv('ARCHIVE_EVENT_DAYS', '30')),
+    'task_days': int(os.getenv('ARCHIVE_TASK_DAYS', '90')),
+    'batch_size': int(os.getenv('ARCHIVE_BATCH_SIZE', '1000')),
+    'interval_seconds': int(os.getenv('ARCHIVE_INTERVAL', '3600')),
+}
+
 # Search Settings
 SEARCH_SETTINGS = {
     'max_results': 5,
     'min_confidence': 0.5,
-    'fuzzy_threshold': 0.8,
+    'fuzzy_threshold': 0.8,  # 1 - правки / длина слова для исправления опечатки (fuzzy_index.py)
+    'fuzzy_max_distance': 2,
+    'fanout_workers': int(os.getenv('SEARCH_FANOUT_WORKERS', '8')),  # потоки для параллельного запасного поиска
+    'fanout_timeout': float(os.getenv('SEARCH_FANOUT_TIMEOUT', '2.0')),  # дедлайн одного источника, секунды
+}
+
+# Unified Search Index (search_index.py): score = bm25_weight * BM25 / max(BM25) + embedding_weight * cosine
+SEARCH_INDEX_SETTINGS = {
+    'bm25_k1': 1.2,
+    'bm25_b': 0.75,
+    'title_boost': 2,  # сколько раз учитываются термы заголовка
+    'bm25_weight': float(os.getenv('SEARCH_INDEX_BM25_WEIGHT', '0.6')),
+    'embedding_weight': float(os.getenv('SEARCH_INDEX_EMBEDDING_WEIGHT', '0.4')),
+    'min_similarity': float(os.getenv('SEARCH_INDEX_MIN_SIMILARITY', '0.4')),  # без общих термов документ нужен хотя бы такой близости
+}
+
+# Снимки строк в памяти (snapshot.py): как часто сверять поколение снимка с БД (изменения из других процессов)
+SNAPSHOT_SETTINGS = {
+    'generation_check_seconds': float(os.getenv(
+        'SNAPSHOT_GENERATION_CHECK_SECONDS', os.getenv('SEARCH_INDEX_GENERATION_CHECK_SECONDS', '30'))),
+}
+
+# Employee Search (employee_search.py): кандидаты по BM25 и навыкам, затем эмбеддинги только для кандидатов.
+# score = lexical * BM25 / max(BM25) + skill * доля навыков из запроса + embedding * cosine
+EMPLOYEE_SEARCH_SETTINGS = {
+    'candidates': int(os.getenv('EMPLOYEE_SEARCH_CANDIDATES', '200')),
+    'weights': {
+        'lexical': float(os.getenv('EMPLOYEE_SEARCH_LEXICAL_WEIGHT', '0.3')),
+        'skill': float(os.getenv('EMPLOYEE_SEARCH_SKILL_WEIGHT', '0.4')),
+        'embedding': float(os.getenv('EMPLOYEE_SEARCH_EMBEDDING_WEIGHT', '0.3')),
+    },
+    'field_weights': {'name': 2, 'surname': 2, 'position': 2, 'department': 1, 'skills': 3, 'interests': 1},
+    'bm25_k1': 1.2,
+    'bm25_b': 0.75,
+    'min_similarity': float(os.getenv('EMPLOYEE_SEARCH_MIN_SIMILARITY', '0.4')),  # для найденных только по смыслу
+    'vector_cache_size': int(os.getenv('EMPLOYEE_SEARCH_VECTOR_CACHE', '50000')),
+}
+
+# Intent Routing (intent_router.py): каждая ступень отвечает, если ее лучший балл не ниже минимума
+# и отрывается от второго места не меньше чем на margin; иначе запрос идет на следующую ступень.
+# После правки весов правил: python intent_router.py --check (примеры вопросов бота)
+INTENT_SETTINGS = {
+    'rule_min_score': float(os.getenv('INTENT_RULE_MIN_SCORE', '1.0')),
+    'rule_min_margin': float(os.getenv('INTENT_RULE_MIN_MARGIN', '1.0')),
+    'rule_fallback_score': 0.3,  # ниже этого ответ правил не используется даже как запасной
+    'embedding_min_similarity': float(os.getenv('INTENT_EMBEDDING_MIN_SIMILARITY', '0.6')),
+    'embedding_min_margin': float(os.getenv('INTENT_EMBEDDING_MIN_MARGIN', '0.05')),
+    'min_confidence': 0.2,  # ниже - "неопределенный запрос"
+    'nli_enabled': os.getenv('INTENT_NLI_ENABLED', 'True').lower() == 'true',
+}
+
+# Conversation Context (follow-ups and paging, conversation_context.py)
+CONVERSATION_SETTINGS = {
+    'max_chats': int(os.getenv('CONVERSATION_MAX_CHATS', '10000')),
+    'ttl_seconds': int(os.getenv('CONVERSATION_TTL_SECONDS', '1800')),  # после этого вопрос считается новым
+    'sqlite_path': os.getenv('CONVERSATION_DB_PATH', ''),  # пусто - только в памяти
+    'page_size': SEARCH_SETTINGS['max_results'],
+    'cached_pages': 5,  # сколько страниц результатов поиск отдает сразу, чтобы «ещё» не повторяло запрос
+}
+
+# Reply Rendering (rendering.py)
+RENDER_SETTINGS = {
+    # plain или html; для MarkdownV2 пришлось бы экранировать и все статические тексты бота
+    'mode': os.getenv('RENDER_MODE', 'plain').lower(),
+    'description_length': int(os.getenv('RENDER_DESCRIPTION_LENGTH', '500')),  # длиннее - обрезается с «…»
 }
 
 # Activity Settings
@@ -98,4 +227,37 @@ EVENT_SETTINGS = {
     'max_participants': 50,
     'reminder_hours': 24,
     'types': ['meeting', 'training', 'team_building', 'presentation', 'other'],
+}
+
+# Reminder Settings
+REMINDER_SETTINGS = {
+    'enabled': os.getenv('REMINDERS_ENABLED', 'True').lower() == 'true',
+    'interval_seconds': int(os.getenv('REMINDER_INTERVAL_SECONDS', '60')),
+    'dispatch_batch': 1000,  # сколько неотправленных напоминаний ставить в очередь за один тик
+    'max_attempts': int(os.getenv('REMINDER_MAX_ATTEMPTS', '5')),  # после стольких неудач строка больше не берется
+    'retry_seconds': int(os.getenv('REMINDER_RETRY_SECONDS', '300')),  # пауза после первой неудачи, дальше удваивается
+    'mark_flush_seconds': float(os.getenv('REMINDER_MARK_FLUSH_SECONDS', '1')),  # отметки о доставке пишутся пачкой раз в столько
+}
+
+# Outbound Message Settings (Telegram flood limits)
+OUTBOUND_SETTINGS = {
+    'global_rate': float(os.getenv('OUTBOUND_GLOBAL_RATE', '25')),  # сообщений в секунду, лимит Telegram ~30
+    'private_chat_rate': 1.0,  # сообщений в секунду в один личный чат
+    'group_chat_rate': 20 / 60,  # в группах не больше 20 сообщений в минуту
+    'max_concurrency': 8,  # одновременных запросов к Bot API
+    'max_retries': 3,
+}
+
+# Update Ingestion: long polling or webhook (webhook.py)
+BOT_MODE = os.getenv('BOT_MODE', 'polling')  # polling | webhook
+WEBHOOK_SETTINGS = {
+    'url': os.getenv('WEBHOOK_URL'),  # публичный https-адрес; если не задан, setWebhook не вызывается
+    'listen': os.getenv('WEBHOOK_LISTEN', '0.0.0.0'),
+    'port': int(os.getenv('WEBHOOK_PORT', '8443')),
+    'path': os.getenv('WEBHOOK_PATH', '/telegram/webhook'),
+    'secret_token': os.getenv('WEBHOOK_SECRET_TOKEN'),
+    'workers': int(os.getenv('WEBHOOK_WORKERS', '1')),  # >1 - шардирование апдейтов по chat_id между процессами
+    'concurrent_updates': int(os.getenv('CONCURRENT_UPDATES', '16')),  # апдейтов в обработке на процесс
+    'queue_size': 10000,  # апдейтов в очереди шарда, дальше - 503 и повтор со стороны Telegram
+    'max_connections': 40,
 } 
\ No newline at end of file
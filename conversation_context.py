@@ -0,0 +1,269 @@
+"""Per-chat conversation context for follow-up questions.
+
+After each answer the bot remembers, per chat, the category, the effective
+query, the resolved entities (time period, department) and the results it has
+not shown yet. Follow-ups then skip work:
+
+  * "ещё", "дальше"           -> next page from the cached results, no
+                                 classification and no queries;
+  * "а на следующей неделе?",
+    "а в отделе продаж?"      -> the previous category is reused, no model
+                                 call; the new entity replaces the old one in
+                                 the previous query and only the search runs.
+
+Contexts live in a bounded in-memory LRU with a TTL and can optionally be
+written through to SQLite (CONVERSATION_SETTINGS['sqlite_path']) so they
+survive a restart.
+
+``ChatLocks`` serializes the handling of one chat: with concurrent updates
+two messages of a chat would otherwise read and write its context at the
+same time, and "ещё" could overtake the question it pages through.
+"""
+import asyncio
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from config import CONVERSATION_SETTINGS
+from rendering import MessageBuilder
+
+logger = logging.getLogger(__name__)
+
+# Только сама просьба о следующей странице: "еще задачи по docker" - уже новый вопрос
+MORE_PATTERN = re.compile(
+    r'^(?:а\s+|и\s+)?(?:покажи\s+|давай\s+)?(?:ещ[её]|дальше|больше|следующ\w*\s+страниц\w*)'
+    r'(?:,?\s+пожалуйста)?\s*[.!?]*$'
+)
+FOLLOW_UP_PATTERN = re.compile(r'^(?:а|и|ну\s+а)\s+')
+TIME_PATTERN = re.compile(
+    r'(?:\b(?:на|в|во|за|через)\s+)?'
+    r'(?:\b(?:эт\w+|следующ\w+|прошл\w+|ближайш\w+)\s+)?'
+    r'\b(?:недел\w*|месяц\w*|сегодня|завтра|послезавтра|\d+\s*(?:дн\w*|день)'
+    r'|январ\w*|феврал\w*|март\w*|апрел\w*|ма[йяе]|июн\w*|июл\w*|август\w*'
+    r'|сентябр\w*|октябр\w*|ноябр\w*|декабр\w*)\b'
+)
+MAX_FOLLOW_UP_WORDS = 6
+
+
+class ChatContext:
+    """State remembered for one chat between messages."""
+
+    def __init__(self, category: str, confidence: float, query: str,
+                 entities: Optional[Dict[str, str]] = None, header: str = '',
+                 results: Optional[List[str]] = None, cursor: int = 0,
+                 updated_at: Optional[float] = None):
+        self.category = category
+        self.confidence = confidence
+        self.query = query
+        self.entities = entities or {}
+        self.header = header
+        self.results = results or []
+        self.cursor = cursor
+        self.updated_at = updated_at if updated_at is not None else time.time()
+
+    @property
+    def has_more(self) -> bool:
+        return self.cursor < len(self.results)
+
+    def next_page(self, page_size: int = CONVERSATION_SETTINGS['page_size']) -> str:
+        """Render the next page of cached results and advance the cursor.
+
+        A page is at most ``page_size`` blocks and fits in one Telegram message;
+        blocks that do not fit go to the next page.
+        """
+        message = MessageBuilder()  # запас MORE_RESERVE вмещает строку «Показано ...»
+        if self.header:
+            message.add(self.header, counted=False)
+        for block in self.results[self.cursor:self.cursor + page_size]:
+            if not message.add(block):
+                break
+        self.cursor += message.count
+        self.updated_at = time.time()
+        text = message.text(more=False)
+        remaining = len(self.results) - self.cursor
+        if remaining:
+            text += f"\n\nПоказано {self.cursor} из {len(self.results)}. Напишите «ещё», чтобы увидеть остальные."
+        return text
+
+    def to_dict(self) -> dict:
+        return {
+            'category': self.category, 'confidence': self.confidence, 'query': self.query,
+            'entities': self.entities, 'header': self.header, 'results': self.results,
+            'cursor': self.cursor, 'updated_at': self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'ChatContext':
+        return cls(**data)
+
+
+def split_results(response: str) -> Tuple[str, List[str]]:
+    """Split a list answer ("Header:" + blocks) into header and result blocks.
+
+    Anything else (welcome text, a single answer) stays one block and is never paged.
+    """
+    blocks = [block.strip() for block in response.strip().split("\n\n") if block.strip()]
+    if len(blocks) > 1 and blocks[0].endswith(':') and '\n' not in blocks[0]:
+        return blocks[0], blocks[1:]
+    return '', [response.strip()]
+
+
+def is_more_request(text: str) -> bool:
+    return bool(MORE_PATTERN.match(text.strip().lower()))
+
+
+def extract_entities(text: str, department_of: Callable[[str], Optional[str]]) -> Dict[str, str]:
+    entities = {}
+    time_match = TIME_PATTERN.search(text)
+    if time_match:
+        entities['time'] = time_match.group(0).strip()
+    department = department_of(text)
+    if department:
+        entities['department'] = department
+    return entities
+
+
+def resolve_follow_up(text: str, context: Optional[ChatContext],
+                      department_of: Callable[[str], Optional[str]]) -> Optional[str]:
+    """Effective query for a short follow-up ("а в мае?"), or None if it is a new question.
+
+    The entities mentioned in the follow-up replace the same kind of entity in
+    the previous query; everything else in the previous query is kept.
+    """
+    if context is None:
+        return None
+    text = text.strip().lower()
+    match = FOLLOW_UP_PATTERN.match(text)
+    if not match or len(text.split()) > MAX_FOLLOW_UP_WORDS:
+        return None
+    addition = text[match.end():].strip(' ?!.')
+    new_entities = extract_entities(addition, department_of)
+    if not new_entities:
+        return None
+    previous = context.query
+    if 'time' in new_entities:
+        previous = TIME_PATTERN.sub(' ', previous)
+    old_department = context.entities.get('department')
+    if 'department' in new_entities and old_department:
+        previous = re.sub(rf'\b{re.escape(old_department.lower())}\b', ' ', previous)
+    return ' '.join(f"{previous} {addition}".split())
+
+
+class ContextStore:
+    """Bounded LRU of ChatContext with a TTL and optional SQLite write-through."""
+
+    def __init__(self, max_chats: int = CONVERSATION_SETTINGS['max_chats'],
+                 ttl_seconds: float = CONVERSATION_SETTINGS['ttl_seconds'],
+                 sqlite_path: Optional[str] = CONVERSATION_SETTINGS['sqlite_path']):
+        self.max_chats = max_chats
+        self.ttl_seconds = ttl_seconds
+        self._items: 'OrderedDict[int, ChatContext]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False, isolation_level=None)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS chat_context '
+                '(chat_id INTEGER PRIMARY KEY, payload TEXT NOT NULL, updated_at REAL NOT NULL)'
+            )
+        self.hits = 0
+        self.misses = 0
+
+    def _expired(self, context: ChatContext) -> bool:
+        return time.time() - context.updated_at > self.ttl_seconds
+
+    def _load(self, chat_id: int) -> Optional[ChatContext]:
+        row = self._db.execute('SELECT payload FROM chat_context WHERE chat_id = ?', (chat_id,)).fetchone()
+        if row is None:
+            return None
+        try:
+            return ChatContext.from_dict(json.loads(row[0]))
+        except (ValueError, TypeError):
+            logger.warning("Dropping unreadable context for chat %s", chat_id)
+            return None
+
+    def get(self, chat_id: int) -> Optional[ChatContext]:
+        with self._lock:
+            context = self._items.get(chat_id)
+            if context is None and self._db is not None:
+                context = self._load(chat_id)
+                if context is not None:
+                    self._remember(chat_id, context)
+            if context is None or self._expired(context):
+                self.misses += 1
+                return None
+            self._items.move_to_end(chat_id)
+            self.hits += 1
+            return context
+
+    def _remember(self, chat_id: int, context: ChatContext):
+        self._items[chat_id] = context
+        self._items.move_to_end(chat_id)
+        while len(self._items) > self.max_chats:
+            self._items.popitem(last=False)
+
+    def put(self, chat_id: int, context: ChatContext):
+        context.updated_at = time.time()
+        with self._lock:
+            self._remember(chat_id, context)
+            if self._db is not None:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO chat_context (chat_id, payload, updated_at) VALUES (?, ?, ?)',
+                    (chat_id, json.dumps(context.to_dict(), ensure_ascii=False), context.updated_at)
+                )
+
+    def discard(self, chat_id: int):
+        with self._lock:
+            self._items.pop(chat_id, None)
+            if self._db is not None:
+                self._db.execute('DELETE FROM chat_context WHERE chat_id = ?', (chat_id,))
+
+    def purge_expired(self) -> int:
+        """Drop expired contexts from memory and SQLite. Returns how many were dropped from memory."""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [chat_id for chat_id, context in self._items.items() if context.updated_at < cutoff]
+            for chat_id in expired:
+                del self._items[chat_id]
+            if self._db is not None:
+                self._db.execute('DELETE FROM chat_context WHERE updated_at < ?', (cutoff,))
+        return len(expired)
+
+
+class ChatLocks:
+    """One asyncio.Lock per chat while it has updates in progress.
+
+    asyncio.Lock wakes waiters in FIFO order, so updates of one chat are
+    handled one at a time in arrival order; other chats are not held up.
+    """
+
+    def __init__(self):
+        self._locks: Dict[int, Tuple[asyncio.Lock, int]] = {}
+
+    @asynccontextmanager
+    async def hold(self, chat_id: int) -> AsyncIterator[None]:
+        lock, users = self._locks.get(chat_id) or (asyncio.Lock(), 0)
+        self._locks[chat_id] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[chat_id]
+            if users == 1:
+                del self._locks[chat_id]  # чат без сообщений в работе - замок больше не нужен
+            else:
+                self._locks[chat_id] = (lock, users - 1)
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+conversation_store = ContextStore()
+chat_locks = ChatLocks()
@@ -1,43 +1,293 @@
-import pandas as pd
-
-# Sample employee data
-employees_data = {
-    'id': [1, 2, 3, 4, 5],
-    'name': ['Иван Петров', 'Мария Сидорова', 'Алексей Иванов', 'Елена Смирнова', 'Дмитрий Козлов'],
-    'department': ['IT', 'HR', 'Sales', 'Marketing', 'IT'],
-    'project': ['Project A', 'Project B', 'Project C', 'Project A', 'Project B'],
-    'position': ['Senior Developer', 'HR Manager', 'Sales Manager', 'Marketing Specialist', 'Developer'],
-    'birthday': ['1990-05-15', '1988-08-23', '1992-03-10', '1995-11-30', '1991-07-20']
-}
+"""Fixtures: the built-in sample rows and fixture files, loaded only on request.
+
+Importing this module loads nothing (it used to build three pandas
+DataFrames at import time, and pandas was not even a requirement):
+
+  * ``get_employees`` / ``get_events`` / ``get_tasks`` return the sample rows
+    as typed NamedTuples, built on the first call;
+  * ``read_fixture`` streams a fixture file in batches of typed row dicts.
+    CSV goes through ``csv.DictReader``. Parquet goes through pyarrow's
+    ``ParquetFile.iter_batches``; pyarrow is optional and imported only for
+    ``.parquet`` files. Columns are the model's column names. Strings are
+    converted with the column's type (Integer, Float, Boolean, DateTime,
+    Enum), and Parquet values that are already typed pass through. An empty
+    CSV field is NULL: CSV cannot tell '' from NULL, and the answers treat
+    both alike;
+  * ``load`` inserts a file batch by batch with Core executemany, as
+    generate_data does, in one transaction. Memory stays at one batch
+    whatever the file size. Afterwards it rebuilds the derived tables
+    (skill/tag links, employee summary). Snapshots in running bots and web
+    workers see the new rows by their generation check (snapshot.py), within
+    SNAPSHOT_SETTINGS['generation_check_seconds']; snapshots in the loading
+    process itself are marked stale with ``snapshot.invalidate_all``.
+
+Usage:
+    python data.py --database-url sqlite:///fixtures.db --load employees employees.csv
+    python data.py --database-url sqlite:///fixtures.db --load tasks tasks.parquet --batch-size 10000
+    python data.py --database-url sqlite:///eval.db --dump employees employees.csv   # fixture from a database
+"""
+import csv
+import enum
+import logging
+import time
+from datetime import date, datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import Boolean, Date, DateTime, Enum, Float, Integer, Table
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+
+import cli
+from models import Activity, Employee, Event, GeneralInfo, Task, activity_participants, birth_md_key, event_participants
+from snapshot import invalidate_all
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 5000
+
+
+# --- built-in samples ------------------------------------------------------
+
+class SampleEmployee(NamedTuple):
+    id: int
+    name: str
+    department: str
+    project: str
+    position: str
+    birthday: date
+
+
+class SampleEvent(NamedTuple):
+    id: int
+    name: str
+    date: date
+    type: str
+    description: str
+
+
+class SampleTask(NamedTuple):
+    id: int
+    title: str
+    deadline: date
+    status: str
+    assignee: str
+
+
+@lru_cache(maxsize=None)
+def get_employees() -> Tuple[SampleEmployee, ...]:
+    return tuple(SampleEmployee(*row[:5], date.fromisoformat(row[5])) for row in (
+        (1, 'Иван Петров', 'IT', 'Project A', 'Senior Developer', '1990-05-15'),
+        (2, 'Мария Сидорова', 'HR', 'Project B', 'HR Manager', '1988-08-23'),
+        (3, 'Алексей Иванов', 'Sales', 'Project C', 'Sales Manager', '1992-03-10'),
+        (4, 'Елена Смирнова', 'Marketing', 'Project A', 'Marketing Specialist', '1995-11-30'),
+        (5, 'Дмитрий Козлов', 'IT', 'Project B', 'Developer', '1991-07-20'),
+    ))
+
+
+@lru_cache(maxsize=None)
+def get_events() -> Tuple[SampleEvent, ...]:
+    return tuple(SampleEvent(row[0], row[1], date.fromisoformat(row[2]), *row[3:]) for row in (
+        (1, 'Корпоратив', '2024-03-15', 'Корпоративное мероприятие', 'Ежегодный корпоратив компании'),
+        (2, 'Тренинг по продажам', '2024-03-20', 'Обучение', 'Тренинг для отдела продаж'),
+        (3, 'Встреча с клиентом', '2024-03-25', 'Встреча', 'Встреча с ключевым клиентом'),
+        (4, 'Презентация проекта', '2024-04-01', 'Презентация', 'Презентация нового проекта'),
+    ))
+
+
+@lru_cache(maxsize=None)
+def get_tasks() -> Tuple[SampleTask, ...]:
+    return tuple(SampleTask(row[0], row[1], date.fromisoformat(row[2]), *row[3:]) for row in (
+        (1, 'Подготовить отчет', '2024-03-18', 'В процессе', 'Иван Петров'),
+        (2, 'Создать презентацию', '2024-03-22', 'Завершено', 'Мария Сидорова'),
+        (3, 'Провести встречу', '2024-03-25', 'Новое', 'Алексей Иванов'),
+        (4, 'Обновить документацию', '2024-03-30', 'В процессе', 'Дмитрий Козлов'),
+    ))
+
+
+# --- fixture files ---------------------------------------------------------
+
+class FixtureSpec(NamedTuple):
+    table: Table
+    derive: Optional[Callable[[dict], None]] = None  # дополняет строку производными столбцами
 
-# Sample events data
-events_data = {
-    'id': [1, 2, 3, 4],
-    'name': ['Корпоратив', 'Тренинг по продажам', 'Встреча с клиентом', 'Презентация проекта'],
-    'date': ['2024-03-15', '2024-03-20', '2024-03-25', '2024-04-01'],
-    'type': ['Корпоративное мероприятие', 'Обучение', 'Встреча', 'Презентация'],
-    'description': ['Ежегодный корпоратив компании', 'Тренинг для отдела продаж', 'Встреча с ключевым клиентом', 'Презентация нового проекта']
-}
 
-# Sample tasks data
-tasks_data = {
-    'id': [1, 2, 3, 4],
-    'title': ['Подготовить отчет', 'Создать презентацию', 'Провести встречу', 'Обновить документацию'],
-    'deadline': ['2024-03-18', '2024-03-22', '2024-03-25', '2024-03-30'],
-    'status': ['В процессе', 'Завершено', 'Новое', 'В процессе'],
-    'assignee': ['Иван Петров', 'Мария Сидорова', 'Алексей Иванов', 'Дмитрий Козлов']
+def _derive_employee(row: dict):
+    if 'birthday' in row:
+        row['birth_md'] = birth_md_key(row['birthday'])
+
+
+FIXTURES = {
+    'employees': FixtureSpec(Employee.__table__, _derive_employee),
+    'events': FixtureSpec(Event.__table__),
+    'activities': FixtureSpec(Activity.__table__),
+    'tasks': FixtureSpec(Task.__table__),
+    'general_info': FixtureSpec(GeneralInfo.__table__),
+    'event_participants': FixtureSpec(event_participants),
+    'activity_participants': FixtureSpec(activity_participants),
 }
 
-# Create DataFrames
-employees_df = pd.DataFrame(employees_data)
-events_df = pd.DataFrame(events_data)
-tasks_df = pd.DataFrame(tasks_data)
 
-def get_employees():
-    return employees_df
+def _enum(enum_class) -> Callable[[str], Any]:
+    def convert(value: str):
+        try:
+            return enum_class(value)  # значение ('in_progress')
+        except ValueError:
+            return enum_class[value]  # или имя ('IN_PROGRESS')
+    return convert
+
+
+def _converter(column) -> Callable[[str], Any]:
+    column_type = column.type
+    if isinstance(column_type, Enum) and column_type.enum_class is not None:
+        return _enum(column_type.enum_class)
+    if isinstance(column_type, Boolean):
+        return lambda value: value.strip().lower() in ('1', 'true', 't', 'yes')
+    if isinstance(column_type, Integer):
+        return int
+    if isinstance(column_type, Float):
+        return float
+    if isinstance(column_type, DateTime):
+        return datetime.fromisoformat
+    if isinstance(column_type, Date):
+        return date.fromisoformat
+    return str
+
+
+def _converters(table: Table, columns: List[str], source: str) -> Dict[str, Callable[[str], Any]]:
+    unknown = [name for name in columns if name not in table.c]
+    if unknown:
+        raise ValueError(f"{source}: columns {unknown} are not in table {table.name}")
+    return {name: _converter(table.c[name]) for name in columns}
+
+
+def _typed(record: dict, converters: Dict[str, Callable[[str], Any]]) -> dict:
+    row = {}
+    for name, convert in converters.items():
+        value = record[name]
+        if value is None or value == '':
+            row[name] = None
+        elif isinstance(value, str):
+            row[name] = convert(value)
+        else:
+            row[name] = value  # Parquet: уже типизировано
+    return row
+
+
+def _csv_records(path: Path, batch_size: int) -> Iterator[Tuple[List[str], List[dict]]]:
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        batch = []
+        for record in reader:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                yield reader.fieldnames, batch
+                batch = []
+        if batch:
+            yield reader.fieldnames, batch
+
+
+def _parquet_records(path: Path, batch_size: int) -> Iterator[Tuple[List[str], List[dict]]]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(f"reading {path} needs pyarrow (pip install pyarrow)") from e
+    parquet = pq.ParquetFile(path)
+    for batch in parquet.iter_batches(batch_size=batch_size):
+        yield batch.schema.names, batch.to_pylist()
+
+
+READERS = {'.csv': _csv_records, '.parquet': _parquet_records}
+
+
+def read_fixture(path, name: str, batch_size: int = BATCH_SIZE) -> Iterator[List[dict]]:
+    """Typed row dicts for table ``name`` (a FIXTURES key) from a CSV or Parquet file, ``batch_size`` at a time."""
+    path = Path(path)
+    spec = FIXTURES[name]
+    reader = READERS.get(path.suffix.lower())
+    if reader is None:
+        raise ValueError(f"{path}: unsupported fixture format (expected {', '.join(READERS)})")
+    converters = None
+    for columns, records in reader(path, batch_size):
+        if converters is None:
+            converters = _converters(spec.table, list(columns), str(path))
+        rows = [_typed(record, converters) for record in records]
+        if spec.derive is not None:
+            for row in rows:
+                spec.derive(row)
+        yield rows
+
+
+def load(bind: Engine, name: str, path, batch_size: int = BATCH_SIZE, derived: bool = True) -> int:
+    """Insert a fixture file into table ``name`` in one transaction; returns rows inserted.
+
+    ``derived=False`` skips rebuilding the link and summary tables, e.g. when
+    several files are loaded in a row and the last one rebuilds them.
+    """
+    from employee_summary import rebuild as rebuild_summary
+    from taxonomy import rebuild as rebuild_labels
+
+    table = FIXTURES[name].table
+    started = time.perf_counter()
+    total = 0
+    with bind.begin() as conn:
+        for rows in read_fixture(path, name, batch_size):
+            conn.execute(table.insert(), rows)
+            total += len(rows)
+    logger.info("Loaded %d rows into %s from %s in %.2fs", total, table.name, path, time.perf_counter() - started)
+    if derived and total:
+        rebuild_labels(bind)
+        rebuild_summary(bind)
+    # Core-вставки обходят события маппера; другие процессы заметят их по поколению снимков
+    invalidate_all()
+    return total
+
+
+def dump(bind: Engine, name: str, path, batch_size: int = BATCH_SIZE) -> int:
+    """Write table ``name`` to a CSV fixture file that ``load`` accepts; returns rows written."""
+    from sqlalchemy import select
+
+    table = FIXTURES[name].table
+    columns = [column.name for column in table.columns if not (name == 'employees' and column.name == 'birth_md')]
+    total = 0
+    with bind.connect() as conn, open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        result = conn.execution_options(yield_per=batch_size).execute(select(*(table.c[c] for c in columns)))
+        for row in result:
+            writer.writerow(['' if value is None else value.name if isinstance(value, enum.Enum)
+                             else value.isoformat() if isinstance(value, (date, datetime)) else value
+                             for value in row])
+            total += 1
+    return total
+
+
+def main():
+    parser = cli.parser(__doc__)
+    parser.add_argument('--load', nargs=2, metavar=('TABLE', 'FILE'), help=f"one of {', '.join(FIXTURES)}")
+    parser.add_argument('--dump', nargs=2, metavar=('TABLE', 'FILE'), help='write a table as a CSV fixture')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+    bind = cli.connect(args)
+    for option in (args.load, args.dump):
+        if option and option[0] not in FIXTURES:
+            parser.error(f"unknown table {option[0]!r}; expected one of {', '.join(FIXTURES)}")
+    if args.dump:
+        started = time.perf_counter()
+        count = dump(bind, *args.dump, batch_size=args.batch_size)
+        print(f"dumped {count} {args.dump[0]} to {args.dump[1]} in {time.perf_counter() - started:.2f}s")
+    if args.load:
+        started = time.perf_counter()
+        try:
+            count = load(bind, *args.load, batch_size=args.batch_size)
+        except IntegrityError as e:
+            # Вся загрузка - одна транзакция, так что откатилась целиком
+            parser.error(f"{args.load[1]} conflicts with rows already in {args.load[0]} "
+                         f"(duplicate ids or missing references), nothing was loaded; "
+                         f"load into an empty database or drop the conflicting rows\n{e.orig}")
+        print(f"loaded {count} {args.load[0]} from {args.load[1]} in {time.perf_counter() - started:.2f}s")
 
-def get_events():
-    return events_df
 
-def get_tasks():
-    return tasks_df 
\ No newline at end of file
+if __name__ == '__main__':
+    main()
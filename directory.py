@@ -0,0 +1,153 @@
+"""Read-only employee directory snapshot for search answers.
+
+Employee answers print a few text fields, but they used to load full
+``Employee`` ORM objects to get them: 17 columns plus instance state,
+identity-map entries and relationship attributes per row, on every query.
+``Directory`` keeps the displayed fields of every employee in one dict
+``id -> DirectoryEntry``:
+
+  * ``DirectoryEntry`` is a ``__slots__`` record (no per-instance dict);
+  * name, surname, position and department strings are interned. There are
+    a few dozen distinct departments and positions, so every record shares
+    the same string objects;
+  * the snapshot is built with one Core select (no ORM entities). It is a
+    ``snapshot.SnapshotIndex``: committed employee writes mark it stale (in
+    other processes, through the generation check), and the next
+    ``ensure_fresh`` rebuilds it, as with the birthday index.
+
+Search code ranks ids (employee_search) and then takes the records from here,
+without another database query.
+
+Usage:
+    python directory.py --database-url sqlite:///eval.db --bench
+"""
+import logging
+import sys
+import time
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import cli
+from models import Employee
+from snapshot import SnapshotIndex
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('id', 'name', 'surname', 'position', 'department', 'email', 'phone', 'skills', 'interests', 'is_active')
+INTERNED = ('name', 'surname', 'position', 'department')
+
+
+class DirectoryEntry:
+    """Displayed fields of one employee; attribute-compatible with ``Employee`` for the formatters."""
+
+    __slots__ = FIELDS
+
+    def __init__(self, *values):
+        for field, value in zip(FIELDS, values):
+            setattr(self, field, value)
+
+    def __repr__(self):
+        return f"<DirectoryEntry {self.name} {self.surname}>"
+
+
+class Directory(SnapshotIndex):
+    """All employees as ``DirectoryEntry`` records, rebuilt after employee writes."""
+
+    models = (Employee,)
+
+    def __init__(self):
+        super().__init__()
+        self._entries: Dict[int, DirectoryEntry] = {}
+
+    def _rebuild(self, session: Session):
+        started = time.perf_counter()
+        interned = [FIELDS.index(field) for field in INTERNED]
+        entries = {}
+        for row in session.execute(select(*(getattr(Employee, field) for field in FIELDS)).order_by(Employee.id)):
+            values = list(row)
+            for i in interned:
+                if values[i] is not None:
+                    values[i] = sys.intern(values[i])
+            entries[values[0]] = DirectoryEntry(*values)
+        self._entries = entries
+        logger.info("Directory snapshot rebuilt: %d employees in %.2fs", len(entries), time.perf_counter() - started)
+
+    def get(self, employee_id: int) -> Optional[DirectoryEntry]:
+        return self._entries.get(employee_id)
+
+    def lookup(self, employee_ids: Iterable[int]) -> List[DirectoryEntry]:
+        """Records in the given order; ids unknown to the snapshot are skipped."""
+        entries = self._entries
+        return [entries[i] for i in employee_ids if i in entries]
+
+    def entries(self) -> List[DirectoryEntry]:
+        """Every employee, by id."""
+        return list(self._entries.values())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+directory = Directory()
+
+
+def main():
+    parser = cli.parser(__doc__, bench='compare memory and lookup latency with ORM rows')
+    parser.add_argument('--lookups', type=int, default=500, help='answers of --page ids each')
+    parser.add_argument('--page', type=int, default=20)
+    args = parser.parse_args()
+    bind = cli.connect(args)
+    import gc
+    import random
+    import tracemalloc
+
+    if not args.bench:
+        return
+
+    def line(emp) -> str:
+        return f"{emp.name} {emp.surname} - {emp.position}, {emp.department}"
+
+    def measure(build):
+        gc.collect()
+        tracemalloc.start()
+        started = time.perf_counter()
+        result = build()
+        elapsed = time.perf_counter() - started
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return result, size, elapsed
+
+    with Session(bind=bind) as session:
+        orm_rows, orm_bytes, orm_load = measure(lambda: session.query(Employee).all())
+        count = len(orm_rows)
+        del orm_rows
+    snapshot = Directory()
+    with Session(bind=bind) as session:
+        _, snapshot_bytes, snapshot_load = measure(lambda: snapshot.ensure_fresh(session))
+    print(f"{count} employees")
+    print(f"ORM objects (session.query(Employee).all()): {orm_bytes / 2 ** 20:6.2f} MiB, "
+          f"{orm_bytes / count:5.0f} B/employee, load {orm_load * 1000:6.1f} ms")
+    print(f"directory snapshot:                          {snapshot_bytes / 2 ** 20:6.2f} MiB, "
+          f"{snapshot_bytes / count:5.0f} B/employee, build {snapshot_load * 1000:6.1f} ms")
+
+    ids = list(snapshot._entries)
+    rng = random.Random(0)
+    pages = [rng.sample(ids, args.page) for _ in range(args.lookups)]
+    started = time.perf_counter()
+    for page in pages:  # как employee_search.load: IN-запрос и ORM-объекты на каждый ответ
+        with Session(bind=bind) as session:
+            rows = {emp.id: emp for emp in session.query(Employee).filter(Employee.id.in_(page))}
+            text = '\n'.join(line(rows[i]) for i in page if i in rows)
+    orm_time = time.perf_counter() - started
+    started = time.perf_counter()
+    for page in pages:
+        text = '\n'.join(line(emp) for emp in snapshot.lookup(page))
+    snapshot_time = time.perf_counter() - started
+    print(f"{args.lookups} answers x {args.page} employees: ORM {orm_time / args.lookups * 1000:.2f} ms/answer, "
+          f"snapshot {snapshot_time / args.lookups * 1000:.3f} ms/answer")
+
+
+if __name__ == '__main__':
+    main()
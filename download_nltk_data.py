@@ -1,7 +1,73 @@
-import nltk
+"""Prepare the NLTK data directory once, at build or deploy time.
 
-# Загрузка необходимых данных для русского языка
-nltk.download('punkt')
-nltk.download('stopwords')
-nltk.download('averaged_perceptron_tagger')
-nltk.download('wordnet') 
\ No newline at end of file
+Runtime code never calls ``nltk.download``. It only adds NLTK_DATA_DIR to
+``nltk.data.path`` and checks the resources there once
+(``nltk_data_ready``). Run this script in the image build or on the deploy
+host:
+
+    python download_nltk_data.py           # download what is missing into NLTK_DATA_DIR
+    python download_nltk_data.py --check   # exit 1 if anything is missing (CI)
+"""
+import argparse
+import logging
+import sys
+from functools import lru_cache
+
+from config import NLTK_DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+# Ресурс -> путь для nltk.data.find; стеммер Snowball данных не требует
+REQUIRED_RESOURCES = {
+    'stopwords': 'corpora/stopwords',
+}
+
+
+def missing_resources(data_dir: str = NLTK_DATA_DIR) -> list:
+    import nltk
+
+    if data_dir not in nltk.data.path:
+        nltk.data.path.insert(0, data_dir)
+    missing = []
+    for name, path in REQUIRED_RESOURCES.items():
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            missing.append(name)
+    return missing
+
+
+@lru_cache(maxsize=None)
+def nltk_data_ready() -> bool:
+    """True when nltk is installed and every required resource is in NLTK_DATA_DIR (checked once)."""
+    try:
+        missing = missing_resources()
+    except ImportError:
+        logger.warning("nltk is not installed")
+        return False
+    if missing:
+        logger.warning("NLTK resources %s are missing, run: python download_nltk_data.py", ', '.join(missing))
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dir', default=NLTK_DATA_DIR, help='target directory (NLTK_DATA_DIR)')
+    parser.add_argument('--check', action='store_true', help='only check, exit 1 if something is missing')
+    args = parser.parse_args()
+
+    import nltk
+
+    missing = missing_resources(args.dir)
+    if args.check:
+        print(f"{args.dir}: " + (f"missing {', '.join(missing)}" if missing else "ok"))
+        sys.exit(1 if missing else 0)
+    for name in missing:
+        if not nltk.download(name, download_dir=args.dir, quiet=True):
+            sys.exit(f"Could not download NLTK resource {name!r}")
+    print(f"{args.dir}: " + (f"downloaded {', '.join(missing)}" if missing else "already complete"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""Model backends: sentence embeddings and zero-shot NLI classification.
+
+``load_encoder()`` returns an object with a SentenceTransformer-compatible
+``encode`` method:
+
+  * ``EMBEDDING_BACKEND=torch`` (default) - sentence_transformers on PyTorch;
+  * ``EMBEDDING_BACKEND=onnx`` - ONNX Runtime over a model exported with
+    ``python export_onnx.py export`` (optionally int8-quantized).
+
+When ``INFERENCE_SOCKET`` is set both loaders return thin clients of the
+shared ``inference_server`` instead of loading the models in-process.
+
+Importing this module is cheap: torch, transformers and onnxruntime are
+imported only inside the loaders. The bots call ``attach_encoder`` in a
+background thread after startup, so neither import nor startup waits for a
+model.
+"""
+import logging
+import os
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+
+from config import EMBEDDING_BACKEND, INFERENCE_SOCKET, MODEL_NAME, NLI_MODEL_NAME, ONNX_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+ONNX_MODEL_FILE = 'model.onnx'
+ONNX_QUANTIZED_FILE = 'model.int8.onnx'
+
+
+class OnnxSentenceEncoder:
+    """Mean-pooled transformer embeddings computed with ONNX Runtime.
+
+    Matches SentenceTransformer's output for models whose pooling is plain
+    mean pooling without normalization (paraphrase-multilingual-MiniLM-L12-v2).
+    """
+
+    def __init__(self, model_dir: str, quantized: bool = False, threads: int = 0,
+                 max_seq_length: int = 128):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("EMBEDDING_BACKEND=onnx requires the 'onnxruntime' package") from e
+        from transformers import AutoTokenizer
+
+        model_path = os.path.join(model_dir, ONNX_QUANTIZED_FILE if quantized else ONNX_MODEL_FILE)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"{model_path} not found, run: python export_onnx.py export")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.inter_op_num_threads = 1
+        if threads:
+            options.intra_op_num_threads = threads
+
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_seq_length = max_seq_length
+        self._dimension = None
+
+    @property
+    def dimension(self) -> int:
+        """Embedding size: the output shape, or one probe sentence when the graph leaves it symbolic."""
+        if self._dimension is None:
+            size = self.session.get_outputs()[0].shape[-1]
+            self._dimension = size if isinstance(size, int) else self._encode_batch(['']).shape[1]
+        return self._dimension
+
+    def _encode_batch(self, sentences: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(
+            sentences, padding=True, truncation=True,
+            max_length=self.max_seq_length, return_tensors='np'
+        )
+        feeds = {name: encoded[name].astype(np.int64) for name in self.input_names if name in encoded}
+        token_embeddings = self.session.run(None, feeds)[0]
+        mask = encoded['attention_mask'][..., None].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        return summed / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32,
+               normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+        if not sentences:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        # Сортировка по длине уменьшает паддинг внутри батча
+        order = np.argsort([-len(s) for s in sentences], kind='stable')
+        chunks = []
+        for start in range(0, len(sentences), batch_size):
+            batch = [sentences[i] for i in order[start:start + batch_size]]
+            chunks.append(self._encode_batch(batch))
+        embeddings = np.empty((len(sentences), chunks[0].shape[1]), dtype=np.float32)
+        embeddings[order] = np.concatenate(chunks)
+        if normalize_embeddings:
+            embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings[0] if single else embeddings
+
+
+def load_torch_encoder(model_name: str = MODEL_NAME):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+def load_onnx_encoder():
+    return OnnxSentenceEncoder(
+        ONNX_SETTINGS['model_dir'],
+        quantized=ONNX_SETTINGS['quantized'],
+        threads=ONNX_SETTINGS['threads'],
+    )
+
+
+def _remote_client():
+    from inference_client import InferenceClient
+    return InferenceClient(INFERENCE_SOCKET)
+
+
+def load_encoder(backend: str = EMBEDDING_BACKEND, remote: bool = bool(INFERENCE_SOCKET)):
+    """Load the configured embedding backend (or a client of the inference server)."""
+    if remote:
+        from inference_client import RemoteEncoder
+        logger.info("Using inference server at %s for embeddings", INFERENCE_SOCKET)
+        return RemoteEncoder(_remote_client())
+    if backend == 'onnx':
+        encoder = load_onnx_encoder()
+    elif backend == 'torch':
+        encoder = load_torch_encoder()
+    else:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}")
+    logger.info("Loaded %s embedding backend for %s", backend, MODEL_NAME)
+    return encoder
+
+
+def attach_encoder(consumers: Sequence, loader=None) -> Optional[object]:
+    """Load the encoder and hand it to objects with an ``encoder`` attribute.
+
+    Until this returns, the consumers (IntentRouter, SearchIndex,
+    EmployeeSearch) work without embeddings. Afterwards ``warm_up`` runs
+    where there is one (rebuilding in this thread, while lookups go on with
+    the old state); other consumers that cache embeddings are invalidated.
+    Returns the encoder, or None if it failed to load.
+    """
+    import tracing
+
+    try:
+        encoder = tracing.instrument_model((loader or load_encoder)(), 'sentence_encoder')
+    except Exception:
+        logger.exception("Could not load the embedding model, continuing without embeddings")
+        return None
+    for consumer in consumers:
+        consumer.encoder = encoder
+        if hasattr(consumer, 'warm_up'):
+            try:
+                consumer.warm_up()
+                continue
+            except Exception:
+                logger.exception("Warm-up of %s failed, it will rebuild on first use", type(consumer).__name__)
+        if hasattr(consumer, 'invalidate'):
+            consumer.invalidate()
+    logger.info("Embedding model %s attached to %d consumers", MODEL_NAME, len(consumers))
+    return encoder
+
+
+def load_zero_shot_classifier(remote: bool = bool(INFERENCE_SOCKET)):
+    """BART-large-MNLI zero-shot pipeline (or a client of the inference server)."""
+    if remote:
+        from inference_client import RemoteZeroShotClassifier
+        logger.info("Using inference server at %s for zero-shot classification", INFERENCE_SOCKET)
+        return RemoteZeroShotClassifier(_remote_client())
+    import torch
+    from transformers import pipeline
+    return pipeline(
+        "zero-shot-classification",
+        model=NLI_MODEL_NAME,
+        device=0 if torch.cuda.is_available() else -1
+    )
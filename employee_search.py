@@ -0,0 +1,250 @@
+"""Two-stage employee search: lexical/skill candidates, then embedding rerank.
+
+Misspelled names, surnames, skills and departments in the query are corrected
+first (``fuzzy_index``, SymSpell lookups in microseconds).
+
+Stage 1 scores every active employee from memory, with no model call:
+
+  * BM25 over the employee fields (name, position, department, skills,
+    interests). Field weights come from EMPLOYEE_SEARCH_SETTINGS['field_weights'];
+  * an exact skill match: the share of skills named in the query ("Docker",
+    "докер", "k8s") that the employee has.
+
+The best ``candidates`` rows (about 200) go to stage 2. There they are
+encoded, through an LRU of vectors keyed by employee text, and scored by
+cosine similarity to the query. The final score mixes all three signals with
+configurable weights. So "кто знает Docker" puts Docker experts first even if
+someone else has a closer job title, and a query encodes at most
+``candidates`` rows instead of every employee.
+
+When stage 1 finds nothing (a pure paraphrase), the candidates are the rows
+whose vectors are already in the LRU plus at most ``candidates`` rows that are
+not. Only those with at least ``min_similarity`` are returned. Such a query
+never encodes more than stage 2 normally does, and the LRU covers more of the
+staff with each one. Without an encoder, such a query finds nothing.
+"""
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from config import EMPLOYEE_SEARCH_SETTINGS
+from models import Employee
+from snapshot import SnapshotIndex
+from fuzzy_index import FuzzyIndex
+from search_index import bm25_scores, build_postings
+from text_pipeline import WORD, QueryTokens, analyze, index_terms
+
+logger = logging.getLogger(__name__)
+
+# Написание в запросе -> навык, как он записан в Employee.skills (без учета регистра)
+SKILL_ALIASES = {
+    'питон': 'python', 'пайтон': 'python',
+    'джава': 'java',
+    'js': 'javascript', 'джаваскрипт': 'javascript',
+    'реакт': 'react',
+    'джанго': 'django',
+    'докер': 'docker',
+    'кубер': 'kubernetes', 'кубернетес': 'kubernetes', 'k8s': 'kubernetes',
+    'postgres': 'postgresql', 'постгрес': 'postgresql',
+    'монго': 'mongodb',
+    'селениум': 'selenium',
+    'питест': 'pytest',
+    'постман': 'postman',
+    'джира': 'jira',
+    'аджайл': 'agile',
+    'скрам': 'scrum',
+    'фастапи': 'fastapi',
+    'гит': 'git',
+    'линукс': 'linux',
+    'эксель': 'excel',
+    'фигма': 'figma',
+    'сео': 'seo',
+}
+
+# Слово запроса -> дополнительные слова для лексического этапа (роли и отделы на двух языках)
+QUERY_SYNONYMS = {
+    'программист': 'разработчик developer', 'кодить': 'разработчик developer',
+    'разработчик': 'developer', 'developer': 'разработчик',
+    'тестировщик': 'qa tester тестирование', 'qa': 'тестировщик',
+    'дизайнер': 'designer', 'designer': 'дизайнер',
+    'аналитик': 'analyst', 'analyst': 'аналитик',
+    'руководитель': 'lead head', 'начальник': 'руководитель lead head',
+    'айти': 'it', 'эйчар': 'hr', 'кадры': 'hr', 'персонал': 'hr',
+    'продажи': 'sales', 'продаж': 'sales',
+    'маркетинг': 'marketing', 'финансы': 'finance', 'поддержка': 'support', 'поддержки': 'support',
+}
+
+
+class EmployeeMatch(NamedTuple):
+    score: float
+    lexical: float  # BM25, нормированный на лучший результат
+    similarity: float
+    skill_match: float
+    employee_id: int
+
+
+def normalize_words(text: str) -> List[str]:
+    return WORD.findall((text or '').lower())
+
+
+def expand_query(tokens: QueryTokens) -> Tuple[List[str], FrozenSet[str]]:
+    """BM25 terms and n-grams of the query, plus those of its synonyms and skill aliases."""
+    extra = [QUERY_SYNONYMS[word] for word in tokens.words if word in QUERY_SYNONYMS]
+    extra += [SKILL_ALIASES[word] for word in tokens.words if word in SKILL_ALIASES]
+    if not extra:
+        return list(tokens.terms), tokens.ngrams
+    expansion = analyze(' '.join(extra))
+    return list(tokens.terms + expansion.terms), tokens.ngrams | expansion.ngrams
+
+
+def parse_skills(skills: Optional[str]) -> List[str]:
+    """Skills as normalized word sequences ("B2B-продажи" -> "b2b продажи"), matched against query n-grams."""
+    return [' '.join(normalize_words(skill)) for skill in (skills or '').split(',') if normalize_words(skill)]
+
+
+class _EmployeeRows(NamedTuple):
+    ids: np.ndarray
+    texts: List[str]  # текст для эмбеддинга
+    postings: Dict[str, tuple]
+    length_norm: np.ndarray
+    skills: Dict[str, np.ndarray]  # навык -> индексы строк
+
+
+class EmployeeSearch(SnapshotIndex):
+    """Stage 1 over all active employees in memory, stage 2 over the best candidates only."""
+
+    models = (Employee,)
+
+    def __init__(self, encoder=None, settings: dict = EMPLOYEE_SEARCH_SETTINGS):
+        super().__init__()  # _lock охраняет и пересборку, и LRU векторов
+        self.encoder = encoder
+        self.settings = settings
+        self._rows: Optional[_EmployeeRows] = None
+        self._vectors: 'OrderedDict[int, tuple]' = OrderedDict()  # employee id -> (text, vector)
+        self.encoded = 0  # сколько строк закодировано всего (для оценки и метрик)
+        self.fuzzy = FuzzyIndex(static_terms=SKILL_ALIASES)
+
+    def _rebuild(self, session: Session):
+        started = time.perf_counter()
+        rows = session.query(
+            Employee.id, Employee.name, Employee.surname, Employee.position,
+            Employee.department, Employee.skills, Employee.interests,
+        ).filter(Employee.is_active == True).all()
+        weights = self.settings['field_weights']
+        term_lists = []
+        skills: Dict[str, List[int]] = {}
+        for i, row in enumerate(rows):
+            terms = []
+            for field in ('name', 'surname', 'position', 'department', 'skills', 'interests'):
+                terms += index_terms(getattr(row, field)) * weights[field]
+            term_lists.append(terms)
+            for skill in parse_skills(row.skills):
+                skills.setdefault(skill, []).append(i)
+        postings, length_norm = build_postings(term_lists, self.settings['bm25_k1'], self.settings['bm25_b'])
+        self._rows = _EmployeeRows(
+            np.array([row.id for row in rows], dtype=np.int64),
+            [f"{row.name} {row.position} {row.department} {row.skills}" for row in rows],
+            postings, length_norm,
+            {skill: np.array(indices, dtype=np.int32) for skill, indices in skills.items()},
+        )
+        logger.info("Employee search index rebuilt: %d employees, %d skills in %.2fs",
+                    len(rows), len(skills), time.perf_counter() - started)
+
+    @staticmethod
+    def _query_skills(rows: _EmployeeRows, ngrams: FrozenSet[str]) -> List[str]:
+        return sorted(ngram for ngram in ngrams if ngram in rows.skills)
+
+    def _fallback_candidates(self, rows: _EmployeeRows) -> np.ndarray:
+        """Rows with a cached vector, plus the first ``candidates`` rows that still need encoding."""
+        cached, uncached = [], []
+        with self._lock:
+            for i, (employee_id, text) in enumerate(zip(rows.ids, rows.texts)):
+                vector = self._vectors.get(int(employee_id))
+                if vector is not None and vector[0] == text:
+                    cached.append(i)
+                elif len(uncached) < self.settings['candidates']:
+                    uncached.append(i)
+        return np.array(sorted(cached + uncached), dtype=np.int64)
+
+    def _vectors_for(self, rows: _EmployeeRows, indices: np.ndarray) -> np.ndarray:
+        """Vectors of the given rows; only rows missing from the LRU (or edited since) are encoded."""
+        texts = [rows.texts[i] for i in indices]
+        ids = [int(rows.ids[i]) for i in indices]
+        vectors: List[Optional[np.ndarray]] = []
+        with self._lock:
+            for employee_id, text in zip(ids, texts):
+                cached = self._vectors.get(employee_id)
+                if cached is not None and cached[0] == text:
+                    self._vectors.move_to_end(employee_id)
+                    vectors.append(cached[1])
+                else:
+                    vectors.append(None)
+        missing = [j for j, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Кодируем вне блокировки: параллельные запросы не ждут друг друга
+            encoded = np.asarray(self.encoder.encode([texts[j] for j in missing]), dtype=np.float32)
+            encoded /= np.clip(np.linalg.norm(encoded, axis=1, keepdims=True), 1e-9, None)
+            with self._lock:
+                for j, vector in zip(missing, encoded):
+                    vectors[j] = vector
+                    self._vectors[ids[j]] = (texts[j], vector)
+                while len(self._vectors) > self.settings['vector_cache_size']:
+                    self._vectors.popitem(last=False)
+                self.encoded += len(missing)
+        return np.stack(vectors)
+
+    def search(self, session: Session, query: str, limit: Optional[int] = None,
+               weights: Optional[Dict[str, float]] = None) -> List[EmployeeMatch]:
+        """Ranked matches; ``weights`` overrides the lexical/embedding/skill fusion weights."""
+        self.ensure_fresh(session)
+        rows = self._rows
+        if rows is None or not len(rows.ids):
+            return []
+        weights = dict(self.settings['weights'], **(weights or {}))
+        # Опечатки в именах, фамилиях, навыках и отделах исправляются до поиска ("Марiя", "питн")
+        self.fuzzy.ensure_fresh(session)
+        query, corrections = self.fuzzy.correct_query(query)
+        if corrections:
+            logger.debug("Corrected %s", ', '.join(f"{word} -> {match.term}" for word, match in corrections))
+        terms, ngrams = expand_query(analyze(query))
+
+        # Этап 1: BM25 и точное совпадение навыков по всем сотрудникам, без модели
+        lexical = bm25_scores(rows.postings, rows.length_norm, terms, self.settings['bm25_k1'])
+        top = float(lexical.max())
+        if top > 0:
+            lexical /= top
+        skill_match = np.zeros_like(lexical)
+        query_skills = self._query_skills(rows, ngrams)
+        for skill in query_skills:
+            skill_match[rows.skills[skill]] += 1.0 / len(query_skills)
+        first_stage = weights['lexical'] * lexical + weights['skill'] * skill_match
+        use_embeddings = self.encoder is not None and weights['embedding'] > 0
+        candidates = np.flatnonzero(first_stage > 0)
+        if not len(candidates):
+            if not use_embeddings:
+                return []
+            candidates = self._fallback_candidates(rows)
+        elif len(candidates) > self.settings['candidates']:
+            top_k = np.argpartition(-first_stage[candidates], self.settings['candidates'] - 1)
+            candidates = candidates[top_k[:self.settings['candidates']]]
+
+        # Этап 2: эмбеддинги только для кандидатов
+        similarity = np.zeros(len(candidates), dtype=np.float32)
+        if use_embeddings:
+            vector = np.asarray(self.encoder.encode(query), dtype=np.float32)
+            vector /= max(float(np.linalg.norm(vector)), 1e-9)
+            similarity = self._vectors_for(rows, candidates) @ vector
+            # Без лексического совпадения сотрудник остается, только если он достаточно близок по смыслу
+            keep = (first_stage[candidates] > 0) | (similarity >= self.settings['min_similarity'])
+            candidates, similarity = candidates[keep], similarity[keep]
+        scores = first_stage[candidates] + weights['embedding'] * similarity
+        order = np.argsort(-scores, kind='stable')[:limit] if limit else np.argsort(-scores, kind='stable')
+        return [
+            EmployeeMatch(float(scores[j]), float(lexical[candidates[j]]), float(similarity[j]),
+                          float(skill_match[candidates[j]]), int(rows.ids[candidates[j]]))
+            for j in order
+        ]
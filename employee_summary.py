@@ -0,0 +1,287 @@
+"""Materialized per-employee read model (``models.EmployeeSummary``).
+
+There is one row per employee, holding denormalized counters: open tasks and
+the nearest due date, and upcoming events and activities with the next start
+time and title. Directory and availability listings read this table with one
+indexed scan. They no longer join tasks, events and activities per person.
+
+The table is maintained incrementally:
+
+  * ``before_flush`` collects the employees touched by the flushed tasks,
+    events, activities and employees: old and new assignees, and
+    participants added or removed;
+  * ``after_flush`` recomputes only those rows, on the flush connection, so
+    the summary commits or rolls back together with the write.
+
+Core bulk inserts bypass the ORM, so generate_data.py calls ``rebuild``
+afterwards. ``init_db`` fills an empty table once (``backfill``).
+
+"Upcoming" depends on the clock. Before a listing is read, ``refresh_expired``
+recomputes the rows whose next event or activity has already started. It finds
+them with a range scan on the indexed next_event_at / next_activity_at and
+writes them in its own transaction on the primary, so reading a listing never
+commits the caller's session.
+
+Usage:
+    python employee_summary.py --database-url sqlite:///eval.db --rebuild
+    python employee_summary.py --database-url sqlite:///eval.db --bench
+"""
+import logging
+import time
+from datetime import datetime
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import pytz
+from sqlalchemy import delete, event, func, inspect, insert, or_, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+import cli
+from config import TIMEZONE
+from models import (
+    Activity, Employee, EmployeeSummary, Event, Task, TaskStatus,
+    activity_participants, event_participants
+)
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+PENDING_KEY = 'employee_summary_pending'
+summary_table = EmployeeSummary.__table__
+
+# (модель, таблица участников, ее внешний ключ, дополнительное условие, поля сводки)
+UPCOMING_SOURCES = (
+    (Event, event_participants, event_participants.c.event_id, Event.status == 'active',
+     ('upcoming_events', 'next_event_at', 'next_event_title')),
+    (Activity, activity_participants, activity_participants.c.activity_id, Activity.status == 'active',
+     ('upcoming_activities', 'next_activity_at', 'next_activity_title')),
+)
+
+
+def local_now() -> datetime:
+    # Время в БД хранится без часового пояса, в TIMEZONE
+    return datetime.now(pytz.timezone(TIMEZONE)).replace(tzinfo=None)
+
+
+def _chunks(ids: Sequence[int], size: int = CHUNK_SIZE) -> Iterable[Sequence[int]]:
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def compute_rows(conn: Connection, employee_ids: Optional[Sequence[int]], now: datetime) -> List[dict]:
+    """Summary rows for the given employees (``None``: all of them), four queries in total."""
+    def only(column):
+        return column.in_(employee_ids) if employee_ids is not None else column.isnot(None)
+
+    rows: Dict[int, dict] = {}
+    for row in conn.execute(select(
+        Employee.id, Employee.name, Employee.surname, Employee.position, Employee.department, Employee.is_active
+    ).where(only(Employee.id))):
+        rows[row.id] = {
+            'employee_id': row.id, 'name': row.name, 'surname': row.surname, 'position': row.position,
+            'department': row.department, 'is_active': row.is_active,
+            'open_tasks': 0, 'next_due_date': None,
+            'upcoming_events': 0, 'next_event_at': None, 'next_event_title': None,
+            'upcoming_activities': 0, 'next_activity_at': None, 'next_activity_title': None,
+            'updated_at': now,
+        }
+    for assignee_id, count, next_due in conn.execute(
+        select(Task.assignee_id, func.count(Task.id), func.min(Task.due_date))
+        .where(Task.status != TaskStatus.DONE, only(Task.assignee_id))
+        .group_by(Task.assignee_id)
+    ):
+        if assignee_id in rows:
+            rows[assignee_id].update(open_tasks=count, next_due_date=next_due)
+    for model, participants, foreign_key, condition, (count_key, at_key, title_key) in UPCOMING_SOURCES:
+        query = (
+            select(participants.c.employee_id, model.start_time, model.title)
+            .join(model, model.id == foreign_key)
+            .where(model.start_time >= now, only(participants.c.employee_id))
+        )
+        if condition is not None:
+            query = query.where(condition)
+        for employee_id, start_time, title in conn.execute(query):
+            row = rows.get(employee_id)
+            if row is None:
+                continue
+            row[count_key] += 1
+            if row[at_key] is None or start_time < row[at_key]:
+                row[at_key], row[title_key] = start_time, title
+    return list(rows.values())
+
+
+def refresh(conn: Connection, employee_ids: Iterable[int], now: Optional[datetime] = None) -> int:
+    """Recompute the summary rows of these employees; rows of deleted employees disappear."""
+    now = now or local_now()
+    ids = sorted(set(employee_ids))
+    for chunk in _chunks(ids):
+        rows = compute_rows(conn, chunk, now)
+        conn.execute(delete(summary_table).where(summary_table.c.employee_id.in_(chunk)))
+        if rows:
+            conn.execute(insert(summary_table), rows)
+    return len(ids)
+
+
+def rebuild(bind: Engine, now: Optional[datetime] = None) -> int:
+    """Recompute the whole table in one transaction."""
+    started = time.perf_counter()
+    with bind.begin() as conn:
+        rows = compute_rows(conn, None, now or local_now())
+        conn.execute(delete(summary_table))
+        for start in range(0, len(rows), CHUNK_SIZE):
+            conn.execute(insert(summary_table), rows[start:start + CHUNK_SIZE])
+    logger.info("Employee summary rebuilt: %d rows in %.2fs", len(rows), time.perf_counter() - started)
+    return len(rows)
+
+
+def backfill(bind: Engine):
+    """Fill the table once for databases created before it existed."""
+    with bind.connect() as conn:
+        has_summary = conn.execute(select(summary_table.c.employee_id).limit(1)).first() is not None
+        has_employees = conn.execute(select(Employee.id).limit(1)).first() is not None
+    if has_employees and not has_summary:
+        rebuild(bind)
+
+
+def refresh_expired(bind: Engine, now: Optional[datetime] = None) -> int:
+    """Recompute rows whose next event or activity has already started, in one transaction on ``bind``."""
+    now = now or local_now()
+    with bind.begin() as conn:
+        expired = conn.execute(
+            select(summary_table.c.employee_id).where(
+                or_(summary_table.c.next_event_at < now, summary_table.c.next_activity_at < now)
+            )
+        ).scalars().all()
+        if expired:
+            refresh(conn, expired, now)
+    return len(expired)
+
+
+def _active(session: Session, department: Optional[str], *columns):
+    query = session.query(*columns).filter(EmployeeSummary.is_active == True)
+    return query.filter(EmployeeSummary.department == department) if department else query
+
+
+def listing(session: Session, department: Optional[str] = None, now: Optional[datetime] = None,
+            limit: Optional[int] = None) -> List[EmployeeSummary]:
+    """Active employees with their counters, ordered by department and surname (ix_employee_summary_listing)."""
+    # session.bind - основная БД (get_bind() закрепил бы сессию за ней и для чтений); сессия вызывающего не коммитится
+    refresh_expired(session.bind or session.get_bind(), now)
+    query = _active(session, department, EmployeeSummary)
+    return query.order_by(EmployeeSummary.department, EmployeeSummary.surname, EmployeeSummary.name).limit(limit).all()
+
+
+def active_count(session: Session, department: Optional[str] = None) -> int:
+    """How many rows ``listing`` would return without a limit."""
+    return _active(session, department, func.count(EmployeeSummary.employee_id)).scalar()
+
+
+# --- incremental maintenance ----------------------------------------------
+
+def _history_ids(obj, attribute: str) -> List[int]:
+    """Employees removed from a relationship in this flush (participants taken off an event)."""
+    return [value.id for value in inspect(obj).attrs[attribute].history.deleted or () if value is not None]
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_touched(session, flush_context, instances):
+    touched = []  # объекты: id сотрудника известен только после flush (новые записи)
+    previous = set()
+    stored_tasks = []
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Employee):
+            touched.append(obj)
+        elif isinstance(obj, Task):
+            touched.append(obj)
+            if obj.id is not None:
+                stored_tasks.append(obj.id)
+        elif isinstance(obj, (Event, Activity)):
+            touched.extend(obj.participants)
+            previous.update(_history_ids(obj, 'participants'))
+    if stored_tasks:
+        # Прежний исполнитель берется из БД: у истекшего после commit объекта в истории атрибута его нет
+        previous.update(session.execute(
+            select(Task.assignee_id).where(Task.id.in_(stored_tasks))
+        ).scalars())
+    if touched or previous:
+        pending = session.info.setdefault(PENDING_KEY, ([], set()))
+        pending[0].extend(touched)
+        pending[1].update(previous)
+
+
+@event.listens_for(Session, 'after_flush')
+def _refresh_touched(session, flush_context):
+    pending = session.info.pop(PENDING_KEY, None)
+    if not pending:
+        return
+    touched, employee_ids = pending
+    for obj in touched:
+        employee_ids.add(obj.assignee_id if isinstance(obj, Task) else obj.id)
+    employee_ids.discard(None)
+    if employee_ids:
+        refresh(session.connection(), employee_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_touched(session):
+    session.info.pop(PENDING_KEY, None)
+
+
+@event.listens_for(Employee, 'before_delete')
+def _delete_summary(mapper, connection, target):
+    # Строка сводки ссылается на сотрудника: after_flush удалил бы ее уже после DELETE FROM employees,
+    # а это нарушение внешнего ключа (Postgres; в схемах, созданных до ON DELETE CASCADE)
+    connection.execute(delete(summary_table).where(summary_table.c.employee_id == target.id))
+
+
+def main():
+    parser = cli.parser(__doc__, bench='compare the availability listing with per-employee joins')
+    parser.add_argument('--rebuild', action='store_true', help='recompute the whole table')
+    args = parser.parse_args()
+    from datetime import timedelta
+
+    bind = cli.connect(args)
+    if args.rebuild:
+        rebuild(bind)
+    if not args.bench:
+        return
+    session = Session(bind=bind)
+    try:
+        now = local_now()
+        started = time.perf_counter()
+        employees = session.query(Employee).filter(Employee.is_active == True).all()
+        busy = 0
+        for emp in employees:  # как search_availability до сводки: запрос на каждого сотрудника
+            events = session.query(Event).join(Event.participants).filter(
+                Employee.id == emp.id, Event.start_time >= now, Event.end_time <= now + timedelta(days=7)
+            ).all()
+            session.query(func.count(Task.id)).filter(
+                Task.assignee_id == emp.id, Task.status != TaskStatus.DONE
+            ).scalar()
+            busy += bool(events)
+        joins = time.perf_counter() - started
+        session.expunge_all()
+        started = time.perf_counter()
+        rows = listing(session, now=now)
+        summary_busy = sum(1 for row in rows if row.next_event_at and row.next_event_at <= now + timedelta(days=7))
+        scan = time.perf_counter() - started
+        print(f"{len(employees)} active employees")
+        print(f"per-employee joins: {joins * 1000:8.1f} ms ({2 * len(employees) + 1} queries), busy this week: {busy}")
+        print(f"summary scan:       {scan * 1000:8.1f} ms (2 queries), busy this week: {summary_busy}")
+
+        employee = employees[0]
+        session.add(Task(title='bench', assignee_id=employee.id, status=TaskStatus.TODO))
+        started = time.perf_counter()
+        session.flush()
+        flushed = time.perf_counter() - started
+        summary = session.get(EmployeeSummary, employee.id)
+        session.refresh(summary)
+        print(f"flush of one task incl. summary refresh: {flushed * 1000:.1f} ms, open tasks now {summary.open_tasks}")
+        session.rollback()
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""Offline relevance and latency evaluation of employee search.
+
+Runs labelled queries against a database (e.g. one made by generate_data.py)
+and compares:
+
+  * dense:     the old telegram_bot search, encode every active employee per query;
+  * substring: the old bot.py search, any query word as a substring of a field;
+  * two-stage: employee_search.EmployeeSearch (lexical/skill candidates + rerank).
+
+A query's relevant employees are the ones whose field contains the label value
+("кто знает Docker" -> skills contains Docker), so the labels hold for any
+generated dataset. Reported: P@5, nDCG@10, MRR, latency and rows encoded per
+query.
+
+The real encoder (EMBEDDING_BACKEND) is used when it loads. ``--encoder
+hashing`` swaps in a character-trigram hashing encoder, so the relative
+comparison also runs where the model is not installed.
+
+Usage:
+    python generate_data.py --employees 5000 --database-url sqlite:///eval.db --reset
+    python evaluate_search.py --database-url sqlite:///eval.db
+    python evaluate_search.py --database-url sqlite:///eval.db --encoder hashing --weights skill=0.6,embedding=0.1
+"""
+import math
+import os
+import re
+import statistics
+import time
+import zlib
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+
+import cli
+
+# (запрос, поле Employee, значение, которое должно в нем встречаться)
+LABELLED_QUERIES = [
+    ('кто знает Docker', 'skills', 'Docker'),
+    ('нужен специалист по кубер', 'skills', 'Kubernetes'),
+    ('питон разработчик', 'skills', 'Python'),
+    ('кто пишет на React', 'skills', 'React'),
+    ('кто умеет работать в фигма', 'skills', 'Figma'),
+    ('кто хорошо ведет переговоры', 'skills', 'Переговоры'),
+    ('кто занимается рекрутингом', 'skills', 'Рекрутинг'),
+    ('эксперт по МСФО', 'skills', 'МСФО'),
+    ('кто работает с Zendesk', 'skills', 'Zendesk'),
+    ('кто знает машинное обучение', 'skills', 'Машинное обучение'),
+    ('тестировщик', 'position', 'Тестировщик'),
+    ('найди маркетолога', 'position', 'Маркетолог'),
+    ('бухгалтер', 'position', 'Бухгалтер'),
+    ('сотрудники отдела продаж', 'department', 'Sales'),
+    ('кто любит шахматы', 'interests', 'шахматы'),
+    ('кто играет в теннис', 'interests', 'теннис'),
+    # опечатки и смешанный алфавит
+    ('кто знает докр', 'skills', 'Docker'),
+    ('специалист по Kubernets', 'skills', 'Kubernetes'),
+    ('кто умеет в Seleniun', 'skills', 'Selenium'),
+    ('бюджетированье', 'skills', 'Бюджетирование'),
+]
+
+
+class HashingEncoder:
+    """Character-trigram hashing "embeddings": a stand-in with some sense of spelling."""
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _vector(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in re.findall(r'\w+', text.lower()):
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                vector[zlib.crc32(padded[i:i + 3].encode('utf-8')) % self.dim] += 1.0
+        return vector
+
+    def encode(self, sentences, **kwargs):
+        if isinstance(sentences, str):
+            return self._vector(sentences)
+        return np.stack([self._vector(sentence) for sentence in sentences])
+
+
+def relevant_ids(rows, field: str, value: str) -> set:
+    value = value.lower()
+    return {row.id for row in rows if value in (getattr(row, field) or '').lower()}
+
+
+def metrics(ranked: Sequence[int], relevant: set) -> Dict[str, float]:
+    hits = [employee_id in relevant for employee_id in ranked]
+    dcg = sum(1 / math.log2(i + 2) for i, hit in enumerate(hits[:10]) if hit)
+    ideal = sum(1 / math.log2(i + 2) for i in range(min(10, len(relevant))))
+    first = next((i for i, hit in enumerate(hits) if hit), None)
+    return {
+        'p@5': sum(hits[:5]) / 5,
+        'ndcg@10': dcg / ideal if ideal else 0.0,
+        'mrr': 1 / (first + 1) if first is not None else 0.0,
+    }
+
+
+def dense_search(encoder, rows, counter: List[int]) -> Callable[[str], List[int]]:
+    """Old telegram_bot.search_employees: every row encoded for every query."""
+    def search(query: str) -> List[int]:
+        texts = [f"{row.name} {row.position} {row.department} {row.skills}" for row in rows]
+        matrix = np.asarray(encoder.encode(texts), dtype=np.float32)
+        counter[0] += len(texts)
+        matrix /= np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-9, None)
+        vector = np.asarray(encoder.encode(query), dtype=np.float32)
+        vector /= max(float(np.linalg.norm(vector)), 1e-9)
+        order = np.argsort(-(matrix @ vector), kind='stable')[:20]
+        return [rows[i].id for i in order]
+    return search
+
+
+def substring_search(rows) -> Callable[[str], List[int]]:
+    """Old bot.py fallback: any query word as a substring of any field, in table order."""
+    def search(query: str) -> List[int]:
+        words = [word for word in query.lower().split() if len(word) > 3]
+        found = []
+        for row in rows:
+            haystack = ' '.join(filter(None, (row.name, row.position, row.department, row.skills, row.interests)))
+            if any(word in haystack.lower() for word in words):
+                found.append(row.id)
+                if len(found) == 20:
+                    break
+        return found
+    return search
+
+
+def two_stage_search(session, engine) -> Callable[[str], List[int]]:
+    def search(query: str) -> List[int]:
+        return [match.employee_id for match in engine.search(session, query, limit=20)]
+    return search
+
+
+def evaluate(name: str, search: Callable[[str], List[int]], rows, encoded_rows: Callable[[], int]) -> None:
+    scores = {'p@5': [], 'ndcg@10': [], 'mrr': []}
+    latencies = []
+    encoded_before = encoded_rows()
+    for query, field, value in LABELLED_QUERIES:
+        started = time.perf_counter()
+        ranked = search(query)
+        latencies.append(time.perf_counter() - started)
+        for key, score in metrics(ranked, relevant_ids(rows, field, value)).items():
+            scores[key].append(score)
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+    encoded = (encoded_rows() - encoded_before) / len(LABELLED_QUERIES)
+    print(f"{name:<10} {statistics.mean(scores['p@5']):>6.2f} {statistics.mean(scores['ndcg@10']):>8.2f} "
+          f"{statistics.mean(scores['mrr']):>6.2f} {statistics.mean(latencies) * 1000:>9.1f} "
+          f"{p95 * 1000:>8.1f} {encoded:>13.0f}")
+
+
+def parse_weights(text: str) -> Dict[str, float]:
+    weights = {}
+    for item in filter(None, text.split(',')):
+        key, _, value = item.partition('=')
+        weights[key.strip()] = float(value)
+    return weights
+
+
+def main():
+    parser = cli.parser(__doc__)
+    parser.add_argument('--encoder', choices=['model', 'hashing'], default='model')
+    parser.add_argument('--weights', default='', help='fusion overrides, e.g. lexical=0.3,skill=0.4,embedding=0.3')
+    parser.add_argument('--candidates', type=int, default=None, help='stage 1 candidate count')
+    parser.add_argument('--skip-dense', action='store_true', help='skip the encode-everything baseline')
+    args = parser.parse_args()
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+
+    from config import EMPLOYEE_SEARCH_SETTINGS
+    from employee_search import EmployeeSearch
+    from models import Employee, get_session
+
+    if args.encoder == 'hashing':
+        encoder = HashingEncoder()
+    else:
+        from embeddings import load_encoder
+        encoder = load_encoder()
+
+    settings = dict(EMPLOYEE_SEARCH_SETTINGS, weights=dict(EMPLOYEE_SEARCH_SETTINGS['weights'],
+                                                           **parse_weights(args.weights)))
+    if args.candidates:
+        settings['candidates'] = args.candidates
+
+    session = get_session()
+    try:
+        rows = session.query(
+            Employee.id, Employee.name, Employee.surname, Employee.position,
+            Employee.department, Employee.skills, Employee.interests,
+        ).filter(Employee.is_active == True).all()
+        engine = EmployeeSearch(encoder=encoder, settings=settings)
+        engine.ensure_fresh(session)
+        dense_counter = [0]
+        print(f"{len(rows)} active employees, {len(LABELLED_QUERIES)} labelled queries, "
+              f"encoder: {args.encoder}, weights: {settings['weights']}, candidates: {settings['candidates']}")
+        print(f"{'method':<10} {'P@5':>6} {'nDCG@10':>8} {'MRR':>6} {'mean ms':>9} {'p95 ms':>8} {'encoded/query':>13}")
+        if not args.skip_dense:
+            evaluate('dense', dense_search(encoder, rows, dense_counter), rows, lambda: dense_counter[0])
+        evaluate('substring', substring_search(rows), rows, lambda: 0)
+        evaluate('two-stage', two_stage_search(session, engine), rows, lambda: engine.encoded)
+        # Второй проход: векторы кандидатов уже в LRU, как у работающего бота
+        evaluate('two-stage*', two_stage_search(session, engine), rows, lambda: engine.encoded)
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Export, quantize and verify the ONNX version of the sentence-embedding model.
+
+Usage:
+    python export_onnx.py export            # model.onnx + tokenizer into ONNX_MODEL_DIR
+    python export_onnx.py quantize          # model.int8.onnx (dynamic int8 weights)
+    python export_onnx.py verify [--quantized] [--min-cosine 0.99]
+    python export_onnx.py bench [--quantized]
+
+``verify`` is the equivalence check: it embeds a fixed bilingual sentence set
+with both PyTorch and ONNX Runtime and fails if any pair of vectors has a
+cosine similarity below ``--min-cosine``.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+from config import MODEL_NAME, ONNX_SETTINGS
+from embeddings import ONNX_MODEL_FILE, ONNX_QUANTIZED_FILE, OnnxSentenceEncoder, load_torch_encoder
+
+logger = logging.getLogger(__name__)
+
+VERIFY_SENTENCES = [
+    "Кто знает Python?",
+    "Какие мероприятия на этой неделе?",
+    "Покажи мои задачи",
+    "Какие активности сегодня?",
+    "Когда день рождения у Марии?",
+    "Кто свободен для встречи?",
+    "поиск сотрудника",
+    "информация о мероприятии",
+    "Who is responsible for the Docker migration?",
+    "Иван Иванов Разработчик IT Python, SQL, Docker",
+    "Правила работы в компании: рабочий день с 9:00 до 18:00, обед с 13:00 до 14:00",
+    "а на следующей неделе?",
+]
+
+
+def export(model_dir: str, opset: int = 14):
+    import torch
+
+    os.makedirs(model_dir, exist_ok=True)
+    sentence_model = load_torch_encoder(MODEL_NAME)
+    transformer = sentence_model[0].auto_model.eval()
+    tokenizer = sentence_model.tokenizer
+    sample = tokenizer(["пример запроса"], return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+
+    path = os.path.join(model_dir, ONNX_MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in input_names),
+            path,
+            input_names=input_names,
+            output_names=['last_hidden_state'],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+    tokenizer.save_pretrained(model_dir)
+    logger.info("Exported %s to %s", MODEL_NAME, path)
+
+
+def quantize(model_dir: str):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    source = os.path.join(model_dir, ONNX_MODEL_FILE)
+    target = os.path.join(model_dir, ONNX_QUANTIZED_FILE)
+    quantize_dynamic(source, target, weight_type=QuantType.QInt8)
+    logger.info("Quantized %s -> %s (%.1f MB -> %.1f MB)", source, target,
+                os.path.getsize(source) / 2**20, os.path.getsize(target) / 2**20)
+
+
+def cosine_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+def verify(model_dir: str, quantized: bool, min_cosine: float, threads: int) -> bool:
+    reference = load_torch_encoder(MODEL_NAME).encode(VERIFY_SENTENCES, convert_to_numpy=True)
+    candidate = OnnxSentenceEncoder(model_dir, quantized=quantized, threads=threads).encode(VERIFY_SENTENCES)
+    cosines = cosine_rows(reference, candidate)
+    for sentence, cosine in zip(VERIFY_SENTENCES, cosines):
+        logger.info("%.5f  %s", cosine, sentence)
+    logger.info("min cosine %.5f, mean cosine %.5f (threshold %.3f)", cosines.min(), cosines.mean(), min_cosine)
+    return bool(cosines.min() >= min_cosine)
+
+
+def bench(model_dir: str, quantized: bool, threads: int, rounds: int = 20):
+    sentences = VERIFY_SENTENCES * 8
+    encoders = {
+        'torch': load_torch_encoder(MODEL_NAME),
+        'onnx-int8' if quantized else 'onnx': OnnxSentenceEncoder(model_dir, quantized=quantized, threads=threads),
+    }
+    for name, encoder in encoders.items():
+        encoder.encode(sentences)  # прогрев
+        started = time.perf_counter()
+        for _ in range(rounds):
+            encoder.encode(sentences)
+        elapsed = time.perf_counter() - started
+        logger.info("%-10s %8.1f sentences/s", name, rounds * len(sentences) / elapsed)
+
+
+def main():
+    logging.basicConfig(format='%(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['export', 'quantize', 'verify', 'bench'])
+    parser.add_argument('--model-dir', default=ONNX_SETTINGS['model_dir'])
+    parser.add_argument('--quantized', action=argparse.BooleanOptionalAction, default=ONNX_SETTINGS['quantized'],
+                        help='int8 model (default: ONNX_QUANTIZED); --no-quantized for fp32')
+    parser.add_argument('--threads', type=int, default=ONNX_SETTINGS['threads'])
+    parser.add_argument('--min-cosine', type=float, default=None,
+                        help='default: 0.999 for fp32, 0.98 for int8')
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        export(args.model_dir)
+    elif args.command == 'quantize':
+        quantize(args.model_dir)
+    elif args.command == 'verify':
+        min_cosine = args.min_cosine or (0.98 if args.quantized else 0.999)
+        if not verify(args.model_dir, args.quantized, min_cosine, args.threads):
+            sys.exit(1)
+    else:
+        bench(args.model_dir, args.quantized, args.threads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+"""Fake Telegram Bot API for load-testing the outbound dispatcher.
+
+The server implements ``getMe`` and ``sendMessage`` and enforces Telegram's
+flood limits: 30 messages/s per bot, 1 message/s per private chat and 20
+messages/min per group. Requests over a limit get HTTP 429 with
+``retry_after``, the same way the real API answers.
+
+Usage:
+    # standalone server, point the bot at it with TELEGRAM_API_BASE_URL=http://127.0.0.1:8081/bot
+    python fake_bot_api.py serve --port 8081
+
+    # drive the dispatcher (or naive concurrent sends) against an in-process server
+    python fake_bot_api.py drive --chats 200 --messages 600 --interactive 50
+    python fake_bot_api.py drive --naive
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import statistics
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Deque, Dict
+from urllib.parse import parse_qs
+
+GLOBAL_LIMIT = (30, 1.0)
+PRIVATE_CHAT_LIMIT = (1, 1.0)
+GROUP_CHAT_LIMIT = (20, 60.0)
+
+
+class FloodControl:
+    """Sliding-window limits per bot and per chat (``enforce=False`` only counts)."""
+
+    def __init__(self, enforce: bool = True):
+        self.enforce = enforce
+        self.lock = threading.Lock()
+        self.global_window: Deque[float] = deque()
+        self.chat_windows: Dict[int, Deque[float]] = defaultdict(deque)
+        self.accepted = 0
+        self.rejected = 0
+        self.per_chat_order: Dict[int, list] = defaultdict(list)
+
+    @staticmethod
+    def _retry_after(window: Deque[float], limit: int, period: float, now: float) -> int:
+        while window and window[0] <= now - period:
+            window.popleft()
+        if len(window) < limit:
+            return 0
+        return max(1, math.ceil(window[0] + period - now))
+
+    def check(self, chat_id: int, text: str) -> int:
+        """Return 0 and record the message if allowed, otherwise the retry_after in seconds."""
+        now = time.monotonic()
+        chat_limit, chat_period = GROUP_CHAT_LIMIT if chat_id < 0 else PRIVATE_CHAT_LIMIT
+        with self.lock:
+            chat_window = self.chat_windows[chat_id]
+            retry_after = self.enforce and max(
+                self._retry_after(self.global_window, *GLOBAL_LIMIT, now),
+                self._retry_after(chat_window, chat_limit, chat_period, now),
+            )
+            if retry_after:
+                self.rejected += 1
+                return retry_after
+            if self.enforce:
+                self.global_window.append(now)
+                chat_window.append(now)
+            self.accepted += 1
+            self.per_chat_order[chat_id].append(text)
+            return 0
+
+
+def make_handler(flood: FloodControl):
+    message_ids = iter(range(1, 1 << 62))
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _params(self) -> dict:
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0)).decode('utf-8')
+            if 'application/json' in (self.headers.get('Content-Type') or ''):
+                return json.loads(body or '{}')
+            return {key: values[0] for key, values in parse_qs(body).items()}
+
+        def _reply(self, status: int, payload: dict):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            method = self.path.rsplit('/', 1)[-1]
+            params = self._params()
+            if method == 'getMe':
+                self._reply(200, {'ok': True, 'result': {
+                    'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot',
+                }})
+            elif method == 'sendMessage':
+                chat_id = int(params['chat_id'])
+                text = params.get('text', '')
+                retry_after = flood.check(chat_id, text)
+                if retry_after:
+                    self._reply(429, {
+                        'ok': False, 'error_code': 429,
+                        'description': f'Too Many Requests: retry after {retry_after}',
+                        'parameters': {'retry_after': retry_after},
+                    })
+                    return
+                self._reply(200, {'ok': True, 'result': {
+                    'message_id': next(message_ids), 'date': int(time.time()), 'text': text,
+                    'chat': {'id': chat_id, 'type': 'group' if chat_id < 0 else 'private'},
+                }})
+            else:
+                self._reply(200, {'ok': True, 'result': True})
+
+        do_GET = do_POST
+
+    return Handler
+
+
+def start_server(port: int = 0, enforce: bool = True):
+    flood = FloodControl(enforce)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(flood))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, flood
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def drive(args):
+    from telegram import Bot
+    from telegram.request import HTTPXRequest
+
+    from outbound import OutboundDispatcher, Priority
+
+    server, flood = start_server()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}/bot'
+    bot = Bot('0:fake', base_url=base_url, request=HTTPXRequest(connection_pool_size=32))
+    await bot.initialize()
+
+    rng = random.Random(args.seed)
+    chats = [rng.randrange(10_000, 10_000_000) for _ in range(args.chats)]
+    if args.groups:
+        chats[:args.groups] = [-chat for chat in chats[:args.groups]]
+    bulk = [(rng.choice(chats), f'bulk {i}') for i in range(args.messages)]
+    interactive_latency = []
+
+    started = time.perf_counter()
+    if args.naive:
+        async def send(chat_id, text):
+            try:
+                await bot.send_message(chat_id=chat_id, text=text)
+            except Exception:
+                pass
+        await asyncio.gather(*(send(chat_id, text) for chat_id, text in bulk))
+    else:
+        dispatcher = OutboundDispatcher(bot)
+        dispatcher.start()
+        futures = [await dispatcher.send(chat_id, text) for chat_id, text in bulk]
+
+        async def interactive(i):
+            # Пользователи пишут боту во время массовой рассылки
+            await asyncio.sleep(rng.uniform(0, args.spread))
+            queued = time.perf_counter()
+            await (await dispatcher.send(rng.randrange(10_000_000, 20_000_000), f'reply {i}',
+                                         priority=Priority.INTERACTIVE))
+            interactive_latency.append(time.perf_counter() - queued)
+
+        await asyncio.gather(*futures, *(interactive(i) for i in range(args.interactive)))
+        await dispatcher.stop()
+    elapsed = time.perf_counter() - started
+    await bot.shutdown()
+    server.shutdown()
+
+    out_of_order = sum(
+        1 for texts in flood.per_chat_order.values()
+        for a, b in zip(texts, texts[1:])
+        if a.startswith('bulk') and b.startswith('bulk') and int(a.split()[1]) > int(b.split()[1])
+    )
+    print(f"mode:            {'naive gather' if args.naive else 'OutboundDispatcher'}")
+    print(f"delivered:       {flood.accepted} / {len(bulk) + (0 if args.naive else args.interactive)}")
+    print(f"429 responses:   {flood.rejected}")
+    print(f"elapsed:         {elapsed:.1f}s ({flood.accepted / elapsed:.1f} msg/s)")
+    print(f"out of order:    {out_of_order}")
+    if interactive_latency:
+        print(f"interactive p50: {statistics.median(interactive_latency) * 1000:.0f} ms, "
+              f"p95: {percentile(interactive_latency, 0.95) * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve = commands.add_parser('serve', help='run the fake API until interrupted')
+    serve.add_argument('--port', type=int, default=8081)
+    run = commands.add_parser('drive', help='send a burst through the dispatcher and report')
+    run.add_argument('--chats', type=int, default=200)
+    run.add_argument('--groups', type=int, default=0, help='how many of the chats are groups')
+    run.add_argument('--messages', type=int, default=600, help='bulk messages (reminders, broadcasts)')
+    run.add_argument('--interactive', type=int, default=50, help='interactive replies sent during the burst')
+    run.add_argument('--spread', type=float, default=10.0, help='interactive replies arrive within this many seconds')
+    run.add_argument('--naive', action='store_true', help='send everything at once without the dispatcher')
+    run.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        server, flood = start_server(args.port)
+        print(f"Fake Bot API on http://127.0.0.1:{server.server_address[1]}/bot")
+        try:
+            while True:
+                time.sleep(5)
+                print(f"accepted={flood.accepted} rejected={flood.rejected}")
+        except KeyboardInterrupt:
+            server.shutdown()
+    else:
+        asyncio.run(drive(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+"""Typo-tolerant lookup of employee names, surnames, skills and departments.
+
+``FuzzyIndex`` is a symmetric-delete (SymSpell) dictionary. Every term is
+stored under all its variants with up to ``max_distance`` characters deleted
+from its first ``prefix_length`` letters. A lookup generates the same deletes
+for the query word, so candidates come from a few dict hits instead of a scan
+over the vocabulary. Candidates are then verified with Levenshtein distance.
+A lookup takes microseconds and does not depend on the dictionary size.
+
+Before the lookup, words are folded: Latin letters that look like Cyrillic
+ones are replaced in mixed-script words ("Марiя" -> "мария"), and ё -> е.
+
+The index follows the employees table incrementally. Mapper events record
+what each flushed employee contributes, and the change is applied when the
+session commits; a rollback drops it. Other terms stay untouched. It is a
+``snapshot.SnapshotIndex`` without watched models: ORM writes in this process
+never make it stale. ``snapshot.invalidate_all`` after Core writes
+(data.load) does, and so does a changed employees generation (writes from
+other processes); then the next ``ensure_fresh`` rebuilds it.
+
+Usage:
+    python fuzzy_index.py --database-url sqlite:///eval.db Марiя питн Докер Kubernets
+"""
+import logging
+import re
+import statistics
+import threading
+import time
+import weakref
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+import cli
+from config import SEARCH_SETTINGS
+from models import Employee
+from snapshot import SnapshotIndex, row_generation
+from text_pipeline import WORD
+
+try:
+    from Levenshtein import distance as _levenshtein
+except ImportError:  # python-Levenshtein ускоряет проверку кандидатов, но не обязателен
+    _levenshtein = None
+
+logger = logging.getLogger(__name__)
+
+# Латинские буквы, похожие на кириллические (в словах со смешанным алфавитом)
+HOMOGLYPHS = str.maketrans({
+    'a': 'а', 'b': 'в', 'c': 'с', 'e': 'е', 'h': 'н', 'i': 'и', 'k': 'к', 'm': 'м',
+    'o': 'о', 'p': 'р', 't': 'т', 'x': 'х', 'y': 'у', 'і': 'и', 'ё': 'е',
+})
+CYRILLIC = re.compile(r'[а-яё]')
+LATIN = re.compile(r'[a-z]')
+
+MIN_WORD_LENGTH = 3
+
+
+class FuzzyMatch(NamedTuple):
+    distance: int
+    term: str
+    kind: str  # 'name', 'surname', 'skill', 'department', 'alias'
+    value: str  # как значение записано в БД ("Python", "Sales")
+
+
+def fold(word: str) -> str:
+    word = word.lower().replace('ё', 'е').replace('і', 'и')
+    if CYRILLIC.search(word) and LATIN.search(word):
+        word = word.translate(HOMOGLYPHS)
+    return word
+
+
+def levenshtein(a: str, b: str, limit: int) -> int:
+    """Edit distance, or ``limit + 1`` as soon as it is known to exceed ``limit``."""
+    if _levenshtein is not None:
+        return _levenshtein(a, b, score_cutoff=limit)
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def employee_terms(name: str, surname: str, skills: Optional[str], department: Optional[str]) -> Set[Tuple[str, str, str]]:
+    """(term, kind, value) contributed by one employee."""
+    terms = set()
+    for kind, value in (('name', name), ('surname', surname), ('department', department)):
+        if value:
+            terms.update((fold(word), kind, value) for word in WORD.findall(value) if len(word) >= MIN_WORD_LENGTH)
+    for skill in (skills or '').split(','):
+        skill = skill.strip()
+        terms.update((fold(word), 'skill', skill) for word in WORD.findall(skill) if len(word) >= MIN_WORD_LENGTH)
+    return terms
+
+
+class FuzzyIndex(SnapshotIndex):
+    """Symmetric-delete dictionary with per-employee reference counts."""
+
+    def __init__(self, static_terms: Optional[Dict[str, str]] = None,
+                 max_distance: int = SEARCH_SETTINGS['fuzzy_max_distance'],
+                 prefix_length: int = 7, threshold: float = SEARCH_SETTINGS['fuzzy_threshold']):
+        super().__init__()
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.threshold = threshold
+        self._deletes: Dict[str, Set[str]] = {}
+        self._entries: Dict[str, Counter] = {}  # term -> Counter((kind, value) -> сколько сотрудников)
+        self._employees: Dict[int, Set[Tuple[str, str, str]]] = {}
+        self._static = {fold(alias): value for alias, value in (static_terms or {}).items()}
+        self._terms_lock = threading.Lock()  # словарь; self._lock - пересборка (SnapshotIndex)
+        self._reset()
+        _indexes.add(self)
+
+    def _reset(self):
+        self._deletes.clear()
+        self._entries.clear()
+        self._employees.clear()
+        for term, value in self._static.items():
+            self._add(term, 'alias', value)
+
+    def generation(self, session: Session) -> tuple:
+        # Свои изменения применяются по событиям, но поколение меняют и они: после них
+        # первая проверка поколения даст одну лишнюю пересборку
+        return (row_generation(session, Employee),)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _variants(self, term: str) -> Set[str]:
+        prefix = term[:self.prefix_length]
+        variants = {prefix}
+        frontier = {prefix}
+        for _ in range(self.max_distance):
+            frontier = {word[:i] + word[i + 1:] for word in frontier if len(word) > 1 for i in range(len(word))}
+            variants |= frontier
+        return variants
+
+    def _add(self, term: str, kind: str, value: str):
+        entries = self._entries.get(term)
+        if entries is None:
+            entries = self._entries[term] = Counter()
+            for variant in self._variants(term):
+                self._deletes.setdefault(variant, set()).add(term)
+        entries[(kind, value)] += 1
+
+    def _remove(self, term: str, kind: str, value: str):
+        entries = self._entries.get(term)
+        if entries is None:
+            return
+        entries[(kind, value)] -= 1
+        if entries[(kind, value)] <= 0:
+            del entries[(kind, value)]
+        if not entries:
+            del self._entries[term]
+            for variant in self._variants(term):
+                terms = self._deletes.get(variant)
+                if terms is not None:
+                    terms.discard(term)
+                    if not terms:
+                        del self._deletes[variant]
+
+    def set_employee(self, employee_id: int, terms: Optional[Set[Tuple[str, str, str]]]):
+        """Replace what one employee contributes (``None`` removes the employee)."""
+        with self._terms_lock:
+            self._set_employee(employee_id, terms)
+
+    def _set_employee(self, employee_id: int, terms: Optional[Set[Tuple[str, str, str]]]):
+        old = self._employees.pop(employee_id, set())
+        new = terms or set()
+        for term in old - new:
+            self._remove(*term)
+        for term in new - old:
+            self._add(*term)
+        if terms:
+            self._employees[employee_id] = terms
+
+    def _rebuild(self, session: Session):
+        started = time.perf_counter()
+        rows = session.query(
+            Employee.id, Employee.name, Employee.surname, Employee.skills, Employee.department
+        ).filter(Employee.is_active == True).all()
+        with self._terms_lock:
+            self._reset()
+            for row in rows:
+                self._set_employee(row.id, employee_terms(row.name, row.surname, row.skills, row.department))
+        logger.info("Fuzzy index built: %d terms, %d delete variants in %.2fs",
+                    len(self._entries), len(self._deletes), time.perf_counter() - started)
+
+    def lookup(self, word: str, max_distance: Optional[int] = None) -> List[FuzzyMatch]:
+        """Dictionary terms within ``max_distance`` edits of ``word``, closest and most common first."""
+        word = fold(word)
+        limit = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        with self._terms_lock:
+            candidates: Set[str] = set()
+            for variant in self._variants(word):
+                candidates |= self._deletes.get(variant, set())
+            matches = []
+            for term in candidates:
+                distance = 0 if term == word else levenshtein(word, term, limit)
+                if distance <= limit:
+                    for (kind, value), count in self._entries[term].most_common():
+                        matches.append((distance, -count, FuzzyMatch(distance, term, kind, value)))
+        matches.sort(key=lambda item: item[:2])
+        return [match for _, _, match in matches]
+
+    def correct(self, word: str) -> Optional[FuzzyMatch]:
+        """Best correction for a word that is not in the dictionary, or None.
+
+        Short words get at most one edit. The similarity 1 - distance / length
+        must reach SEARCH_SETTINGS['fuzzy_threshold'], and the closest term
+        must be unique, so ordinary words are not "corrected" into names.
+        """
+        folded = fold(word)
+        if len(folded) < MIN_WORD_LENGTH:
+            return None
+        matches = self.lookup(folded, 1 if len(folded) <= 5 else self.max_distance)
+        if not matches:
+            return None
+        best = matches[0]
+        if best.distance == 0:
+            return best
+        closest = {match.term for match in matches if match.distance == best.distance}
+        if len(closest) > 1 or 1 - best.distance / max(len(folded), len(best.term)) < self.threshold:
+            return None
+        return best
+
+    def correct_query(self, query: str) -> Tuple[str, List[Tuple[str, FuzzyMatch]]]:
+        """Query with misspelled dictionary words replaced; also returns (original word, match) pairs."""
+        corrections = []
+
+        def replace(match: re.Match) -> str:
+            word = match.group(0)
+            found = self.correct(word)
+            if found is None or found.term == word.lower():
+                return word
+            corrections.append((word, found))
+            return found.term
+
+        return WORD.sub(replace, query), corrections
+
+
+_indexes = weakref.WeakSet()
+PENDING_KEY = 'fuzzy_index_changes'
+
+
+def _record(target: Employee, terms: Optional[Set[Tuple[str, str, str]]]):
+    session = object_session(target)
+    if session is not None and target.id is not None:
+        session.info.setdefault(PENDING_KEY, {})[target.id] = terms
+
+
+@event.listens_for(Employee, 'after_insert')
+@event.listens_for(Employee, 'after_update')
+def _employee_saved(mapper, connection, target):
+    terms = employee_terms(target.name, target.surname, target.skills, target.department) if target.is_active else None
+    _record(target, terms)
+
+
+@event.listens_for(Employee, 'after_delete')
+def _employee_deleted(mapper, connection, target):
+    _record(target, None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    changes = session.info.pop(PENDING_KEY, None)
+    if not changes:
+        return
+    for index in list(_indexes):
+        if not index.is_stale():  # устаревший и так перечитает всех при пересборке
+            for employee_id, terms in changes.items():
+                index.set_employee(employee_id, terms)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_changes(session):
+    session.info.pop(PENDING_KEY, None)
+
+
+def main():
+    parser = cli.parser(__doc__)
+    parser.add_argument('words', nargs='*', default=['Марiя', 'питн', 'Докер', 'Kubernets', 'Смирнв', 'маркетнг'])
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+    from employee_search import SKILL_ALIASES
+
+    index = FuzzyIndex(static_terms=SKILL_ALIASES)
+    with Session(bind=cli.connect(args)) as session:
+        index.refresh(session)
+    vocabulary = list(index._entries)
+    print(f"{len(vocabulary)} terms, Levenshtein: {'python-Levenshtein' if _levenshtein else 'pure Python'}")
+    print(f"{'word':<12} {'correction':<24} {'lookup us':>10} {'scan us':>10}")
+    for word in args.words:
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            index.lookup(word)
+            timings.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        folded = fold(word)
+        scan = [term for term in vocabulary if levenshtein(folded, term, index.max_distance) <= index.max_distance]
+        scan_time = time.perf_counter() - started
+        found = index.correct(word)
+        shown = f"{found.value} ({found.kind}, d={found.distance})" if found else '-'
+        print(f"{word:<12} {shown:<24} {statistics.median(timings) * 1e6:>10.1f} {scan_time * 1e6:>10.0f}"
+              f"   scan found {len(scan)}")
+
+
+if __name__ == '__main__':
+    main()
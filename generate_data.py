@@ -0,0 +1,429 @@
+"""Deterministic synthetic corporate dataset generator for scale testing.
+
+Fills every table from ``models.py`` at a configurable scale (100 to 1M
+employees) using chunked Core bulk inserts. The same ``--seed`` and
+``--anchor-date`` always produce the same dataset.
+
+Usage:
+    python generate_data.py --employees 10000
+    python generate_data.py --employees 1000000 --seed 7 --database-url sqlite:///load.db --reset
+"""
+import argparse
+import json
+import logging
+import random
+import time
+from array import array
+from datetime import date, datetime, timedelta
+from itertools import accumulate, islice
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from sqlalchemy import func, select
+from sqlalchemy.engine import Connection, Engine
+
+import cli
+from config import ACTIVITY_SETTINGS, EVENT_SETTINGS, TASK_SETTINGS
+from employee_summary import rebuild as rebuild_summary
+from taxonomy import rebuild as rebuild_labels
+from models import (
+    Activity, ActivityType, Base, Employee, Event, EventType, GeneralInfo,
+    Task, TaskStatus, activity_participants, birth_md_key, event_participants, init_db
+)
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 5000
+# telegram_id = база + id сотрудника: личные чаты без случайных чисел, последовательность rng не меняется
+TELEGRAM_ID_BASE = 100_000_000
+
+# (русское написание, латиница для email)
+MALE_NAMES = [
+    ('Иван', 'ivan'), ('Алексей', 'alexey'), ('Дмитрий', 'dmitry'), ('Сергей', 'sergey'),
+    ('Андрей', 'andrey'), ('Михаил', 'mikhail'), ('Николай', 'nikolay'), ('Павел', 'pavel'),
+    ('Артём', 'artem'), ('Егор', 'egor'), ('John', 'john'), ('David', 'david'),
+]
+FEMALE_NAMES = [
+    ('Мария', 'maria'), ('Елена', 'elena'), ('Анна', 'anna'), ('Ольга', 'olga'),
+    ('Наталья', 'natalya'), ('Екатерина', 'ekaterina'), ('Татьяна', 'tatyana'),
+    ('Дарья', 'darya'), ('Юлия', 'yulia'), ('Ксения', 'ksenia'), ('Emily', 'emily'), ('Sarah', 'sarah'),
+]
+# Фамилии: (мужская форма, женская форма, латиница)
+SURNAMES = [
+    ('Иванов', 'Иванова', 'ivanov'), ('Петров', 'Петрова', 'petrov'),
+    ('Сидоров', 'Сидорова', 'sidorov'), ('Смирнов', 'Смирнова', 'smirnov'),
+    ('Козлов', 'Козлова', 'kozlov'), ('Волков', 'Волкова', 'volkov'),
+    ('Соколов', 'Соколова', 'sokolov'), ('Морозов', 'Морозова', 'morozov'),
+    ('Новиков', 'Новикова', 'novikov'), ('Фёдоров', 'Фёдорова', 'fedorov'),
+    ('Smith', 'Smith', 'smith'), ('Brown', 'Brown', 'brown'),
+]
+
+# Отделы с типичными должностями и навыками
+DEPARTMENTS = {
+    'IT': {
+        'positions': ['Разработчик', 'Senior Developer', 'Тестировщик', 'QA Engineer',
+                      'DevOps-инженер', 'Аналитик', 'Team Lead'],
+        'skills': ['Python', 'SQL', 'Docker', 'Kubernetes', 'Java', 'JavaScript', 'React',
+                   'Django', 'FastAPI', 'PostgreSQL', 'Selenium', 'pytest', 'Linux',
+                   'Git', 'Машинное обучение', 'Тестирование'],
+    },
+    'HR': {
+        'positions': ['HR-менеджер', 'Рекрутер', 'HR Business Partner', 'Специалист по обучению'],
+        'skills': ['Рекрутинг', 'Обучение', 'Onboarding', 'Интервьюирование',
+                   'Кадровое делопроизводство', 'Coaching'],
+    },
+    'Sales': {
+        'positions': ['Менеджер по продажам', 'Account Manager', 'Руководитель отдела продаж'],
+        'skills': ['Переговоры', 'CRM', 'Negotiation', 'Холодные звонки', 'B2B-продажи', 'Excel'],
+    },
+    'Marketing': {
+        'positions': ['Маркетолог', 'Marketing Specialist', 'SMM-менеджер', 'Дизайнер'],
+        'skills': ['SEO', 'SMM', 'Копирайтинг', 'Figma', 'Google Analytics', 'Content Marketing'],
+    },
+    'Finance': {
+        'positions': ['Бухгалтер', 'Финансовый аналитик', 'Financial Controller'],
+        'skills': ['Excel', '1С', 'МСФО', 'Financial Modeling', 'Бюджетирование'],
+    },
+    'Support': {
+        'positions': ['Специалист поддержки', 'Support Engineer', 'Руководитель поддержки'],
+        'skills': ['Jira', 'Zendesk', 'Коммуникация', 'SQL', 'Linux'],
+    },
+}
+DEPARTMENT_NAMES = list(DEPARTMENTS)
+# Доли отделов в штате
+DEPARTMENT_WEIGHTS = [0.40, 0.08, 0.18, 0.14, 0.08, 0.12]
+
+INTERESTS = [
+    'йога', 'настольные игры', 'путешествия', 'танцы', 'теннис', 'бег', 'шахматы',
+    'чтение', 'фотография', 'кино', 'музыка', 'travel', 'hiking', 'chess', 'cooking',
+    'cycling', 'board games',
+]
+TIMEZONES = ['Europe/Moscow', 'Europe/Moscow', 'Europe/Moscow', 'Asia/Yekaterinburg',
+             'Asia/Novosibirsk', 'Europe/Kaliningrad', 'UTC']
+
+EVENT_TITLES = {
+    EventType.MEETING: ['Встреча команды', 'Планирование спринта', 'Weekly sync', 'Ретроспектива'],
+    EventType.TRAINING: ['Тренинг по продажам', 'Воркшоп по Docker', 'Python training', 'Курс по SQL'],
+    EventType.TEAM_BUILDING: ['Корпоратив', 'Тимбилдинг', 'Team offsite'],
+    EventType.PRESENTATION: ['Презентация проекта', 'Демо продукта', 'Quarterly review'],
+    EventType.OTHER: ['Встреча с клиентом', 'День открытых дверей', 'Town hall'],
+}
+ACTIVITY_TITLES = {
+    ActivityType.SPORTS: ['Турнир по настольному теннису', 'Футбол после работы', 'Morning run'],
+    ActivityType.GAMES: ['Вечер настольных игр', 'Шахматный турнир', 'Board games night'],
+    ActivityType.LEARNING: ['Книжный клуб', 'English speaking club', 'Лекторий'],
+    ActivityType.SOCIAL: ['Совместный обед', 'Кино-вечер', 'Coffee chat'],
+    ActivityType.OTHER: ['Волонтёрский день', 'Фотопрогулка'],
+}
+LOCATIONS = ['Конференц-зал', 'Переговорная 1', 'Переговорная 2', 'Спортзал',
+             'Кафе', 'Open space', 'Zoom']
+TASK_VERBS = ['Обновить', 'Подготовить', 'Проверить', 'Исправить', 'Update', 'Review', 'Implement']
+TASK_OBJECTS = ['документацию', 'отчет', 'презентацию', 'API', 'дашборд', 'тесты',
+                'release notes', 'CI pipeline', 'бюджет']
+TASK_STATUS_WEIGHTS = [
+    (TaskStatus.TODO, 0.35), (TaskStatus.IN_PROGRESS, 0.25),
+    (TaskStatus.DONE, 0.35), (TaskStatus.BLOCKED, 0.05),
+]
+INFO_TOPICS = [
+    ('Правила', 'Правила работы', 'Основные правила работы в компании'),
+    ('Офис', 'Адрес офиса', 'Офис находится по адресу: г. Москва, ул. Примерная, д. 123'),
+    ('IT', 'IT поддержка', 'Email: support@company.com, внутренний номер 1234'),
+    ('HR', 'Отпуска', 'Заявление на отпуск подается за две недели'),
+    ('Policies', 'Remote work policy', 'Employees may work remotely up to three days a week'),
+    ('Wiki', 'База знаний', 'База знаний доступна по адресу wiki.company.com'),
+]
+
+
+def zipf_cum_weights(n: int, s: float) -> List[float]:
+    """Cumulative Zipf weights for ranks 1..n, suitable for ``random.choices``."""
+    return list(accumulate(1.0 / (rank ** s) for rank in range(1, n + 1)))
+
+
+def chunked(rows: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    iterator = iter(rows)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bulk_insert(conn: Connection, table, rows: Iterable[dict], chunk_size: int = CHUNK_SIZE) -> int:
+    """Insert rows with executemany in fixed-size chunks. Returns the row count."""
+    total = 0
+    for chunk in chunked(rows, chunk_size):
+        conn.execute(table.insert(), chunk)
+        total += len(chunk)
+    return total
+
+
+class DatasetGenerator:
+    """Generates reproducible rows for all tables.
+
+    Ids are assigned explicitly (offset past any existing rows) so association
+    tables can be filled without reading generated keys back from the database.
+    """
+
+    def __init__(self, employees: int, seed: int = 42, anchor: Optional[date] = None,
+                 events_per_employee: float = 0.2, tasks_per_employee: float = 5.0,
+                 activities_per_employee: float = 0.05, general_info: int = 200,
+                 zipf_s: float = 1.1):
+        self.n_employees = employees
+        self.seed = seed
+        self.anchor = datetime.combine(anchor or date.today(), datetime.min.time())
+        self.n_events = max(1, int(employees * events_per_employee))
+        self.n_tasks = max(1, int(employees * tasks_per_employee))
+        self.n_activities = max(1, int(employees * activities_per_employee))
+        self.n_general_info = general_info
+        self.zipf_s = zipf_s
+
+        # Compact per-employee state needed for fan-out and assignments
+        self.employee_department = array('B')
+        self.department_members: Dict[int, array] = {i: array('I') for i in range(len(DEPARTMENT_NAMES))}
+        self.id_offsets: Dict[str, int] = {}
+
+    def _rng(self, stream: str) -> random.Random:
+        # Отдельный поток случайных чисел на таблицу: изменение масштаба одной
+        # таблицы не сдвигает значения в других
+        return random.Random(f"{self.seed}:{stream}")
+
+    def employee_id(self, index: int) -> int:
+        return self.id_offsets['employees'] + index + 1
+
+    def employees(self) -> Iterator[dict]:
+        rng = self._rng('employees')
+        offset = self.id_offsets['employees']
+        for i in range(self.n_employees):
+            emp_id = offset + i + 1
+            dept_index = rng.choices(range(len(DEPARTMENT_NAMES)), weights=DEPARTMENT_WEIGHTS)[0]
+            dept = DEPARTMENTS[DEPARTMENT_NAMES[dept_index]]
+            self.employee_department.append(dept_index)
+            self.department_members[dept_index].append(i)
+
+            female = rng.random() < 0.5
+            name, name_latin = rng.choice(FEMALE_NAMES if female else MALE_NAMES)
+            male_surname, female_surname, surname_latin = rng.choice(SURNAMES)
+            english = rng.random() < 0.15
+            birthday = datetime(rng.randint(1965, 2003), rng.randint(1, 12), rng.randint(1, 28))
+            yield {
+                'id': emp_id,
+                'name': name,
+                'surname': female_surname if female else male_surname,
+                'position': rng.choice(dept['positions']),
+                'department': DEPARTMENT_NAMES[dept_index],
+                'email': f"{name_latin}.{surname_latin}.{emp_id}@company.com",
+                'phone': f"+7-9{rng.randint(10, 99)}-{rng.randint(100, 999)}-"
+                         f"{rng.randint(10, 99)}-{rng.randint(10, 99)}",
+                'skills': ', '.join(rng.sample(dept['skills'], rng.randint(1, min(5, len(dept['skills']))))),
+                'interests': ', '.join(rng.sample(INTERESTS, rng.randint(0, 3))),
+                'birthday': birthday,
+                'birth_md': birth_md_key(birthday),
+                'hire_date': self.anchor - timedelta(days=rng.randint(0, 3650)),
+                'is_active': rng.random() > 0.03,
+                'timezone': rng.choice(TIMEZONES),
+                'preferred_language': 'en' if english else 'ru',
+                'avatar_url': None,
+                'bio': None,
+                'social_links': json.dumps({'telegram': f"@{name_latin}_{emp_id}"}),
+                'telegram_id': TELEGRAM_ID_BASE + emp_id,
+            }
+
+    def _participants(self, rng: random.Random, organizer_index: int, count: int) -> List[int]:
+        """Pick participants mostly from the organizer's department."""
+        members = self.department_members[self.employee_department[organizer_index]]
+        own = min(len(members), int(count * 0.8))
+        picked = set(rng.sample(members, own)) if own else set()
+        while len(picked) < min(count, self.n_employees):
+            picked.add(rng.randrange(self.n_employees))
+        picked.discard(organizer_index)
+        return [self.employee_id(i) for i in picked]
+
+    def _fanout(self, rng: random.Random, cap: int) -> int:
+        # Логнормальное распределение: много маленьких встреч и редкие большие
+        return max(1, min(cap, int(rng.lognormvariate(1.6, 0.8))))
+
+    def events(self, participant_rows: List[dict]) -> Iterator[dict]:
+        rng = self._rng('events')
+        offset = self.id_offsets['events']
+        cap = EVENT_SETTINGS['max_participants']
+        event_types = list(EventType)
+        for i in range(self.n_events):
+            event_id = offset + i + 1
+            event_type = rng.choice(event_types)
+            organizer = rng.randrange(self.n_employees)
+            start = self.anchor + timedelta(days=rng.randint(-180, 90), hours=rng.randint(9, 18))
+            participants = self._participants(rng, organizer, self._fanout(rng, cap))
+            participant_rows.extend({'event_id': event_id, 'employee_id': p} for p in participants)
+            is_online = rng.random() < 0.3
+            yield {
+                'id': event_id,
+                'title': rng.choice(EVENT_TITLES[event_type]),
+                'description': None if rng.random() < 0.2 else f"{event_type.value} #{event_id}",
+                'start_time': start,
+                'end_time': start + timedelta(minutes=rng.choice([30, 60, 90, 120, 240])),
+                'location': 'Zoom' if is_online else rng.choice(LOCATIONS),
+                'event_type': event_type,
+                'organizer_id': self.employee_id(organizer),
+                'max_participants': rng.choice([None, 10, 20, cap]),
+                'is_online': is_online,
+                'meeting_link': f"https://meet.company.com/{event_id}" if is_online else None,
+                'status': 'active' if start >= self.anchor else 'completed',
+                'created_at': start - timedelta(days=rng.randint(1, 30)),
+                'updated_at': start - timedelta(days=rng.randint(0, 1)),
+            }
+
+    def activities(self, participant_rows: List[dict]) -> Iterator[dict]:
+        rng = self._rng('activities')
+        offset = self.id_offsets['activities']
+        cap = ACTIVITY_SETTINGS['max_participants']
+        activity_types = list(ActivityType)
+        for i in range(self.n_activities):
+            activity_id = offset + i + 1
+            activity_type = rng.choice(activity_types)
+            organizer = rng.randrange(self.n_employees)
+            start = self.anchor + timedelta(days=rng.randint(-90, 60), hours=rng.randint(12, 20))
+            participants = self._participants(rng, organizer, self._fanout(rng, cap))
+            participant_rows.extend({'activity_id': activity_id, 'employee_id': p} for p in participants)
+            yield {
+                'id': activity_id,
+                'title': rng.choice(ACTIVITY_TITLES[activity_type]),
+                'description': f"{activity_type.value} #{activity_id}",
+                'activity_type': activity_type,
+                'start_time': start,
+                'end_time': start + timedelta(hours=rng.choice([1, 2, 3])),
+                'location': rng.choice(LOCATIONS),
+                'organizer_id': self.employee_id(organizer),
+                'max_participants': cap,
+                'current_participants': len(participants),
+                'status': 'active' if start >= self.anchor else 'completed',
+                'created_at': start - timedelta(days=rng.randint(1, 30)),
+                'updated_at': start - timedelta(days=rng.randint(0, 1)),
+            }
+
+    def tasks(self) -> Iterator[dict]:
+        rng = self._rng('tasks')
+        offset = self.id_offsets['tasks']
+        # Исполнители распределены по Ципфу: небольшая часть сотрудников
+        # получает большую часть задач. Ранги перемешаны, чтобы "тяжелые"
+        # исполнители не совпадали с первыми id.
+        ranked = list(range(self.n_employees))
+        rng.shuffle(ranked)
+        cum_weights = zipf_cum_weights(self.n_employees, self.zipf_s)
+        statuses = [status for status, _ in TASK_STATUS_WEIGHTS]
+        status_weights = [weight for _, weight in TASK_STATUS_WEIGHTS]
+        for i in range(self.n_tasks):
+            assignee = rng.choices(ranked, cum_weights=cum_weights)[0]
+            dept = DEPARTMENTS[DEPARTMENT_NAMES[self.employee_department[assignee]]]
+            created = self.anchor - timedelta(days=rng.randint(0, 365))
+            estimated = rng.choice([None, 1.0, 2.0, 4.0, 8.0, 16.0])
+            status = rng.choices(statuses, weights=status_weights)[0]
+            yield {
+                'id': offset + i + 1,
+                'title': f"{rng.choice(TASK_VERBS)} {rng.choice(TASK_OBJECTS)}",
+                'description': None if rng.random() < 0.3 else f"Задача #{offset + i + 1}",
+                'status': status,
+                'priority': rng.randint(0, TASK_SETTINGS['max_priority']),
+                'assignee_id': self.employee_id(assignee),
+                'creator_id': self.employee_id(rng.randrange(self.n_employees)),
+                'due_date': created + timedelta(days=rng.randint(1, 150)),
+                'created_at': created,
+                'updated_at': created + timedelta(days=rng.randint(0, 30)),
+                'estimated_hours': estimated,
+                'actual_hours': estimated * rng.uniform(0.5, 2.0)
+                if estimated and status == TaskStatus.DONE else None,
+                'tags': json.dumps(rng.sample(dept['skills'], 2), ensure_ascii=False),
+                'attachments': json.dumps([]),
+            }
+
+    def general_info(self) -> Iterator[dict]:
+        rng = self._rng('general_info')
+        offset = self.id_offsets['general_info']
+        for i in range(self.n_general_info):
+            category, title, content = rng.choice(INFO_TOPICS)
+            yield {
+                'id': offset + i + 1,
+                'title': title if i < len(INFO_TOPICS) else f"{title} ({i})",
+                'content': content,
+                'category': category,
+                'tags': json.dumps([category.lower()], ensure_ascii=False),
+                'created_at': self.anchor - timedelta(days=rng.randint(0, 730)),
+                'updated_at': self.anchor - timedelta(days=rng.randint(0, 30)),
+                'is_active': rng.random() > 0.05,
+                'priority': rng.randint(0, 3),
+            }
+
+    def load(self, target: Engine, chunk_size: int = CHUNK_SIZE) -> Dict[str, int]:
+        """Write the whole dataset in one transaction per table."""
+        counts: Dict[str, int] = {}
+        with target.connect() as conn:
+            for table in (Employee, Event, Task, Activity, GeneralInfo):
+                max_id = conn.execute(select(func.max(table.id))).scalar()
+                self.id_offsets[table.__tablename__] = max_id or 0
+
+        def timed(name: str, table, rows: Iterable[dict]):
+            started = time.perf_counter()
+            with target.begin() as conn:
+                counts[name] = bulk_insert(conn, table, rows, chunk_size)
+            logger.info("Inserted %d rows into %s in %.2fs", counts[name], name, time.perf_counter() - started)
+
+        timed('employees', Employee.__table__, self.employees())
+        # Участники копятся в памяти, пока генерируются мероприятия; при 1M
+        # сотрудников это порядка миллиона коротких словарей
+        event_participant_rows: List[dict] = []
+        timed('events', Event.__table__, self.events(event_participant_rows))
+        timed('event_participants', event_participants, event_participant_rows)
+        del event_participant_rows
+        activity_participant_rows: List[dict] = []
+        timed('activities', Activity.__table__, self.activities(activity_participant_rows))
+        timed('activity_participants', activity_participants, activity_participant_rows)
+        del activity_participant_rows
+        timed('tasks', Task.__table__, self.tasks())
+        timed('general_info', GeneralInfo.__table__, self.general_info())
+        return counts
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = cli.parser(__doc__)
+    parser.add_argument('--employees', type=int, default=1000, help='number of employees (100..1000000)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--anchor-date', type=date.fromisoformat, default=None,
+                        help='date that "now" is relative to (YYYY-MM-DD, default: today)')
+    parser.add_argument('--events-per-employee', type=float, default=0.2)
+    parser.add_argument('--tasks-per-employee', type=float, default=5.0)
+    parser.add_argument('--activities-per-employee', type=float, default=0.05)
+    parser.add_argument('--general-info', type=int, default=200)
+    parser.add_argument('--zipf-s', type=float, default=1.1, help='Zipf exponent for task assignees')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--reset', action='store_true', help='drop and recreate all tables first')
+    args = parser.parse_args(argv)
+    if not 100 <= args.employees <= 1_000_000:
+        parser.error('--employees must be between 100 and 1000000')
+    return args
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    args = parse_args(argv)
+    target = cli.connect(args, init=False)  # --reset удаляет таблицы до их создания
+    if args.reset:
+        Base.metadata.drop_all(target)
+    init_db(target)
+
+    generator = DatasetGenerator(
+        employees=args.employees,
+        seed=args.seed,
+        anchor=args.anchor_date,
+        events_per_employee=args.events_per_employee,
+        tasks_per_employee=args.tasks_per_employee,
+        activities_per_employee=args.activities_per_employee,
+        general_info=args.general_info,
+        zipf_s=args.zipf_s,
+    )
+    started = time.perf_counter()
+    counts = generator.load(target, chunk_size=args.chunk_size)
+    # Core-вставки минуют ORM-события, поэтому сводка и связи навыков/тегов пересчитываются целиком
+    counts['employee_summary'] = rebuild_summary(target)
+    counts.update(rebuild_labels(target))
+    logger.info("Generated %s in %.2fs", counts, time.perf_counter() - started)
+
+
+if __name__ == '__main__':
+    main()
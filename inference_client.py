@@ -0,0 +1,122 @@
+"""Thin synchronous client for ``inference_server``.
+
+``RemoteEncoder`` and ``RemoteZeroShotClassifier`` are drop-in replacements
+for a SentenceTransformer and a transformers zero-shot pipeline, so bot and
+web processes can switch to the shared server by setting INFERENCE_SOCKET.
+"""
+import json
+import logging
+import socket
+import struct
+import threading
+from multiprocessing import shared_memory
+from typing import List, Tuple, Union
+
+import numpy as np
+
+from config import INFERENCE_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct('>I')
+
+
+class InferenceError(RuntimeError):
+    pass
+
+
+class InferenceClient:
+    """One Unix-socket connection per thread, reconnecting once on failure."""
+
+    def __init__(self, socket_path: str, timeout: float = INFERENCE_SETTINGS['timeout']):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> socket.socket:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            conn.settimeout(self.timeout)
+            conn.connect(self.socket_path)
+            self._local.conn = conn
+        return conn
+
+    def _reset(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+        self._local.conn = None
+
+    @staticmethod
+    def _recv_exactly(conn: socket.socket, size: int) -> bytes:
+        chunks = []
+        while size:
+            chunk = conn.recv(min(size, 1 << 20))
+            if not chunk:
+                raise ConnectionError("inference server closed the connection")
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    def _roundtrip(self, request: dict) -> Tuple[dict, bytes]:
+        encoded = json.dumps(request, ensure_ascii=False).encode('utf-8')
+        conn = self._connection()
+        conn.sendall(HEADER.pack(len(encoded)) + encoded)
+        (length,) = HEADER.unpack(self._recv_exactly(conn, HEADER.size))
+        header = json.loads(self._recv_exactly(conn, length))
+        payload = self._recv_exactly(conn, header['nbytes']) if header.get('nbytes') else b''
+        return header, payload
+
+    def call(self, request: dict) -> Tuple[dict, bytes]:
+        try:
+            header, payload = self._roundtrip(request)
+        except (OSError, ConnectionError):
+            # Сервер мог перезапуститься: одна повторная попытка на новом соединении
+            self._reset()
+            header, payload = self._roundtrip(request)
+        if not header.get('ok'):
+            raise InferenceError(header.get('error', 'unknown error'))
+        return header, payload
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        header, payload = self.call({'op': 'encode', 'texts': texts})
+        shape = tuple(header['shape'])
+        if 'shm' not in header:
+            return np.frombuffer(payload, dtype=header['dtype']).reshape(shape).copy()
+        segment = shared_memory.SharedMemory(name=header['shm'])
+        try:
+            return np.ndarray(shape, dtype=header['dtype'], buffer=segment.buf).copy()
+        finally:
+            segment.close()
+            segment.unlink()
+
+    def classify(self, text: str, labels: List[str]) -> dict:
+        header, _ = self.call({'op': 'classify', 'text': text, 'labels': list(labels)})
+        return {'sequence': text, 'labels': header['labels'], 'scores': header['scores']}
+
+    def health(self) -> dict:
+        header, _ = self.call({'op': 'health'})
+        return header
+
+
+class RemoteEncoder:
+    """SentenceTransformer-compatible ``encode`` backed by the inference server."""
+
+    def __init__(self, client: InferenceClient):
+        self.client = client
+
+    def encode(self, sentences: Union[str, List[str]], **kwargs) -> np.ndarray:
+        if isinstance(sentences, str):
+            return self.client.encode([sentences])[0]
+        return self.client.encode(list(sentences))
+
+
+class RemoteZeroShotClassifier:
+    """Callable with the same signature as a zero-shot-classification pipeline."""
+
+    def __init__(self, client: InferenceClient):
+        self.client = client
+
+    def __call__(self, sequence: str, candidate_labels: List[str], **kwargs) -> dict:
+        return self.client.classify(sequence, candidate_labels)
@@ -0,0 +1,246 @@
+"""Local inference service that owns the models once per box.
+
+Bot and web worker processes talk to it over a Unix socket through
+``inference_client`` instead of loading their own copies of MiniLM and
+BART-large.
+
+Wire format: every message is a 4-byte big-endian header length, a JSON
+header and, optionally, ``header['nbytes']`` bytes of raw payload. Large
+embedding matrices are handed over in shared memory instead (``header['shm']``
+is the segment name; the client copies it out and unlinks it).
+
+Operations:
+    {"op": "encode", "texts": [...]}                 -> float32 matrix
+    {"op": "classify", "text": "...", "labels": [...]} -> {"labels", "scores"}
+    {"op": "health"}                                 -> uptime, counters, latency percentiles
+
+Usage:
+    python inference_server.py --socket /tmp/corporate_bot_inference.sock --nli
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import struct
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import INFERENCE_SETTINGS, INFERENCE_SOCKET
+from embeddings import load_encoder, load_zero_shot_classifier
+from logging_setup import configure_logging
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct('>I')
+
+
+async def read_message(reader: asyncio.StreamReader) -> Tuple[dict, bytes]:
+    (length,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+    header = json.loads(await reader.readexactly(length))
+    payload = await reader.readexactly(header['nbytes']) if header.get('nbytes') else b''
+    return header, payload
+
+
+def pack_message(header: dict, payload: bytes = b'') -> bytes:
+    if payload:
+        header = dict(header, nbytes=len(payload))
+    encoded = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    return HEADER.pack(len(encoded)) + encoded + payload
+
+
+def array_message(array: np.ndarray, shm_threshold: int) -> bytes:
+    """Serialize an embedding matrix inline or through a shared-memory segment."""
+    array = np.ascontiguousarray(array, dtype=np.float32)
+    header = {'ok': True, 'shape': list(array.shape), 'dtype': 'float32'}
+    if array.nbytes < shm_threshold:
+        return pack_message(header, array.tobytes())
+    segment = shared_memory.SharedMemory(create=True, size=array.nbytes)
+    np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[:] = array
+    header['shm'] = segment.name
+    # Сегмент теперь принадлежит клиенту: он скопирует данные и вызовет unlink
+    resource_tracker.unregister(segment._name, 'shared_memory')
+    segment.close()
+    return pack_message(header)
+
+
+class LatencyStats:
+    """Counters and recent latencies per operation."""
+
+    def __init__(self, window: int = 2048):
+        self.started = time.time()
+        self.requests: Dict[str, int] = defaultdict(int)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.latencies: Dict[str, deque] = defaultdict(lambda: deque(maxlen=window))
+        self.batches = 0
+        self.batched_texts = 0
+
+    def record(self, op: str, seconds: float, ok: bool = True):
+        self.requests[op] += 1
+        if not ok:
+            self.errors[op] += 1
+        self.latencies[op].append(seconds)
+
+    def snapshot(self) -> dict:
+        latency = {}
+        for op, samples in self.latencies.items():
+            values = np.fromiter(samples, dtype=np.float64) * 1000
+            latency[op] = {
+                'p50_ms': round(float(np.percentile(values, 50)), 3),
+                'p95_ms': round(float(np.percentile(values, 95)), 3),
+                'p99_ms': round(float(np.percentile(values, 99)), 3),
+            }
+        return {
+            'uptime_s': round(time.time() - self.started, 1),
+            'requests': dict(self.requests),
+            'errors': dict(self.errors),
+            'latency': latency,
+            'batches': self.batches,
+            'avg_batch_size': round(self.batched_texts / self.batches, 2) if self.batches else 0,
+        }
+
+
+class EncodeBatcher:
+    """Coalesces concurrent encode requests into one forward pass.
+
+    A batch is flushed when it reaches ``max_batch_size`` texts or when the
+    oldest request has waited ``max_wait_ms``.
+    """
+
+    def __init__(self, encoder, executor: ThreadPoolExecutor, stats: LatencyStats,
+                 max_batch_size: int, max_wait_ms: float):
+        self.encoder = encoder
+        self.executor = executor
+        self.stats = stats
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.pending: asyncio.Queue = asyncio.Queue()
+
+    async def encode(self, texts: List[str]) -> np.ndarray:
+        future = asyncio.get_running_loop().create_future()
+        await self.pending.put((texts, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.pending.get()]
+            size = len(batch[0][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.pending.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            texts = [text for item_texts, _ in batch for text in item_texts]
+            try:
+                embeddings = await loop.run_in_executor(self.executor, self.encoder.encode, texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.stats.batches += 1
+            self.stats.batched_texts += len(texts)
+            offset = 0
+            for item_texts, future in batch:
+                future.set_result(embeddings[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+
+class InferenceServer:
+    def __init__(self, socket_path: str, load_nli: bool = False):
+        self.socket_path = socket_path
+        self.stats = LatencyStats()
+        # Один поток на модель: torch и так распараллеливает forward pass
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='inference')
+        # У NLI свой поток: загрузка BART и классификация не задерживают батчи encode
+        self.nli_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='inference-nli')
+        self.encoder = load_encoder(remote=False)
+        self.nli = load_zero_shot_classifier(remote=False) if load_nli else None
+        self._nli_lock = asyncio.Lock()
+        self.batcher: Optional[EncodeBatcher] = None
+
+    async def handle_request(self, header: dict) -> bytes:
+        op = header.get('op')
+        if op == 'encode':
+            embeddings = await self.batcher.encode(header['texts'])
+            return array_message(embeddings, INFERENCE_SETTINGS['shm_threshold'])
+        if op == 'classify':
+            if self.nli is None:
+                # Параллельные classify ждут одну загрузку вместо того, чтобы грузить модель каждый
+                async with self._nli_lock:
+                    if self.nli is None:
+                        self.nli = await asyncio.get_running_loop().run_in_executor(
+                            self.nli_executor, lambda: load_zero_shot_classifier(remote=False)
+                        )
+            result = await asyncio.get_running_loop().run_in_executor(
+                self.nli_executor, self.nli, header['text'], header['labels']
+            )
+            return pack_message({'ok': True, 'labels': result['labels'], 'scores': result['scores']})
+        if op == 'health':
+            return pack_message(dict(self.stats.snapshot(), ok=True, nli_loaded=self.nli is not None))
+        raise ValueError(f"Unknown op: {op}")
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    header, _ = await read_message(reader)
+                except asyncio.IncompleteReadError:
+                    break
+                started = time.perf_counter()
+                op = header.get('op', '?')
+                try:
+                    response = await self.handle_request(header)
+                    self.stats.record(op, time.perf_counter() - started)
+                except Exception as e:
+                    logger.exception("Inference request %s failed", op)
+                    self.stats.record(op, time.perf_counter() - started, ok=False)
+                    response = pack_message({'ok': False, 'error': str(e)})
+                writer.write(response)
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self):
+        self.batcher = EncodeBatcher(
+            self.encoder, self.executor, self.stats,
+            INFERENCE_SETTINGS['max_batch_size'], INFERENCE_SETTINGS['max_wait_ms'],
+        )
+        batcher_task = asyncio.create_task(self.batcher.run())
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = await asyncio.start_unix_server(self.handle_connection, path=self.socket_path)
+        os.chmod(self.socket_path, 0o660)
+        logger.info("Inference server listening on %s", self.socket_path)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher_task.cancel()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+def main():
+    configure_logging()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--socket', default=INFERENCE_SOCKET or '/tmp/corporate_bot_inference.sock')
+    parser.add_argument('--nli', action='store_true', help='load BART-large-MNLI at startup')
+    args = parser.parse_args()
+    asyncio.run(InferenceServer(args.socket, load_nli=args.nli).serve())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,681 @@
+"""Intent routing shared by both bots and the web app.
+
+A message goes through a cascade of classifiers and stops at the first stage
+that is confident enough:
+
+  1. rules       keyword/synonym/example scoring (microseconds);
+  2. embeddings  cosine similarity to cached prototype embeddings of the
+                 category examples (one encoder call per message);
+  3. NLI         zero-shot BART-MNLI, loaded lazily and only used when both
+                 cheaper stages are uncertain.
+
+Each stage exits early when its top score clears a minimum *and* beats the
+runner-up by a margin (INTENT_SETTINGS). ``IntentRouter.stats()`` reports
+per-stage calls, resolutions and time. With tracing enabled, the same data
+goes to ``bot_intent_stage_seconds{stage,outcome}``.
+
+``EXAMPLE_QUERIES`` are the questions the bots offer in /start and /help with
+the category each must land in; the rule weights are tuned so that every one
+of them is routed right by the rules alone.
+
+Usage:
+    python intent_router.py --check   # route EXAMPLE_QUERIES with the rules, exit 1 on a mismatch
+"""
+import argparse
+import logging
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import tracing
+from config import INTENT_SETTINGS, TRACING_ENABLED
+from text_pipeline import BUILTIN_SEARCH_STOPWORDS, MIN_TERM_LENGTH, RULE_STOPWORDS, analyze
+
+logger = logging.getLogger(__name__)
+message_logger = logging.getLogger(__name__ + '.messages')
+
+FALLBACK_CATEGORY = "неопределенный запрос"
+
+# Полный набор категорий telegram_bot; bot.py и web_app используют подмножества
+CATEGORIES = [
+    "поиск сотрудника",
+    "информация о мероприятии",
+    "информация о задаче",
+    "социальные активности",
+    "приветствие",
+    "общая информация",
+    "день рождения",
+    "календарь занятости",
+    "напоминания",
+    FALLBACK_CATEGORY,
+]
+
+INTENT_STAGE_SECONDS = tracing.Histogram(
+    'bot_intent_stage_seconds', 'Intent classifier stage latency; count by outcome (resolved/passed)'
+)
+tracing.HISTOGRAMS.append(INTENT_STAGE_SECONDS)
+
+# Keywords, synonyms and example queries per category (rule stage and embedding prototypes)
+category_patterns = {
+    "приветствие": {
+        "keywords": [
+            'привет', 'здравствуй', 'добрый', 'начать', 'помощь', 'хеллоу',
+            'хай', 'здорово', 'приветствую', 'доброе', 'добрый'
+        ],
+        "synonyms": [
+            'здравствуйте', 'доброе утро', 'добрый день', 'добрый вечер',
+            'хеллоу', 'хай', 'приветствую', 'здорово', 'добро пожаловать',
+            'рад видеть', 'как дела', 'как жизнь'
+        ],
+        "examples": [
+            "привет",
+            "здравствуй",
+            "добрый день",
+            "начать",
+            "помощь",
+            "как пользоваться",
+            "что умеешь",
+            "как дела",
+            "доброе утро",
+            "добрый вечер",
+            "рад тебя видеть",
+            "как жизнь"
+        ]
+    },
+    "поиск сотрудника": {
+        "keywords": [
+            'отдел', 'отделе', 'it', 'hr', 'sales', 'marketing', 'проект', 'project',
+            'разработка', 'разработчик', 'менеджер', 'директор', 'руководитель',
+            'специалист', 'инженер', 'аналитик', 'дизайнер', 'тестировщик',
+            'кто', 'найти', 'показать', 'список', 'сотрудники', 'коллеги',
+            'работает', 'трудится', 'занимается', 'отвечает', 'знает',
+            'умеет', 'может', 'способен', 'опыт', 'навыки', 'умения'
+        ],
+        "synonyms": [
+            'найти', 'показать', 'кто', 'какие', 'список', 'сотрудники', 'работники',
+            'коллеги', 'люди', 'команда', 'группа', 'отдел', 'подразделение',
+            'искать', 'поиск', 'найти', 'показать', 'вывести', 'отобразить',
+            'работает', 'трудится', 'занимается', 'отвечает', 'знает',
+            'умеет', 'может', 'способен', 'опыт', 'навыки', 'умения',
+            'специалист', 'эксперт', 'профессионал', 'мастер', 'гуру'
+        ],
+        "examples": [
+            "кто работает в отделе",
+            "найти сотрудника",
+            "кто из отдела",
+            "покажи сотрудников",
+            "кто работает над проектом",
+            "список сотрудников",
+            "какие люди работают",
+            "кто в команде",
+            "покажи команду разработки",
+            "кто отвечает за проект",
+            "найти специалиста по",
+            "кто руководит отделом",
+            "кто занимается разработкой",
+            "покажи всех сотрудников отдела",
+            "кто знает python",
+            "кто умеет работать с базами данных",
+            "найти эксперта по тестированию",
+            "кто может помочь с проектом",
+            "кто имеет опыт в маркетинге",
+            "покажи специалистов по дизайну"
+        ]
+    },
+    "информация о мероприятии": {
+        "keywords": [
+            'мероприятие', 'мероприятия', 'корпоратив', 'тренинг', 'встреча',
+            'неделе', 'недели', 'месяц', 'месяца', 'день', 'дня', 'дата',
+            'время', 'расписание', 'план', 'календарь', 'событие', 'события',
+            'день рождения', 'дни рождения', 'праздник', 'праздники',
+            'конференция', 'семинар', 'вебинар', 'презентация', 'доклад',
+            'выступление', 'обучение', 'курс', 'лекция', 'мастер-класс'
+        ],
+        "synonyms": [
+            'когда', 'расписание', 'план', 'календарь', 'дата', 'время',
+            'запланировано', 'назначено', 'будет', 'пройдет', 'состоится',
+            'организовано', 'подготовлено', 'устроено', 'праздновать',
+            'отмечать', 'поздравлять', 'чествовать', 'проводить',
+            'организовывать', 'планировать', 'готовить', 'устраивать'
+        ],
+        "examples": [
+            "какие мероприятия",
+            "когда корпоратив",
+            "расписание мероприятий",
+            "какие встречи",
+            "когда тренинг",
+            "что запланировано",
+            "какие события",
+            "что будет на неделе",
+            "какие встречи запланированы",
+            "расписание на месяц",
+            "когда следующее мероприятие",
+            "что готовится в отделе",
+            "когда день рождения",
+            "какие праздники",
+            "когда конференция",
+            "расписание тренингов",
+            "какие семинары на этой неделе",
+            "когда мастер-класс",
+            "что запланировано на месяц",
+            "какие мероприятия в офисе"
+        ]
+    },
+    "информация о задаче": {
+        "keywords": [
+            'задача', 'задачи', 'дедлайн', 'проект', 'работа', 'поручение',
+            'обязанность', 'функция', 'роль', 'ответственность', 'контроль',
+            'проверка', 'тестирование', 'разработка', 'внедрение',
+            'срок', 'статус', 'прогресс', 'выполнение', 'todo', 'in progress', 'done',
+            'блокер', 'проблема', 'ошибка', 'баг', 'фича', 'улучшение',
+            'оптимизация', 'рефакторинг', 'документация', 'отчет'
+        ],
+        "synonyms": [
+            'сделать', 'выполнить', 'срок', 'статус', 'прогресс', 'ход',
+            'продвижение', 'этап', 'стадия', 'фаза', 'процесс', 'работа',
+            'дело', 'поручение', 'обязанность', 'контролировать',
+            'проверять', 'отслеживать', 'мониторить', 'в работе',
+            'текущие', 'к выполнению', 'сделано', 'выполнено',
+            'заблокировано', 'проблема', 'ошибка', 'исправить',
+            'улучшить', 'оптимизировать', 'переписать', 'документировать'
+        ],
+        "examples": [
+            "какие задачи",
+            "что нужно сделать",
+            "какие дедлайны",
+            "статус задачи",
+            "когда сдать",
+            "что в работе",
+            "текущие задачи",
+            "мои поручения",
+            "что на контроле",
+            "какие проекты в работе",
+            "статус разработки",
+            "ход выполнения",
+            "что нужно сделать до",
+            "какие задачи у",
+            "покажи задачи к выполнению",
+            "какие задачи в работе",
+            "покажи выполненные задачи",
+            "есть ли блокеры",
+            "какие проблемы",
+            "статус проекта"
+        ]
+    },
+    "социальные активности": {
+        "keywords": [
+            'обед', 'игра', 'игры', 'встреча', 'встречи', 'общение',
+            'команда', 'командный', 'вместе', 'совместно', 'активность',
+            'активности', 'досуг', 'отдых', 'развлечение', 'развлечения',
+            'йога', 'спорт', 'фитнес', 'танцы', 'музыка', 'кино',
+            'театр', 'концерт', 'выставка', 'музей', 'парк', 'прогулка',
+            'вечеринка', 'праздник', 'корпоратив', 'тимбилдинг'
+        ],
+        "synonyms": [
+            'поиграть', 'пообедать', 'встретиться', 'познакомиться',
+            'пообщаться', 'провести время', 'отдохнуть', 'развлечься',
+            'командная игра', 'совместный обед', 'групповая активность',
+            'заняться спортом', 'позаниматься йогой', 'потанцевать',
+            'сходить в кино', 'посетить выставку', 'погулять в парке',
+            'отпраздновать', 'провести тимбилдинг', 'организовать вечеринку'
+        ],
+        "examples": [
+            "кто хочет поиграть",
+            "кто идет на обед",
+            "кто хочет встретиться",
+            "найти партнера для игры",
+            "кто свободен на обед",
+            "кто хочет пообщаться",
+            "найти компанию для",
+            "кто хочет присоединиться",
+            "кто готов поиграть",
+            "кто хочет пообедать вместе",
+            "кто занимается йогой",
+            "кто хочет в кино",
+            "кто идет на выставку",
+            "кто хочет в парк",
+            "кто готов к тимбилдингу",
+            "кто хочет на вечеринку",
+            "кто занимается спортом",
+            "кто танцует",
+            "кто любит музыку",
+            "кто хочет в театр"
+        ]
+    },
+    "общая информация": {
+        "keywords": [
+            'что', 'как', 'где', 'когда', 'почему', 'зачем',
+            'информация', 'справка', 'помощь', 'подсказка',
+            'правила', 'политика', 'процедуры', 'процессы',
+            'структура', 'организация', 'компания', 'офис',
+            'рабочее место', 'оборудование', 'ресурсы',
+            'документы', 'файлы', 'база знаний', 'wiki'
+        ],
+        "synonyms": [
+            'расскажи', 'объясни', 'покажи', 'найди', 'дай',
+            'информацию', 'справку', 'помощь', 'подсказку',
+            'правила', 'политику', 'процедуры', 'процессы',
+            'структуру', 'организацию', 'компанию', 'офис',
+            'рабочее место', 'оборудование', 'ресурсы',
+            'документы', 'файлы', 'базу знаний', 'wiki'
+        ],
+        "examples": [
+            "как работает",
+            "где находится",
+            "когда открыто",
+            "что нужно знать",
+            "какие правила",
+            "как пользоваться",
+            "где найти",
+            "как получить доступ",
+            "что делать если",
+            "как решить проблему",
+            "где посмотреть",
+            "как узнать",
+            "что нового",
+            "какие изменения",
+            "как обновить",
+            "где документация",
+            "как настроить",
+            "что требуется",
+            "как начать",
+            "где справка"
+        ]
+    },
+    "день рождения": {
+        "keywords": [
+            'день рождения', 'дни рождения', 'днем рождения', 'дня рождения',
+            'родился', 'родилась', 'родились', 'именинник', 'именинники'
+        ],
+        "synonyms": [
+            'др', 'поздравить', 'поздравление', 'именины', 'празднует'
+        ],
+        "examples": [
+            "у кого день рождения в этом месяце",
+            "когда день рождения у",
+            "кто родился в мае",
+            "ближайшие дни рождения",
+            "дни рождения на следующей неделе",
+            "кого поздравить сегодня",
+            "дни рождения в отделе"
+        ]
+    },
+    "календарь занятости": {
+        "keywords": [
+            'занят', 'занята', 'заняты', 'занятость', 'свободен', 'свободна',
+            'свободны', 'доступен', 'доступность', 'загрузка'
+        ],
+        "synonyms": [
+            'свободное время', 'окно', 'слот', 'график', 'когда может'
+        ],
+        "examples": [
+            "кто свободен на этой неделе",
+            "когда иван занят",
+            "какая занятость в отделе",
+            "кто свободен завтра",
+            "найти свободный слот для встречи"
+        ]
+    },
+    "напоминания": {
+        "keywords": [
+            'напомни', 'напомнить', 'напоминание', 'напоминания', 'уведомление', 'уведомления'
+        ],
+        "synonyms": [
+            'не забыть', 'предупреди', 'оповести', 'сообщи заранее'
+        ],
+        "examples": [
+            "напомни о встрече",
+            "какие у меня напоминания",
+            "поставь напоминание",
+            "напомни про дедлайн"
+        ]
+    }
+}
+
+# Примеры без стоп-слов правил (как и текст запроса) и их слова. Сравнение по целым словам,
+# а не по подстрокам: раньше «у» или «кто» совпадали почти с каждым примером, и 20 примеров
+# «кто хочет...» давали социальным активностям 6 баллов за любой вопрос со словом «кто»
+EXAMPLES = {
+    category: [
+        (' '.join(words), frozenset(words))
+        for words in ([word for word in example.split() if word not in RULE_STOPWORDS] for example in patterns["examples"])
+    ]
+    for category, patterns in category_patterns.items()
+}
+
+def _content_words(words: List[str]) -> frozenset:
+    """Words that can tie a query to an example: no question words, pronouns or prepositions."""
+    return frozenset(word for word in words if len(word) >= MIN_TERM_LENGTH and word not in BUILTIN_SEARCH_STOPWORDS)
+
+# Примеры вопросов из WELCOME_MESSAGE/HELP_MESSAGE и /help telegram_bot - регрессионная таблица правил
+EXAMPLE_QUERIES = [
+    ("Кто знает Python?", "поиск сотрудника"),
+    ("Кто работает в IT отделе?", "поиск сотрудника"),
+    ("Найди сотрудника по имени Иван", "поиск сотрудника"),
+    ("Какие навыки у Марии?", "поиск сотрудника"),
+    ("Кто специализируется на Python?", "поиск сотрудника"),
+    ("Какие мероприятия на этой неделе?", "информация о мероприятии"),
+    ("Какие мероприятия запланированы на этой неделе?", "информация о мероприятии"),
+    ("Когда следующая встреча команды?", "информация о мероприятии"),
+    ("Где будет проходить тренинг?", "информация о мероприятии"),
+    ("Кто организатор мероприятия?", "информация о мероприятии"),
+    ("Покажи мои задачи", "информация о задаче"),
+    ("Какие у меня активные задачи?", "информация о задаче"),
+    ("Какие задачи назначены на Ивана?", "информация о задаче"),
+    ("Какие задачи с высоким приоритетом?", "информация о задаче"),
+    ("Какие задачи нужно выполнить до конца недели?", "информация о задаче"),
+    ("Какие активности сегодня?", "социальные активности"),
+    ("Какие активности запланированы?", "социальные активности"),
+    ("Когда турнир по настольному теннису?", "социальные активности"),
+    ("Кто участвует в активностях?", "социальные активности"),
+    ("Какие активности в спортзале?", "социальные активности"),
+    ("Когда день рождения у Марии?", "день рождения"),
+    ("У кого день рождения в этом месяце?", "день рождения"),
+    ("Кто родился в мае?", "день рождения"),
+    ("Кто свободен для встречи?", "календарь занятости"),
+    ("Кто свободен на этой неделе?", "календарь занятости"),
+    ("Когда Иван занят?", "календарь занятости"),
+    ("Какая занятость в IT отделе?", "календарь занятости"),
+    ("Какие правила работы в компании?", "общая информация"),
+    ("Где находится офис?", "общая информация"),
+    ("Как связаться с HR?", "общая информация"),
+]
+
+def preprocess_query(query: str) -> str:
+    """Preprocess the query for better classification (``text_pipeline.analyze(query).text``)."""
+    return analyze(query).text
+
+def calculate_category_score(query: str, category: str) -> float:
+    """Calculate a score for how well the query matches a category."""
+    score = 0.0
+    patterns = category_patterns[category]
+    words = query.split()
+    content = _content_words(words)
+    
+    # Проверяем наличие ключевых слов
+    for keyword in patterns["keywords"]:
+        if keyword in query:
+            score += 0.4
+        elif any(word.startswith(keyword) or keyword.startswith(word) for word in words):
+            score += 0.2
+    
+    # Проверяем синонимы
+    for synonym in patterns["synonyms"]:
+        if synonym in query:
+            score += 0.3
+        elif any(word.startswith(synonym) or synonym.startswith(word) for word in words):
+            score += 0.15
+    
+    # Проверяем примеры
+    for example, example_words in EXAMPLES[category]:
+        if example in query:
+            score += 0.6
+        elif content & example_words:
+            score += 0.3
+    
+    # Дополнительные проверки для поиска сотрудников
+    if category == "поиск сотрудника":
+        if any(word in query for word in ['знает', 'умеет', 'может', 'навыки', 'опыт']):
+            score += 1.0
+        if any(word in query for word in ['python', 'java', 'javascript', 'react', 'django']):
+            score += 1.0
+        if any(word in query for word in ['кто', 'найти', 'найди', 'показать', 'список']):
+            score += 0.5
+        if 'сотрудник' in query:
+            score += 0.5
+    
+    # Дополнительные проверки для мероприятий
+    if category == "информация о мероприятии":
+        if any(word in query for word in ['неделе', 'недели', 'сегодня', 'завтра']):
+            score += 1.0
+        if any(word in query for word in ['мероприятия', 'события', 'встречи']):
+            score += 0.5
+    
+    # Дополнительные проверки для задач
+    if category == "информация о задаче":
+        if any(word in query for word in ['задача', 'задачи', 'задачу', 'задач']):
+            score += 0.5
+        if any(word in query for word in ['сделать', 'выполнить', 'сделано', 'выполнено']):
+            score += 0.5
+        if any(word in query for word in ['в работе', 'текущие', 'к выполнению']):
+            score += 0.5
+        if any(word in query for word in ['todo', 'in progress', 'done']):
+            score += 0.5
+    
+    # Дополнительные проверки для социальных активностей
+    if category == "социальные активности":
+        if any(word in query for word in ['игра', 'игры', 'поиграть', 'настольные']):
+            score += 0.5
+        if any(word in query for word in ['обед', 'пообедать', 'вместе']):
+            score += 0.5
+        if 'активност' in query:  # активность, активности, активностях
+            score += 1.5
+        if any(word in query for word in ['турнир', 'теннис', 'спортзал', 'участву']):
+            score += 1.0
+        if any(word in query for word in ['йог', 'спорт', 'фитнес', 'танц']):
+            score += 1.0
+        if any(word in query for word in ['кино', 'театр', 'концерт', 'выставк', 'музык']):
+            score += 1.0
+    
+    # Дни рождения и занятость: тема задается одним словом, а время («в мае», «на этой неделе»)
+    # иначе перевешивает в пользу мероприятий
+    if category == "день рождения":
+        if any(word in query for word in ['рожден', 'родил', 'именин']):
+            score += 1.5
+    
+    if category == "календарь занятости":
+        if any(word in query for word in ['свобод', 'занят', 'доступен', 'доступн', 'загрузк']):
+            score += 1.5
+    
+    # Дополнительные проверки для общей информации
+    if category == "общая информация":
+        if any(word in query for word in ['правила', 'офис', 'связаться', 'контакт', 'телефон']):
+            score += 0.5
+    
+    return score
+
+
+class StageResult:
+    __slots__ = ('stage', 'category', 'confidence', 'margin')
+
+    def __init__(self, stage: str, category: str, confidence: float, margin: float):
+        self.stage = stage
+        self.category = category
+        self.confidence = confidence
+        self.margin = margin
+
+
+def _top_two(scores: Dict[str, float]) -> Tuple[str, float, float]:
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    best, best_score = ranked[0]
+    runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+    return best, best_score, best_score - runner_up
+
+
+class IntentRouter:
+    """Rules -> embeddings -> NLI cascade over a fixed set of categories.
+
+    ``encoder`` is anything with a SentenceTransformer-like ``encode`` (or None
+    to skip the stage). ``nli_factory`` returns a zero-shot pipeline and is
+    called on first use, so processes that never reach the last stage never
+    load BART.
+    """
+
+    STAGES = ('rules', 'embeddings', 'nli')
+
+    def __init__(self, categories: Sequence[str] = CATEGORIES, encoder=None,
+                 nli_factory: Optional[Callable] = None, settings: Optional[dict] = None):
+        self.categories = list(categories)
+        self.labels = [category for category in self.categories if category != FALLBACK_CATEGORY]
+        self.encoder = encoder
+        self.nli_factory = nli_factory
+        self.settings = dict(INTENT_SETTINGS, **(settings or {}))
+        self._nli = None
+        self._prototypes: Optional[np.ndarray] = None
+        self._prototype_labels: List[str] = []
+        self._lock = threading.Lock()
+        # Загрузка BART и кодирование прототипов долгие: под своей блокировкой, а не под _lock статистики
+        self._load_lock = threading.Lock()
+        self._stats = {stage: {'calls': 0, 'resolved': 0, 'seconds': 0.0} for stage in self.STAGES}
+
+    # --- stages -----------------------------------------------------------
+
+    def _rules(self, query: str) -> StageResult:
+        text = analyze(query).text
+        scores = {category: calculate_category_score(text, category) for category in self.labels}
+        category, score, margin = _top_two(scores)
+        return StageResult('rules', category, score, margin)
+
+    def _prototype_matrix(self) -> np.ndarray:
+        """Normalized embeddings of every category name and example, computed once."""
+        if self._prototypes is None:
+            with self._load_lock:
+                if self._prototypes is None:
+                    texts, labels = [], []
+                    for category in self.labels:
+                        for text in [category] + category_patterns.get(category, {}).get('examples', []):
+                            texts.append(text)
+                            labels.append(category)
+                    matrix = np.asarray(self.encoder.encode(texts), dtype=np.float32)
+                    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+                    self._prototype_labels = labels
+                    self._prototypes = matrix
+                    logger.info("Encoded %d intent prototypes for %d categories", len(texts), len(self.labels))
+        return self._prototypes
+
+    def _embeddings(self, query: str) -> StageResult:
+        prototypes = self._prototype_matrix()
+        vector = np.asarray(self.encoder.encode(query), dtype=np.float32)
+        vector /= np.linalg.norm(vector) + 1e-12
+        similarities = prototypes @ vector
+        scores: Dict[str, float] = {}
+        # Похожесть на категорию - лучшее совпадение среди ее примеров
+        for label, similarity in zip(self._prototype_labels, similarities.tolist()):
+            if similarity > scores.get(label, -1.0):
+                scores[label] = similarity
+        category, score, margin = _top_two(scores)
+        return StageResult('embeddings', category, score, margin)
+
+    def _nli_stage(self, query: str) -> StageResult:
+        if self._nli is None:
+            with self._load_lock:
+                if self._nli is None:
+                    self._nli = tracing.instrument_callable(self.nli_factory(), 'zero_shot_nli')
+        result = self._nli(query, self.categories)
+        scores = dict(zip(result['labels'], result['scores']))
+        category, score, margin = _top_two(scores)
+        return StageResult('nli', category, score, margin)
+
+    # --- cascade ----------------------------------------------------------
+
+    def _run(self, stage: str, fn: Callable[[str], StageResult], query: str,
+             min_score: float, min_margin: float) -> Tuple[Optional[StageResult], bool]:
+        started = time.perf_counter()
+        try:
+            result = fn(query)
+        except Exception:
+            logger.exception("Intent stage %s failed", stage)
+            result = None
+        elapsed = time.perf_counter() - started
+        resolved = result is not None and result.confidence >= min_score and result.margin >= min_margin
+        with self._lock:
+            stats = self._stats[stage]
+            stats['calls'] += 1
+            stats['resolved'] += resolved
+            stats['seconds'] += elapsed
+        if TRACING_ENABLED:
+            INTENT_STAGE_SECONDS.observe(elapsed, stage=stage, outcome='resolved' if resolved else 'passed')
+        return result, resolved
+
+    def route(self, query: str) -> StageResult:
+        """Classify ``query`` with the cheapest stage that is confident about it."""
+        settings = self.settings
+        query = query.lower()
+        candidates = []
+
+        result, resolved = self._run('rules', self._rules, query,
+                                     settings['rule_min_score'], settings['rule_min_margin'])
+        if resolved:
+            return result
+        candidates.append(result)
+
+        if self.encoder is not None:
+            result, resolved = self._run('embeddings', self._embeddings, query,
+                                         settings['embedding_min_similarity'], settings['embedding_min_margin'])
+            if resolved:
+                return result
+            candidates.append(result)
+
+        if self.nli_factory is not None and settings['nli_enabled']:
+            result, _ = self._run('nli', self._nli_stage, query, 0.0, 0.0)
+            if result is not None:
+                candidates.append(result)
+
+        # Никто не уверен: ответ последней сработавшей ступени, а при низкой уверенности - fallback
+        for result in reversed(candidates):
+            if result is None:
+                continue
+            if result.stage == 'rules' and result.confidence < settings['rule_fallback_score']:
+                break
+            if result.stage != 'rules' and result.confidence < settings['min_confidence']:
+                break
+            return result
+        return StageResult('fallback', FALLBACK_CATEGORY if FALLBACK_CATEGORY in self.categories
+                           else self.labels[0], 0.0, 0.0)
+
+    def classify(self, query: str) -> Tuple[str, float]:
+        """(category, confidence) - the signature both bots used before."""
+        result = self.route(query)
+        message_logger.info("Classified query %r as %r with confidence %.2f (stage: %s)",
+                            query, result.category, result.confidence, result.stage)
+        return result.category, result.confidence
+
+    def warm_up(self):
+        """Encode the prototypes ahead of the first message."""
+        if self.encoder is not None:
+            self._prototype_matrix()
+
+    def stats(self) -> Dict[str, dict]:
+        with self._lock:
+            total = self._stats['rules']['calls'] or 1
+            return {
+                stage: dict(
+                    values,
+                    share_resolved=round(values['resolved'] / total, 3),
+                    avg_ms=round(values['seconds'] / values['calls'] * 1000, 3) if values['calls'] else 0.0,
+                )
+                for stage, values in self._stats.items()
+            }
+
+
+def check_examples(router: Optional['IntentRouter'] = None) -> List[Tuple[str, str, StageResult]]:
+    """EXAMPLE_QUERIES the router gets wrong, as (query, expected, result); rules only by default."""
+    router = router or IntentRouter()
+    mismatches = []
+    for query, expected in EXAMPLE_QUERIES:
+        result = router.route(query)
+        if result.category != expected:
+            mismatches.append((query, expected, result))
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--check', action='store_true', help='route EXAMPLE_QUERIES with the rules')
+    args = parser.parse_args()
+    if not args.check:
+        parser.print_help()
+        return
+    mismatches = check_examples()
+    for query, expected, result in mismatches:
+        print(f"{query!r}: expected {expected!r}, got {result.category!r} "
+              f"({result.stage}, score {result.confidence:.2f}, margin {result.margin:.2f})")
+    print(f"{len(EXAMPLE_QUERIES) - len(mismatches)}/{len(EXAMPLE_QUERIES)} example queries routed correctly")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
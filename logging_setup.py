@@ -0,0 +1,144 @@
+"""Logging configuration shared by the bots and the web app.
+
+Features (all driven by ``config.LOGGING_SETTINGS``):
+  * asynchronous mode: callers only enqueue the LogRecord, formatting and I/O
+    happen on a QueueListener thread;
+  * structured JSON lines or the classic text format;
+  * per-logger sampling for high-volume per-message loggers
+    (``telegram_bot.messages``, ``bot.messages``);
+  * a size cap on the formatted message so full responses never hit the log.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from typing import Dict, Optional
+
+from config import DEBUG, LOGGING_SETTINGS
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_configured = False
+
+
+def _truncate(message: str, limit: int) -> str:
+    if limit and len(message) > limit:
+        return f"{message[:limit]}... [{len(message) - limit} chars truncated]"
+    return message
+
+
+class TruncatingFormatter(logging.Formatter):
+    """Text formatter that caps the rendered message size."""
+
+    def __init__(self, fmt: str = TEXT_FORMAT, max_payload: int = 0):
+        super().__init__(fmt)
+        self.max_payload = max_payload
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        record.message = _truncate(record.message, self.max_payload)
+        return super().formatMessage(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; ``extra=`` fields are included as-is."""
+
+    _reserved = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+    def __init__(self, max_payload: int = 0):
+        super().__init__()
+        self.max_payload = max_payload
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': _truncate(record.getMessage(), self.max_payload),
+        }
+        for key, value in record.__dict__.items():
+            if key not in self._reserved:
+                payload[key] = value
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps roughly ``rate`` of the records below WARNING; warnings always pass."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that defers message formatting to the listener thread.
+
+    The stock ``prepare`` renders the message in the calling thread; records
+    stay in-process here, so they can be enqueued untouched.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _parse_sample_rates(spec: str) -> Dict[str, float]:
+    rates = {}
+    for item in spec.split(','):
+        if '=' in item:
+            name, rate = item.split('=', 1)
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+@atexit.register
+def _stop_listener():
+    """Flush and stop the current queue listener; registered once for the whole process."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def configure_logging(force: bool = False):
+    """Install the root handlers once per process (idempotent unless ``force``)."""
+    global _listener, _configured
+    if _configured and not force:
+        return
+    _stop_listener()
+
+    max_payload = LOGGING_SETTINGS['max_payload']
+    if LOGGING_SETTINGS['format'] == 'json':
+        formatter = JsonFormatter(max_payload)
+    else:
+        formatter = TruncatingFormatter(TEXT_FORMAT, max_payload)
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(formatter)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.setLevel(logging.DEBUG if DEBUG else logging.INFO)
+
+    if LOGGING_SETTINGS['async']:
+        log_queue = queue.SimpleQueue()
+        root.addHandler(LazyQueueHandler(log_queue))
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+    else:
+        root.addHandler(stream_handler)
+
+    for name, rate in _parse_sample_rates(LOGGING_SETTINGS['sample_rates']).items():
+        target = logging.getLogger(name)
+        for existing in [f for f in target.filters if isinstance(f, SamplingFilter)]:
+            target.removeFilter(existing)
+        if rate < 1.0:
+            target.addFilter(SamplingFilter(rate))
+    _configured = True
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, Table, Enum, Text, Boolean, Float
+from sqlalchemy import create_engine, BigInteger, Column, Integer, String, DateTime, ForeignKey, Table, Enum, Text, Boolean, Float, Index, event, inspect, update, extract
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
@@ -7,6 +7,7 @@ from typing import Optional
 import os
 from dotenv import load_dotenv
 import logging
+from replica import ReplicaMonitor, RoutingSession
 
 # Configure logging
 logging.basicConfig(
@@ -24,11 +25,16 @@ Base = declarative_base()
 # Create engine
 engine = create_engine(os.getenv('DATABASE_URL', 'sqlite:///corporate_bot.db'))
 
-# Create session factory
-Session = sessionmaker(bind=engine)
+# Optional read replica: searches read from it while it keeps up (replica.py)
+read_engine = create_engine(os.getenv('READ_DATABASE_URL')) if os.getenv('READ_DATABASE_URL') else None
+replica_monitor = ReplicaMonitor(engine, read_engine) if read_engine is not None else None
 
-def get_session():
-    return Session()
+# Create session factory; reads are routed per statement, writes always go to engine
+Session = sessionmaker(class_=RoutingSession, bind=engine, read_bind=read_engine, monitor=replica_monitor)
+
+def get_session(primary=False):
+    """Session for a request; ``primary=True`` for read-then-write jobs that must not see replica lag."""
+    return Session(primary=primary)
 
 class TaskStatus(enum.Enum):
     TODO = "todo"
@@ -78,6 +84,7 @@ class Employee(Base):
     skills = Column(Text)
     interests = Column(Text)
     birthday = Column(DateTime)
+    birth_md = Column(Integer)  # month * 100 + day, derived from birthday for indexed range scans
     hire_date = Column(DateTime, default=datetime.utcnow)
     is_active = Column(Boolean, default=True)
     timezone = Column(String(50), default='UTC')
@@ -85,23 +92,39 @@ class Employee(Base):
     avatar_url = Column(String(200))
     bio = Column(Text)
     social_links = Column(Text)  # JSON string of social media links
+    telegram_id = Column(BigInteger, index=True)  # chat id for reminders and notifications
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # snapshot generations (snapshot.py)
+    
+    __table_args__ = (
+        Index('ix_employees_birth_md', 'birth_md'),
+        Index('ix_employees_department_birth_md', 'department', 'birth_md'),
+    )
     
     # Relationships
     assigned_tasks = relationship("Task", foreign_keys="Task.assignee_id", back_populates="assignee")
     created_tasks = relationship("Task", foreign_keys="Task.creator_id", back_populates="creator")
     events = relationship("Event", secondary=event_participants, back_populates="participants")
     activities = relationship("Activity", secondary=activity_participants, back_populates="participants")
+    skill_entries = relationship("Skill", secondary="employee_skills", viewonly=True)  # derived from skills (taxonomy.py)
     
     def __repr__(self):
         return f"<Employee {self.name} {self.surname}>"
 
+def birth_md_key(birthday) -> Optional[int]:
+    """(month, day) of a birthday packed as MMDD."""
+    return birthday.month * 100 + birthday.day if birthday else None
+
+@event.listens_for(Employee.birthday, 'set')
+def _sync_birth_md(target, value, oldvalue, initiator):
+    target.birth_md = birth_md_key(value)
+
 class Event(Base):
     __tablename__ = 'events'
     
     id = Column(Integer, primary_key=True)
     title = Column(String(200), nullable=False)
     description = Column(Text)
-    start_time = Column(DateTime, nullable=False)
+    start_time = Column(DateTime, nullable=False, index=True)
     end_time = Column(DateTime, nullable=False)
     location = Column(String(200))
     event_type = Column(Enum(EventType), nullable=False)
@@ -130,7 +153,7 @@ class Task(Base):
     priority = Column(Integer, default=0)
     assignee_id = Column(Integer, ForeignKey('employees.id'))
     creator_id = Column(Integer, ForeignKey('employees.id'))
-    due_date = Column(DateTime)
+    due_date = Column(DateTime, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     estimated_hours = Column(Float)
@@ -141,6 +164,7 @@ class Task(Base):
     # Relationships
     assignee = relationship("Employee", foreign_keys=[assignee_id], back_populates="assigned_tasks")
     creator = relationship("Employee", foreign_keys=[creator_id], back_populates="created_tasks")
+    tag_entries = relationship("Tag", secondary="task_tags", viewonly=True)  # derived from tags (taxonomy.py)
     
     def __repr__(self):
         return f"<Task {self.title}>"
@@ -152,7 +176,7 @@ class Activity(Base):
     title = Column(String(200), nullable=False)
     description = Column(Text)
     activity_type = Column(Enum(ActivityType), nullable=False)
-    start_time = Column(DateTime, nullable=False)
+    start_time = Column(DateTime, nullable=False, index=True)
     end_time = Column(DateTime, nullable=False)
     location = Column(String(200))
     organizer_id = Column(Integer, ForeignKey('employees.id'))
@@ -182,12 +206,159 @@ class GeneralInfo(Base):
     is_active = Column(Boolean, default=True)
     priority = Column(Integer, default=0)
     
+    tag_entries = relationship("Tag", secondary="info_tags", viewonly=True)  # derived from tags (taxonomy.py)
+    
     def __repr__(self):
         return f"<GeneralInfo {self.title}>"
 
+class Skill(Base):
+    __tablename__ = 'skills'
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100), nullable=False)  # as first written ("B2B-продажи")
+    normalized = Column(String(100), nullable=False, unique=True)  # lookup key ("b2b продажи")
+    
+    def __repr__(self):
+        return f"<Skill {self.name}>"
+
+class Tag(Base):
+    __tablename__ = 'tags'
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100), nullable=False)
+    normalized = Column(String(100), nullable=False, unique=True)
+    
+    def __repr__(self):
+        return f"<Tag {self.name}>"
+
+# Normalized link tables, derived from the Text columns (Employee.skills, Task.tags, GeneralInfo.tags)
+employee_skills = Table(
+    'employee_skills',
+    Base.metadata,
+    Column('employee_id', Integer, ForeignKey('employees.id'), primary_key=True),
+    Column('skill_id', Integer, ForeignKey('skills.id'), primary_key=True),
+    Index('ix_employee_skills_skill', 'skill_id', 'employee_id')
+)
+
+task_tags = Table(
+    'task_tags',
+    Base.metadata,
+    Column('task_id', Integer, ForeignKey('tasks.id'), primary_key=True),
+    Column('tag_id', Integer, ForeignKey('tags.id'), primary_key=True),
+    Index('ix_task_tags_tag', 'tag_id', 'task_id')
+)
+
+info_tags = Table(
+    'info_tags',
+    Base.metadata,
+    Column('info_id', Integer, ForeignKey('general_info.id'), primary_key=True),
+    Column('tag_id', Integer, ForeignKey('tags.id'), primary_key=True),
+    Index('ix_info_tags_tag', 'tag_id', 'info_id')
+)
+
+def archive_table(table, *indexed):
+    """``<table>_archive``: the same columns without keys, plus archived_at (archive.py)."""
+    # Без первичного ключа: SQLite может выдать id удаленной последней строки снова
+    columns = [Column(c.name, c.type) for c in table.columns]
+    archive = Table(f'{table.name}_archive', Base.metadata, *columns,
+                    Column('archived_at', DateTime, nullable=False))
+    for name in indexed:
+        Index(f'ix_{archive.name}_{name}', archive.c[name])
+    return archive
+
+# Прошедшие мероприятия и активности, давно выполненные задачи; горячие таблицы остаются небольшими
+events_archive = archive_table(Event.__table__, 'id', 'start_time')
+activities_archive = archive_table(Activity.__table__, 'id', 'start_time')
+tasks_archive = archive_table(Task.__table__, 'id', 'assignee_id', 'updated_at')
+event_participants_archive = archive_table(event_participants, 'event_id', 'employee_id')
+activity_participants_archive = archive_table(activity_participants, 'activity_id', 'employee_id')
+
+class EmployeeSummary(Base):
+    """Denormalized per-employee read model, maintained by employee_summary.py."""
+    __tablename__ = 'employee_summary'
+    
+    employee_id = Column(Integer, ForeignKey('employees.id', ondelete='CASCADE'), primary_key=True)
+    name = Column(String(100), nullable=False)
+    surname = Column(String(100), nullable=False)
+    position = Column(String(100))
+    department = Column(String(100))
+    is_active = Column(Boolean, default=True)
+    open_tasks = Column(Integer, nullable=False, default=0)  # status != DONE
+    next_due_date = Column(DateTime)  # earliest due date among open tasks
+    upcoming_events = Column(Integer, nullable=False, default=0)
+    next_event_at = Column(DateTime, index=True)
+    next_event_title = Column(String(200))
+    upcoming_activities = Column(Integer, nullable=False, default=0)
+    next_activity_at = Column(DateTime, index=True)
+    next_activity_title = Column(String(200))
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('ix_employee_summary_listing', 'is_active', 'department', 'surname', 'name'),
+    )
+    
+    def __repr__(self):
+        return f"<EmployeeSummary {self.employee_id} tasks={self.open_tasks}>"
+
+class ReminderCheckpoint(Base):
+    __tablename__ = 'reminder_checkpoints'
+    
+    name = Column(String(50), primary_key=True)
+    processed_until = Column(DateTime, nullable=False)  # reminder moments up to this time are already queued
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ReminderOutbox(Base):
+    __tablename__ = 'reminder_outbox'
+    
+    id = Column(Integer, primary_key=True)
+    telegram_id = Column(BigInteger, nullable=False)
+    text = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, index=True)
+    attempts = Column(Integer, default=0)  # неудачные попытки доставки
+    failed_at = Column(DateTime)  # последняя неудачная попытка
+    retry_at = Column(DateTime)  # до этого момента строка не отправляется повторно
+    
+    def __repr__(self):
+        return f"<ReminderOutbox {self.telegram_id} sent={self.sent_at} attempts={self.attempts}>"
+
+def _add_missing_columns(bind):
+    """Additive migration: create columns and indexes added to models after the table was created."""
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    column_type = column.type.compile(dialect=bind.dialect)
+                    conn.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+                    logger.info("Added column %s.%s", table.name, column.name)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind, checkfirst=True)
+
+def _backfill_derived_columns(bind):
+    with bind.begin() as conn:
+        conn.execute(
+            update(Employee.__table__)
+            .where(Employee.birthday.isnot(None), Employee.birth_md.is_(None))
+            .values(birth_md=extract('month', Employee.birthday) * 100 + extract('day', Employee.birthday))
+        )
+
 # Create all tables
-def init_db():
-    Base.metadata.create_all(engine)
+def init_db(bind=None):
+    bind = bind or engine
+    Base.metadata.create_all(bind)
+    _add_missing_columns(bind)
+    _backfill_derived_columns(bind)
+    # employee_summary и taxonomy импортируют этот модуль, поэтому импорт здесь, а не наверху
+    from employee_summary import backfill
+    from taxonomy import backfill as backfill_labels
+    backfill(bind)
+    backfill_labels(bind)
 
 def parse_date(date_str):
     """Parse date string to datetime object."""
@@ -0,0 +1,331 @@
+"""Rate-limited, prioritized outbound message dispatcher for Telegram.
+
+All replies and notifications go through ``OutboundDispatcher`` instead of
+calling ``reply_text``/``send_message`` inline:
+
+  * a global token bucket keeps the bot under ~30 messages/s and per-chat
+    buckets keep each chat under Telegram's per-chat limits (1/s for private
+    chats, 20/min for groups);
+  * priority lanes: interactive replies always go before bulk notifications
+    (reminders, broadcasts);
+  * messages to one chat are delivered in order, one at a time;
+  * ``RetryAfter`` (HTTP 429) pauses sending for the requested time and the
+    message is retried;
+  * texts longer than 4096 characters are split on paragraph/line/word
+    boundaries.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from enum import IntEnum
+from typing import Callable, Dict, List, Optional, Set
+
+from telegram import Update
+from telegram.error import RetryAfter, TelegramError
+from telegram.ext import Application, ContextTypes
+
+from config import OUTBOUND_SETTINGS
+from rendering import TELEGRAM_MESSAGE_LIMIT
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BULK = 1
+
+
+class TokenBucket:
+    """Classic token bucket: ``rate`` tokens per second, bursts up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Seconds until one token is available (0 if available now)."""
+        self._refill(time.monotonic())
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self._refill(time.monotonic())
+        self.tokens -= 1
+
+    async def acquire(self):
+        while True:
+            wait = self.delay()
+            if wait <= 0:
+                self.consume()
+                return
+            await asyncio.sleep(wait)
+
+
+def split_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[str]:
+    """Split text into chunks of at most ``limit`` characters, preferring natural boundaries."""
+    parts = []
+    while len(text) > limit:
+        cut = -1
+        for separator in ('\n\n', '\n', ' '):
+            cut = text.rfind(separator, 0, limit)
+            if cut > limit // 2:
+                break
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut].rstrip())
+        text = text[cut:].lstrip('\n ')
+    if text:
+        parts.append(text)
+    return parts
+
+
+class OutgoingMessage:
+    __slots__ = ('priority', 'seq', 'chat_id', 'text', 'kwargs', 'on_sent', 'attempts', 'done')
+
+    def __init__(self, priority: int, seq: int, chat_id: int, text: str, kwargs: dict,
+                 on_sent: Optional[Callable[[], None]], done: Optional[asyncio.Future]):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.on_sent = on_sent
+        self.attempts = 0
+        self.done = done
+
+    def __lt__(self, other: 'OutgoingMessage') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class OutboundDispatcher:
+    def __init__(self, bot,
+                 global_rate: float = OUTBOUND_SETTINGS['global_rate'],
+                 private_chat_rate: float = OUTBOUND_SETTINGS['private_chat_rate'],
+                 group_chat_rate: float = OUTBOUND_SETTINGS['group_chat_rate'],
+                 max_concurrency: int = OUTBOUND_SETTINGS['max_concurrency'],
+                 max_retries: int = OUTBOUND_SETTINGS['max_retries']):
+        self.bot = bot
+        # Небольшой запас всплеска: capacity + rate за первую секунду не должны превышать лимит Telegram
+        self.global_bucket = TokenBucket(global_rate, capacity=max(1.0, global_rate / 5))
+        self.private_chat_rate = private_chat_rate
+        self.group_chat_rate = group_chat_rate
+        self.max_retries = max_retries
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+        self.ready: List[OutgoingMessage] = []
+        self.deferred: List = []  # (ready_at, message)
+        self.in_flight_chats: Set[int] = set()
+        self.paused_until = 0.0
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.wakeup = asyncio.Event()
+        self.seq = itertools.count()
+        self.stats = {'sent': 0, 'failed': 0, 'retried': 0, 'split': 0}
+        self.stopping = False
+        self._deliveries: Set[asyncio.Future] = set()
+        self._worker: Optional[asyncio.Task] = None
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            # Отрицательные id - группы и каналы, у них лимит строже
+            rate = self.group_chat_rate if chat_id < 0 else self.private_chat_rate
+            bucket = self.chat_buckets[chat_id] = TokenBucket(rate, capacity=1)
+        return bucket
+
+    async def send(self, chat_id: int, text: str, priority: Priority = Priority.BULK,
+                   on_sent: Optional[Callable[[], None]] = None,
+                   on_failed: Optional[Callable[[], None]] = None, **kwargs) -> asyncio.Future:
+        """Enqueue a message. The returned future resolves to True once every part is delivered.
+
+        ``on_sent`` runs after the last part has been accepted by Telegram,
+        ``on_failed`` once if any part is given up on (error, retries exhausted,
+        still queued on ``stop``).
+        """
+        loop = asyncio.get_running_loop()
+        parts = split_message(text)
+        if len(parts) > 1:
+            self.stats['split'] += 1
+        futures = []
+        for index, part in enumerate(parts):
+            last = index == len(parts) - 1
+            future = loop.create_future()
+            futures.append(future)
+            heapq.heappush(self.ready, OutgoingMessage(
+                int(priority), next(self.seq), chat_id, part, kwargs, on_sent if last else None, future
+            ))
+        self.wakeup.set()
+        delivered = asyncio.ensure_future(self._all_delivered(futures))
+        if on_failed is not None:
+            delivered.add_done_callback(lambda done: self._report_failure(done, chat_id, on_failed))
+        self._deliveries.add(delivered)
+        delivered.add_done_callback(self._deliveries.discard)
+        return delivered
+
+    @staticmethod
+    async def _all_delivered(futures: List[asyncio.Future]) -> bool:
+        return all(await asyncio.gather(*futures))
+
+    @staticmethod
+    def _report_failure(delivered: asyncio.Future, chat_id: int, on_failed: Callable[[], None]):
+        if not delivered.cancelled() and delivered.exception() is None and delivered.result():
+            return
+        try:
+            on_failed()
+        except Exception:
+            logger.exception("on_failed callback failed for chat %s", chat_id)
+
+    def _promote_deferred(self, now: float):
+        while self.deferred and self.deferred[0][0] <= now:
+            _, message = heapq.heappop(self.deferred)
+            heapq.heappush(self.ready, message)
+
+    def _next_sendable(self, now: float) -> Optional[OutgoingMessage]:
+        """Pop the best message whose chat is idle and under its rate limit."""
+        postponed = []
+        chosen = None
+        blocked_chats: Set[int] = {message.chat_id for _, message in self.deferred}
+        while self.ready:
+            message = heapq.heappop(self.ready)
+            chat_id = message.chat_id
+            if chat_id in blocked_chats or chat_id in self.in_flight_chats:
+                postponed.append(message)
+                continue
+            delay = self._chat_bucket(chat_id).delay()
+            if delay > 0:
+                # Остальные сообщения этого чата ждут вместе с ним, чтобы сохранить порядок
+                blocked_chats.add(chat_id)
+                heapq.heappush(self.deferred, (now + delay, message))
+                continue
+            chosen = message
+            break
+        for message in postponed:
+            heapq.heappush(self.ready, message)
+        return chosen
+
+    async def _deliver(self, message: OutgoingMessage):
+        try:
+            await self.bot.send_message(chat_id=message.chat_id, text=message.text, **message.kwargs)
+        except RetryAfter as e:
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else e.retry_after
+            message.attempts += 1
+            self.stats['retried'] += 1
+            logger.warning("Flood limit hit for chat %s, pausing %.1fs", message.chat_id, retry_after)
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            if message.attempts <= self.max_retries:
+                heapq.heappush(self.ready, message)
+            else:
+                self._finish(message, False)
+            return
+        except TelegramError as e:
+            logger.error("Failed to send message to %s: %s", message.chat_id, e)
+            self._finish(message, False)
+            return
+        self._finish(message, True)
+
+    def _finish(self, message: OutgoingMessage, ok: bool):
+        self.stats['sent' if ok else 'failed'] += 1
+        if ok and message.on_sent is not None:
+            try:
+                message.on_sent()
+            except Exception:
+                logger.exception("on_sent callback failed for chat %s", message.chat_id)
+        if message.done is not None and not message.done.done():
+            message.done.set_result(ok)
+
+    async def _send_one(self, message: OutgoingMessage):
+        try:
+            await self._deliver(message)
+        except Exception:
+            logger.exception("Unexpected error while sending to %s", message.chat_id)
+            self._finish(message, False)
+        finally:
+            self.in_flight_chats.discard(message.chat_id)
+            self.semaphore.release()
+            self.wakeup.set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self._promote_deferred(now)
+            message = self._next_sendable(now)
+            if message is None:
+                self.wakeup.clear()
+                timeout = self.deferred[0][0] - now if self.deferred else None
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.semaphore.acquire()
+            await self.global_bucket.acquire()
+            self._chat_bucket(message.chat_id).consume()
+            self.in_flight_chats.add(message.chat_id)
+            loop.create_task(self._send_one(message))
+
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.get_running_loop().create_task(self.run())
+
+    def _fail_queued(self):
+        queued = self.ready + [message for _, message in self.deferred]
+        self.ready, self.deferred = [], []
+        for message in queued:
+            self._finish(message, False)
+
+    async def stop(self, timeout: float = 10.0):
+        """Stop sending: queued messages fail, messages being sent get ``timeout`` seconds to finish.
+
+        Every future returned by ``send`` is resolved by then and its ``on_failed`` has run;
+        ``stopping`` tells the callbacks that the failure is a shutdown, not a delivery error.
+        """
+        self.stopping = True
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        self._fail_queued()
+        if self._deliveries:
+            await asyncio.wait(list(self._deliveries), timeout=timeout)
+        self._fail_queued()  # RetryAfter вернул сообщение в очередь, пока шла отправка
+
+
+async def start_outbound(application: Application):
+    """``post_init`` hook: create and start the dispatcher for this application.
+
+    A sharded webhook worker sets ``bot_data['outbound_share']`` so that the
+    workers together stay under the bot-wide limit.
+    """
+    share = application.bot_data.get('outbound_share', 1.0)
+    dispatcher = OutboundDispatcher(application.bot, global_rate=OUTBOUND_SETTINGS['global_rate'] * share)
+    dispatcher.start()
+    application.bot_data['outbound'] = dispatcher
+    return dispatcher
+
+
+async def stop_outbound(application: Application):
+    """``post_shutdown`` hook."""
+    dispatcher = application.bot_data.get('outbound')
+    if dispatcher is not None:
+        await dispatcher.stop()
+
+
+async def reply(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, **kwargs):
+    """Send an interactive reply through the dispatcher (inline if it is not running).
+
+    ``kwargs`` (e.g. ``parse_mode``) are passed to ``send_message``.
+    """
+    dispatcher = context.application.bot_data.get('outbound')
+    if dispatcher is None:
+        for part in split_message(text):
+            await update.effective_message.reply_text(part, **kwargs)
+        return
+    await dispatcher.send(update.effective_chat.id, text, priority=Priority.INTERACTIVE, **kwargs)
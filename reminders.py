@@ -0,0 +1,247 @@
+"""Scheduled reminders for events, activities and tasks.
+
+Every tick (a job-queue job) looks for items whose reminder moment
+``start_time/due_date - reminder_hours`` fell into ``(checkpoint, now]`` with
+a single UNION ALL query over the indexed time columns. It groups the hits per
+recipient, then writes one outbox row per recipient and advances the
+checkpoint in the same transaction. Delivery goes through the rate-limited
+outbound queue, and each outbox row is marked as sent once Telegram accepts
+it. After a restart nothing in the window is queued twice, and unsent outbox
+rows are picked up again.
+
+A failed delivery (blocked bot, 400/403, retries exhausted) counts an attempt
+on the row and backs it off for REMINDER_SETTINGS['retry_seconds'], doubled
+per attempt. After ``max_attempts`` the row is left unsent for good. The
+pending query skips both in SQL, so failed rows never fill the
+``dispatch_batch`` window ahead of newer reminders.
+
+Only awaiting stays on the event loop: ``plan`` and the pending query run in
+a worker thread. Delivery callbacks only buffer the outbox ids; the marks
+are written in one transaction per ``mark_flush_seconds``, also in a thread.
+An id stays in flight until its mark is written, and the pending query takes
+the same lock as the writes, so a row is never queued twice while its mark
+is pending. A failure during the dispatcher's ``stop`` is not a delivery
+error: the row stays pending without an attempt and goes out after restart.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Set
+
+import pytz
+from sqlalchemy import func, literal, or_, select, union_all, update
+from telegram.ext import ContextTypes
+
+from config import ACTIVITY_SETTINGS, EVENT_SETTINGS, REMINDER_SETTINGS, TASK_SETTINGS, TIMEZONE
+from models import (
+    Activity, Employee, Event, ReminderCheckpoint, ReminderOutbox, Task, TaskStatus,
+    activity_participants, event_participants, get_session
+)
+
+logger = logging.getLogger(__name__)
+
+KIND_EMOJI = {'event': '📅', 'activity': '🎯', 'task': '✅'}
+MARK_CHUNK = 500  # id в одном IN (старые SQLite - не больше 999 параметров)
+
+
+def local_now() -> datetime:
+    # Время в БД хранится без часового пояса, в TIMEZONE
+    return datetime.now(pytz.timezone(TIMEZONE)).replace(tzinfo=None)
+
+
+def due_items_query(start: datetime, end: datetime):
+    """One statement returning (kind, item_id, title, due, telegram_id) for reminder moments in (start, end]."""
+    event_lead = timedelta(hours=EVENT_SETTINGS['reminder_hours'])
+    activity_lead = timedelta(hours=ACTIVITY_SETTINGS['reminder_hours'])
+    task_lead = timedelta(hours=TASK_SETTINGS['reminder_hours'])
+
+    events = select(
+        literal('event').label('kind'), Event.id.label('item_id'), Event.title.label('title'),
+        Event.start_time.label('due'), Employee.telegram_id.label('telegram_id')
+    ).join_from(Event, event_participants, event_participants.c.event_id == Event.id).join(
+        Employee, Employee.id == event_participants.c.employee_id
+    ).where(
+        Event.start_time > start + event_lead,
+        Event.start_time <= end + event_lead,
+        Event.start_time > end,
+        Event.status == 'active',
+        Employee.telegram_id.isnot(None),
+    )
+    activities = select(
+        literal('activity').label('kind'), Activity.id.label('item_id'), Activity.title.label('title'),
+        Activity.start_time.label('due'), Employee.telegram_id.label('telegram_id')
+    ).join_from(Activity, activity_participants, activity_participants.c.activity_id == Activity.id).join(
+        Employee, Employee.id == activity_participants.c.employee_id
+    ).where(
+        Activity.start_time > start + activity_lead,
+        Activity.start_time <= end + activity_lead,
+        Activity.start_time > end,
+        Activity.status == 'active',
+        Employee.telegram_id.isnot(None),
+    )
+    tasks = select(
+        literal('task').label('kind'), Task.id.label('item_id'), Task.title.label('title'),
+        Task.due_date.label('due'), Employee.telegram_id.label('telegram_id')
+    ).join_from(Task, Employee, Employee.id == Task.assignee_id).where(
+        Task.due_date > start + task_lead,
+        Task.due_date <= end + task_lead,
+        Task.due_date > end,
+        Task.status != TaskStatus.DONE,
+        Employee.telegram_id.isnot(None),
+    )
+    return union_all(events, activities, tasks)
+
+
+def format_reminder(items: List) -> str:
+    lines = ["🔔 Напоминания:", ""]
+    for item in sorted(items, key=lambda row: row.due):
+        when = item.due.strftime('%d.%m.%Y %H:%M')
+        prefix = "срок " if item.kind == 'task' else ""
+        lines.append(f"{KIND_EMOJI[item.kind]} {item.title} — {prefix}{when}")
+    return "\n".join(lines)
+
+
+class ReminderEngine:
+    def __init__(self, outbound, name: str = 'default'):
+        self.outbound = outbound
+        self.name = name
+        self._in_flight: Set[int] = set()
+        self._sent: List[int] = []  # отметки, еще не записанные в outbox
+        self._failed: List[int] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._db_lock = asyncio.Lock()  # запись отметок и выборка неотправленных не пересекаются
+
+    def plan(self, now: Optional[datetime] = None) -> int:
+        """Queue reminders for the window since the checkpoint into the outbox. Returns recipients count."""
+        now = now or local_now()
+        session = get_session(primary=True)
+        try:
+            checkpoint = session.get(ReminderCheckpoint, self.name)
+            if checkpoint is None:
+                # Первый запуск: не рассылаем напоминания за прошлые периоды
+                session.add(ReminderCheckpoint(name=self.name, processed_until=now))
+                session.commit()
+                return 0
+            if checkpoint.processed_until >= now:
+                return 0
+
+            rows = session.execute(due_items_query(checkpoint.processed_until, now)).all()
+            per_recipient: Dict[int, List] = defaultdict(list)
+            for row in rows:
+                per_recipient[row.telegram_id].append(row)
+            for telegram_id, items in per_recipient.items():
+                session.add(ReminderOutbox(telegram_id=telegram_id, text=format_reminder(items)))
+            checkpoint.processed_until = now
+            session.commit()
+            if rows:
+                logger.info("Planned %d reminders for %d recipients", len(rows), len(per_recipient))
+            return len(per_recipient)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def _mark_sent(self, outbox_id: int):
+        self._sent.append(outbox_id)
+        self._schedule_flush()
+
+    def _mark_failed(self, outbox_id: int):
+        if self.outbound.stopping:
+            self._in_flight.discard(outbox_id)  # остановка, а не ошибка доставки: попытка не считается
+            return
+        self._failed.append(outbox_id)
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_soon())
+
+    async def _flush_soon(self):
+        while self._sent or self._failed:
+            await asyncio.sleep(REMINDER_SETTINGS['mark_flush_seconds'])
+            await self.flush_marks()
+
+    async def flush_marks(self):
+        """Write the buffered sent and failed marks in one transaction, in a worker thread."""
+        async with self._db_lock:
+            sent, failed = self._sent, self._failed
+            self._sent, self._failed = [], []
+            if not sent and not failed:
+                return
+            try:
+                await asyncio.to_thread(self._write_marks, sent, failed)
+            except Exception:
+                logger.exception("Failed to record %d sent and %d failed reminders", len(sent), len(failed))
+            finally:
+                self._in_flight.difference_update(sent)
+                self._in_flight.difference_update(failed)
+
+    def _write_marks(self, sent: Sequence[int], failed: Sequence[int]):
+        now = datetime.utcnow()
+        dropped = []
+        session = get_session(primary=True)
+        try:
+            for start in range(0, len(sent), MARK_CHUNK):
+                chunk = sent[start:start + MARK_CHUNK]
+                session.execute(update(ReminderOutbox).where(ReminderOutbox.id.in_(chunk)).values(sent_at=now))
+            for start in range(0, len(failed), MARK_CHUNK):
+                chunk = failed[start:start + MARK_CHUNK]
+                for row in session.query(ReminderOutbox).filter(ReminderOutbox.id.in_(chunk)):
+                    row.attempts = (row.attempts or 0) + 1
+                    row.failed_at = now
+                    backoff = REMINDER_SETTINGS['retry_seconds'] * 2 ** (row.attempts - 1)
+                    row.retry_at = now + timedelta(seconds=backoff)
+                    if row.attempts >= REMINDER_SETTINGS['max_attempts']:
+                        dropped.append((row.id, row.telegram_id, row.attempts))
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        for outbox_id, telegram_id, attempts in dropped:
+            logger.warning("Reminder %d to %s dropped after %d failed attempts", outbox_id, telegram_id, attempts)
+
+    def _pending(self, now: datetime) -> List:
+        session = get_session(primary=True)
+        try:
+            return session.query(ReminderOutbox.id, ReminderOutbox.telegram_id, ReminderOutbox.text).filter(
+                ReminderOutbox.sent_at.is_(None),
+                func.coalesce(ReminderOutbox.attempts, 0) < REMINDER_SETTINGS['max_attempts'],
+                or_(ReminderOutbox.retry_at.is_(None), ReminderOutbox.retry_at <= now),
+            ).order_by(ReminderOutbox.id).limit(REMINDER_SETTINGS['dispatch_batch']).all()
+        finally:
+            session.close()
+
+    async def dispatch_pending(self, now: Optional[datetime] = None):
+        """Enqueue unsent outbox rows (including ones left over from a previous run)."""
+        now = now or datetime.utcnow()
+        async with self._db_lock:
+            # Под блокировкой записи отметок: строка, записанная как отправленная после выборки,
+            # но до проверки _in_flight, ушла бы второй раз
+            pending = await asyncio.to_thread(self._pending, now)
+            for outbox_id, telegram_id, text in pending:
+                if outbox_id in self._in_flight:
+                    continue  # еще в очереди outbound или ждет записи отметки
+                self._in_flight.add(outbox_id)
+                await self.outbound.send(
+                    telegram_id, text,
+                    on_sent=lambda outbox_id=outbox_id: self._mark_sent(outbox_id),
+                    on_failed=lambda outbox_id=outbox_id: self._mark_failed(outbox_id),
+                )
+
+    async def tick(self, context: ContextTypes.DEFAULT_TYPE):
+        """Job-queue callback."""
+        try:
+            await asyncio.to_thread(self.plan)
+            await self.dispatch_pending()
+        except Exception:
+            logger.exception("Reminder tick failed")
+
+    async def close(self):
+        """Write the marks still buffered; call after the outbound dispatcher has stopped."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+        await self.flush_marks()
@@ -0,0 +1,296 @@
+"""Precompiled reply templates and size-bounded message assembly.
+
+Answers used to be built with an f-string per card appended to the reply with
+``+=``, for every row found. An "all open tasks" reply was ~350 KB, formatted
+in full and then cut by ``outbound.split_message`` into dozens of messages at
+arbitrary line breaks, while the chat pages through five cards at a time.
+
+  * ``Template`` parses its text once (``string.Formatter().parse``). Each
+    output mode gets a flat list of literal strings and field getters, so a
+    render is one ``''.join`` over getter calls;
+  * field specs: ``{title:b}`` bold, ``{description:300}`` clipped to 300
+    characters with "…", ``{skills:?}`` the whole line is dropped when the
+    value is empty. Getters default to ``attrgetter`` (dotted paths work);
+    computed fields are passed as keyword getters;
+  * modes: ``plain`` (as before), ``html`` and ``markdown`` (MarkdownV2).
+    Values are escaped per mode, literals are escaped once at compile time.
+    ``PARSE_MODES`` gives the Telegram ``parse_mode`` for each;
+  * ``MessageBuilder`` collects rendered blocks into a list and joins once.
+    With a ``limit`` it stops at the last block that fits, renders nothing
+    past it, and ends with "…и ещё N".
+
+Usage:
+    python rendering.py --bench
+    python rendering.py --bench --rows 1000 --repeat 20
+"""
+import argparse
+import html
+import re
+import string
+from operator import attrgetter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+MODES = ('plain', 'html', 'markdown')
+PARSE_MODES = {'plain': None, 'html': 'HTML', 'markdown': 'MarkdownV2'}
+
+# Запас под строку «…и ещё N» (или «Показано X из N...» страницы) в конце ограниченного сообщения
+MORE_RESERVE = 96
+
+_MARKDOWN_SPECIAL = re.compile(r'([_*\[\]()~`>#+\-=|{}.!\\])')
+
+
+def escape(text: str, mode: str = 'plain') -> str:
+    """``text`` as a literal in the given mode."""
+    if mode == 'html':
+        return html.escape(text, quote=False)
+    if mode == 'markdown':
+        return _MARKDOWN_SPECIAL.sub(r'\\\1', text)
+    return text
+
+
+def bold(text: str, mode: str = 'plain') -> str:
+    """Already escaped ``text`` in bold."""
+    if mode == 'html':
+        return f"<b>{text}</b>"
+    if mode == 'markdown':
+        return f"*{text}*"
+    return text
+
+
+def clip(text: str, length: int) -> str:
+    return text if len(text) <= length else text[:length - 1].rstrip() + '…'
+
+
+def or_default(field: str, default: str) -> Callable[[Any], Any]:
+    """Getter: the attribute, or ``default`` when it is empty."""
+    get = attrgetter(field)
+    return lambda row: get(row) or default
+
+
+def strftime(field: str, fmt: str, default: str = '') -> Callable[[Any], str]:
+    """Getter: the datetime attribute formatted with ``fmt``."""
+    get = attrgetter(field)
+
+    def getter(row):
+        value = get(row)
+        return value.strftime(fmt) if value is not None else default
+    return getter
+
+
+def _field(getter: Callable, spec: str, mode: str) -> Callable[[Any], str]:
+    length = int(''.join(c for c in spec if c.isdigit()) or 0)
+    strong = 'b' in spec
+    if mode == 'plain' and not length and not strong:
+        # Самый частый случай: значение как есть, без лишних вызовов
+        def render_plain(row):
+            value = getter(row)
+            return value if value.__class__ is str else ('' if value is None else str(value))
+        return render_plain
+
+    def render(row):
+        value = getter(row)
+        text = '' if value is None else str(value)
+        if length:
+            text = clip(text, length)
+        text = escape(text, mode)
+        return bold(text, mode) if strong else text
+    return render
+
+
+class Template:
+    """Reply text with ``{field:spec}`` placeholders, compiled once per mode (see module docstring)."""
+
+    def __init__(self, text: str, **getters: Callable[[Any], Any]):
+        self.text = text
+        self.getters = getters
+        self._compiled = {mode: self._compile(mode) for mode in MODES}
+
+    def _compile(self, mode: str):
+        lines = []
+        for line in self.text.split('\n'):
+            ops: List[Any] = []
+            required = []
+            for literal, name, spec, _ in string.Formatter().parse(line):
+                if literal:
+                    ops.append(escape(literal, mode))
+                if name is None:
+                    continue
+                getter = self.getters.get(name) or attrgetter(name)
+                if '?' in (spec or ''):
+                    required.append(getter)
+                ops.append(_field(getter, spec or '', mode))
+            lines.append((ops, tuple(required)))
+        if not any(required for _, required in lines):
+            # Без необязательных строк - один плоский список, склеиваемый за раз
+            flat: List[Any] = []
+            for i, (ops, _) in enumerate(lines):
+                if i:
+                    flat.append('\n')
+                flat.extend(ops)
+            return tuple(_merge(flat)), None
+        return None, tuple((tuple(_merge(ops)), required) for ops, required in lines)
+
+    def render(self, row: Any, mode: str = 'plain') -> str:
+        flat, lines = self._compiled[mode]
+        if flat is not None:
+            return ''.join([op if op.__class__ is str else op(row) for op in flat])
+        return '\n'.join([
+            ''.join([op if op.__class__ is str else op(row) for op in ops])
+            for ops, required in lines
+            if all(getter(row) for getter in required)
+        ])
+
+
+def _merge(ops: List[Any]) -> List[Any]:
+    """Adjacent literals as one string."""
+    merged: List[Any] = []
+    for op in ops:
+        if op.__class__ is str and merged and merged[-1].__class__ is str:
+            merged[-1] += op
+        else:
+            merged.append(op)
+    return merged
+
+
+class MessageBuilder:
+    """Rendered blocks joined once; with a ``limit``, only the blocks that fit."""
+
+    def __init__(self, mode: str = 'plain', limit: Optional[int] = TELEGRAM_MESSAGE_LIMIT):
+        self.mode = mode
+        self.limit = limit
+        self.parts: List[str] = []
+        self.size = 0
+        self.count = 0  # показанные блоки (заголовки не считаются)
+        self.omitted = 0
+        self.full = False
+
+    def add(self, text: str, separator: str = '\n\n', counted: bool = True) -> bool:
+        """Append an already rendered block; False (and counted as omitted) once it does not fit."""
+        if self.parts:
+            text = separator + text
+        if self.full or (self.limit is not None and self.size + len(text) > self.limit - MORE_RESERVE):
+            # Первая строка после заголовков попадает всегда (разбить ее - дело outbound.split_message),
+            # иначе страница из одного длинного блока никогда бы не сдвинулась
+            if self.count or self.full:
+                self.full = True
+                self.omitted += counted
+                return False
+        self.parts.append(text)
+        self.size += len(text)
+        self.count += counted
+        return True
+
+    def add_rows(self, rows: Sequence, template: Template, separator: str = '\n\n',
+                 heading: Optional[str] = None) -> int:
+        """Render rows until the message is full (rows past it are not rendered); returns rows added."""
+        added = 0
+        if heading is not None and not self.add(heading, '\n\n', counted=False):
+            self.omitted += len(rows)
+            return 0
+        for i, row in enumerate(rows):
+            if self.full:
+                self.omitted += len(rows) - i
+                break
+            if not self.add(template.render(row, self.mode), '\n' if heading is not None and not added else separator):
+                self.omitted += len(rows) - i - 1  # сама строка уже учтена в add
+                break
+            added += 1
+        return added
+
+    def text(self, more: bool = True) -> str:
+        text = ''.join(self.parts)
+        if more and self.omitted:
+            text += '\n\n' + escape(f"…и ещё {self.omitted}. Уточните запрос, чтобы сузить список.", self.mode)
+        return text
+
+
+def render_list(header: str, rows: Sequence, template: Template, mode: str = 'plain',
+                limit: Optional[int] = TELEGRAM_MESSAGE_LIMIT, max_rows: Optional[int] = None) -> str:
+    """``header`` (plain text) and one card per row, separated by blank lines."""
+    message = MessageBuilder(mode, limit)
+    if header:
+        message.add(escape(header, mode), counted=False)
+    message.add_rows(rows if max_rows is None else rows[:max_rows], template)
+    return message.text()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bench', action='store_true', help='render time per 1000 rows, f-strings vs templates')
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+    if not args.bench:
+        parser.print_help()
+        return
+    import time
+    from datetime import datetime, timedelta
+    from types import SimpleNamespace
+
+    start = datetime(2024, 5, 6, 10, 0)
+    organizer = SimpleNamespace(name='Анна', surname='Смирнова')
+    rows = [
+        SimpleNamespace(
+            title=f"Мероприятие {i} <R&D>", description=f"Описание мероприятия номер {i}. " * (1 + i % 4),
+            start_time=start + timedelta(hours=i), end_time=start + timedelta(hours=i + 2),
+            location=None if i % 5 == 0 else f"Переговорная {i % 12}", organizer=organizer,
+            participants=[None] * (i % 17), max_participants=None if i % 3 == 0 else 20,
+        )
+        for i in range(args.rows)
+    ]
+
+    def fstring_card(event) -> str:  # прежний format_event_info
+        return f"""📅 {event.title}
+📝 {event.description or 'Описание отсутствует'}
+🕒 Время: {event.start_time.strftime('%d.%m.%Y %H:%M')} - {event.end_time.strftime('%H:%M')}
+📍 Место: {event.location or 'Не указано'}
+👥 Организатор: {event.organizer.name} {event.organizer.surname}
+👥 Участников: {len(event.participants)}/{event.max_participants or '∞'}\n\n"""
+
+    def concatenated() -> str:
+        response = "Предстоящие мероприятия:\n\n"
+        for event in rows:
+            response += fstring_card(event)
+        return response
+
+    template = Template(
+        "📅 {title:b}\n"
+        "📝 {description}\n"
+        "🕒 Время: {start} - {end}\n"
+        "📍 Место: {location}\n"
+        "👥 Организатор: {organizer.name} {organizer.surname}\n"
+        "👥 Участников: {participants}/{capacity}",
+        description=or_default('description', 'Описание отсутствует'),
+        start=strftime('start_time', '%d.%m.%Y %H:%M'), end=strftime('end_time', '%H:%M'),
+        location=or_default('location', 'Не указано'),
+        participants=lambda event: len(event.participants),
+        capacity=lambda event: event.max_participants or '∞',
+    )
+    same = render_list("Предстоящие мероприятия:", rows, template, limit=None) == concatenated().rstrip('\n')
+
+    def timed(fn) -> Tuple[float, str]:
+        best, text = float('inf'), ''
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            text = fn()
+            best = min(best, time.perf_counter() - started)
+        return best, text
+
+    cases: Dict[str, Callable[[], str]] = {'f-string + concatenation': concatenated}
+    for mode in MODES:
+        cases[f"template, {mode}"] = lambda mode=mode: render_list(
+            "Предстоящие мероприятия:", rows, template, mode, limit=None)
+    for mode in MODES:
+        cases[f"template, {mode}, 4096 limit"] = lambda mode=mode: render_list(
+            "Предстоящие мероприятия:", rows, template, mode)
+    print(f"{args.rows} rows, best of {args.repeat}; plain template output identical to f-strings: {same}")
+    print(f"{'renderer':<32} {'ms/1000 rows':>12} {'chars':>9}")
+    for label, fn in cases.items():
+        best, text = timed(fn)
+        print(f"{label:<32} {best * 1000 / args.rows * 1000:>12.2f} {len(text):>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""Read/write splitting between DATABASE_URL (primary) and READ_DATABASE_URL.
+
+``RoutingSession`` picks a bind per statement:
+
+  * writes go to the primary. That covers flushes, INSERT/UPDATE/DELETE,
+    SELECT ... FOR UPDATE and ``session.connection()``. After the first
+    write the session stays pinned to the primary, so it reads its own
+    writes;
+  * every other read goes to the replica while ``ReplicaMonitor`` considers
+    it fresh. Otherwise it goes to the primary;
+  * sessions made with ``get_session(primary=True)`` never touch the
+    replica. Use them for jobs that read and then write on that basis,
+    such as reminder checkpoints and the outbox;
+  * in-memory snapshots (search_index, employee_search, fuzzy_index,
+    directory, birthdays) rebuild through ``on_primary(session)``. A snapshot
+    is served until the next write, so one read from a lagging replica would
+    keep the lag in memory.
+
+Without READ_DATABASE_URL everything goes to the primary, as before.
+
+Lag is measured with a heartbeat row, not with dialect-specific functions,
+so the same code works for two SQLite files and for two Postgres instances.
+At most once per ``check_interval`` a reader thread stamps
+``replica_heartbeat`` on the primary and reads the stamp back from the
+replica. Lag is ``now - stamp on the replica``, which includes up to one
+check interval. While it exceeds ``max_lag_seconds``, or the replica fails a
+query, reads fall back to the primary.
+
+Local test with two SQLite files (``--sync`` copies the primary into the
+replica with the SQLite backup API, standing in for replication):
+
+    DATABASE_URL=sqlite:///primary.db READ_DATABASE_URL=sqlite:///replica.db python replica.py --sync
+    DATABASE_URL=sqlite:///primary.db READ_DATABASE_URL=sqlite:///replica.db python replica.py --status
+    DATABASE_URL=sqlite:///primary.db READ_DATABASE_URL=sqlite:///replica.db python replica.py --bench 2000
+"""
+import argparse
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator, NamedTuple, Optional
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, event, insert, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+import cli
+from config import REPLICA_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+# Своя MetaData: таблица создается монитором на основной БД и попадает на реплику репликацией
+heartbeat = Table(
+    'replica_heartbeat',
+    MetaData(),
+    Column('name', String(50), primary_key=True),
+    Column('beat_at', DateTime, nullable=False),
+)
+
+
+class ReplicaStatus(NamedTuple):
+    healthy: bool
+    lag: Optional[float]  # секунды; None - не удалось измерить
+    checked_at: float  # time.monotonic()
+    error: str
+
+
+class ReplicaMonitor:
+    """Heartbeat-based replica lag, re-checked lazily by whichever reader finds the status outdated."""
+
+    def __init__(self, primary: Engine, replica: Engine, name: str = 'default',
+                 max_lag: float = REPLICA_SETTINGS['max_lag_seconds'],
+                 check_interval: float = REPLICA_SETTINGS['check_interval']):
+        self.primary = primary
+        self.replica = replica
+        self.name = name
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.status = ReplicaStatus(False, None, float('-inf'), 'not checked yet')
+        self._lock = threading.Lock()
+        self._table_ready = False
+        event.listen(replica, 'handle_error', self._on_replica_error)
+
+    def beat(self, now: Optional[datetime] = None):
+        """Stamp the heartbeat row on the primary."""
+        now = now or datetime.utcnow()
+        with self.primary.begin() as conn:
+            if not self._table_ready:
+                heartbeat.create(conn, checkfirst=True)
+                self._table_ready = True
+            stamped = conn.execute(update(heartbeat).where(heartbeat.c.name == self.name).values(beat_at=now))
+            if not stamped.rowcount:
+                conn.execute(insert(heartbeat).values(name=self.name, beat_at=now))
+
+    def check(self) -> ReplicaStatus:
+        now = datetime.utcnow()
+        try:
+            self.beat(now)
+            with self.replica.connect() as conn:
+                stamp = conn.execute(select(heartbeat.c.beat_at).where(heartbeat.c.name == self.name)).scalar()
+        except SQLAlchemyError as e:
+            status = ReplicaStatus(False, None, time.monotonic(), str(e).splitlines()[0])
+        else:
+            lag = (now - stamp).total_seconds() if stamp is not None else None
+            healthy = lag is not None and lag <= self.max_lag
+            status = ReplicaStatus(healthy, lag, time.monotonic(), '' if healthy else 'replica lags behind')
+        if status.healthy != self.status.healthy:
+            log = logger.info if status.healthy else logger.warning
+            log("Read replica %s (lag %s)", 'in use' if status.healthy else 'bypassed: ' + status.error,
+                f"{status.lag:.1f}s" if status.lag is not None else 'unknown')
+        self.status = status
+        return status
+
+    def use_replica(self) -> bool:
+        if time.monotonic() - self.status.checked_at >= self.check_interval and self._lock.acquire(blocking=False):
+            # Проверяет один поток; остальные читают по последнему известному статусу
+            try:
+                self.check()
+            finally:
+                self._lock.release()
+        return self.status.healthy
+
+    def _on_replica_error(self, context):
+        # Ошибки в самом запросе (синтаксис, ограничения) о здоровье реплики не говорят
+        if not (context.is_disconnect or isinstance(context.sqlalchemy_exception, OperationalError)):
+            return
+        if self.status.healthy:
+            logger.warning("Read replica query failed, falling back to the primary: %s", context.original_exception)
+        self.status = ReplicaStatus(False, None, time.monotonic(), str(context.original_exception))
+
+
+class RoutingSession(Session):
+    """Session that reads from the replica and writes to the primary (see module docstring)."""
+
+    def __init__(self, *args, read_bind: Optional[Engine] = None, monitor: Optional[ReplicaMonitor] = None,
+                 primary: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.read_bind = read_bind
+        self.monitor = monitor
+        self.pinned = primary or read_bind is None
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if not self.pinned:
+            writes = (
+                self._flushing or clause is None or isinstance(clause, UpdateBase)
+                or getattr(clause, '_for_update_arg', None) is not None
+            )
+            if writes:
+                self.pinned = True
+            elif self.monitor is None or self.monitor.use_replica():
+                return self.read_bind
+        return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+
+@contextmanager
+def on_primary(session: Session) -> Iterator[Session]:
+    """``session`` if it only reads the primary, otherwise a short-lived session pinned to its primary."""
+    if not isinstance(session, RoutingSession) or session.pinned:
+        yield session
+        return
+    primary = RoutingSession(bind=session.bind, primary=True)
+    try:
+        yield primary
+    finally:
+        primary.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sync', action='store_true', help='copy the primary SQLite file into the replica file')
+    parser.add_argument('--status', action='store_true', help='measure replica lag once')
+    parser.add_argument('--bench', type=int, default=0, metavar='N', help='run N reads and report where they went')
+    args = parser.parse_args()
+    cli.setup_logging()
+    from sqlalchemy import func
+
+    from models import Employee, engine, get_session, init_db, read_engine, replica_monitor
+
+    if read_engine is None:
+        parser.error('READ_DATABASE_URL is not set')
+    init_db()
+    if args.sync:
+        if engine.dialect.name != 'sqlite' or read_engine.dialect.name != 'sqlite':
+            parser.error('--sync only copies SQLite files; use real replication for other databases')
+        replica_monitor.beat()
+        source, target = engine.raw_connection(), read_engine.raw_connection()
+        try:
+            source.driver_connection.backup(target.driver_connection)
+        finally:
+            source.close()
+            target.close()
+        print(f"copied {engine.url.database} -> {read_engine.url.database}")
+    if args.status:
+        status = replica_monitor.check()
+        lag = f"{status.lag:.2f}s" if status.lag is not None else 'unknown'
+        print(f"replica {'healthy' if status.healthy else 'NOT used'}: lag {lag}, max {replica_monitor.max_lag}s"
+              + (f" ({status.error})" if status.error else ''))
+    if args.bench:
+        counts = {'primary': 0, 'replica': 0}
+        for name, bind in (('primary', engine), ('replica', read_engine)):
+            event.listen(bind, 'before_cursor_execute',
+                         lambda *a, name=name: counts.__setitem__(name, counts[name] + 1))
+        started = time.perf_counter()
+        for i in range(args.bench):
+            session = get_session()
+            try:
+                session.query(func.count(Employee.id)).filter(Employee.id > i % 1000).scalar()
+            finally:
+                session.close()
+        elapsed = time.perf_counter() - started
+        print(f"{args.bench} read sessions in {elapsed:.2f}s ({args.bench / elapsed:.0f}/s): "
+              f"{counts['replica']} statements on the replica, {counts['primary']} on the primary (heartbeats, fallback)")
+        session = get_session()
+        try:
+            routed = []
+            for statement in (
+                lambda: session.query(Employee.id).first(),
+                lambda: session.query(Employee).filter(Employee.id == -1).update({'bio': None}),
+                lambda: session.query(func.count(Employee.id)).scalar(),
+            ):
+                before = dict(counts)
+                statement()
+                routed.append('replica' if counts['replica'] > before['replica'] else 'primary')
+            session.rollback()
+            print(f"read -> {routed[0]}, write -> {routed[1]}, read after the write -> {routed[2]}")
+        finally:
+            session.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Concurrent "try all searches" fallback.
+
+When the intent is unclear the bot used to run every search one after
+another, so the worst case was the sum of all of them. ``FanOutSearch`` runs
+them in a thread pool instead. Each search gets its own session and its own
+deadline. The result blocks are then merged and ranked by one relevance score
+(query term coverage), so answers from different sources are comparable.
+Sources that miss their deadline are left out and named in the answer.
+"""
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from config import SEARCH_SETTINGS
+from conversation_context import split_results
+from models import get_session
+from text_pipeline import analyze, index_terms
+
+logger = logging.getLogger(__name__)
+
+
+class SearchSource(NamedTuple):
+    name: str  # как источник называется в ответе
+    search: Callable  # (session, query) -> отформатированный ответ
+    deadline: Optional[float] = None  # секунды; None - SEARCH_SETTINGS['fanout_timeout']
+
+
+class RankedBlock(NamedTuple):
+    score: float
+    source_rank: int
+    block: str
+    source: str
+
+
+def query_terms(query: str) -> List[str]:
+    return list(analyze(query).terms)
+
+
+def relevance(terms: Sequence[str], text: str) -> float:
+    """Share of query terms (by stem) that occur in ``text``."""
+    if not terms:
+        return 0.0
+    words = set(index_terms(text))
+    return sum(term in words for term in terms) / len(terms)
+
+
+class FanOutSearch:
+    def __init__(self, max_workers: int = SEARCH_SETTINGS['fanout_workers'],
+                 default_deadline: float = SEARCH_SETTINGS['fanout_timeout']):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='search')
+        self.default_deadline = default_deadline
+
+    @staticmethod
+    def _run_source(source: SearchSource, query: str) -> Tuple[str, float]:
+        started = time.perf_counter()
+        session = get_session()
+        try:
+            return source.search(session, query), time.perf_counter() - started
+        finally:
+            session.close()
+
+    def run(self, query: str, sources: Sequence[SearchSource]) -> Tuple[Dict[str, str], List[str]]:
+        """Run all sources in parallel. Returns ({name: response} for finished sources, [timed out names])."""
+        started = time.monotonic()
+        futures = []
+        for source in sources:
+            # Каждой задаче своя копия контекста: трассировка запроса видна в потоках пула
+            context = contextvars.copy_context()
+            futures.append((source, self.executor.submit(context.run, self._run_source, source, query)))
+
+        responses: Dict[str, str] = {}
+        timed_out: List[str] = []
+        for source, future in sorted(futures, key=lambda item: item[0].deadline or self.default_deadline):
+            deadline = started + (source.deadline or self.default_deadline)
+            try:
+                response, elapsed = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeout:
+                # Поток доработает в фоне и закроет свою сессию; результат не ждем
+                future.cancel()
+                timed_out.append(source.name)
+                logger.warning("Fallback search %r missed its deadline", source.name)
+                continue
+            except Exception:
+                logger.exception("Fallback search %r failed", source.name)
+                continue
+            logger.debug("Fallback search %r took %.3fs", source.name, elapsed)
+            if response:
+                responses[source.name] = response
+        return responses, timed_out
+
+    def search(self, query: str, sources: Sequence[SearchSource],
+               limit: Optional[int] = None) -> Tuple[List[RankedBlock], List[str]]:
+        """Run, merge and rank.
+
+        Only list answers ("Header:" + blocks) take part; "nothing found" and
+        error texts have no header and are skipped. Blocks that match no query
+        term are dropped unless nothing matches at all.
+        """
+        responses, timed_out = self.run(query, sources)
+        terms = query_terms(query)
+        ranked = []
+        for rank, source in enumerate(sources):
+            response = responses.get(source.name)
+            if response is None:
+                continue
+            header, blocks = split_results(response)
+            if not header:
+                continue
+            for block in blocks:
+                ranked.append(RankedBlock(relevance(terms, block), rank, block, source.name))
+        ranked.sort(key=lambda item: (-item.score, item.source_rank))
+        matching = [item for item in ranked if item.score > 0]
+        result = matching or ranked
+        return (result[:limit] if limit else result), timed_out
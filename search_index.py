@@ -0,0 +1,298 @@
+"""Unified search index over employees, events, tasks, activities and general info.
+
+Every searchable row becomes a ``SearchDocument`` with the same shape: an
+entity type (the facet), a title, the text that is searched and a
+JSON-friendly payload for the answer. ``SearchIndex`` keeps all documents in
+memory:
+
+  * an inverted index for BM25 over ``text_pipeline`` stems (the same terms
+    as the fallback ranking in ``search_fanout``);
+  * a matrix of normalized document embeddings, when an encoder is given.
+
+A lookup scores all documents at once: normalized BM25 and cosine similarity
+are mixed with SEARCH_INDEX_SETTINGS weights. The result is one ranked list
+plus hit counts per entity type. The index is built with one query per table.
+It is a ``snapshot.SnapshotIndex`` over the ENTITY_SOURCES models: marked
+stale on every committed write to them and rebuilt on the next lookup.
+Embeddings of documents whose text did not change are reused, so a rebuild
+only encodes new and edited rows. The first rebuild with an encoder encodes
+everything; ``warm_up`` runs it in the model-loader thread
+(``embeddings.attach_encoder``), and lookups keep using the BM25-only
+documents until it is done.
+
+Other processes notice changes by the snapshot generation, here narrowed to
+the indexed rows of each entity type (``generation``).
+"""
+import json
+import logging
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from config import SEARCH_INDEX_SETTINGS
+from models import Activity, Employee, Event, GeneralInfo, Task, TaskStatus, get_session
+from snapshot import SnapshotIndex, row_generation
+from text_pipeline import analyze, index_terms
+
+logger = logging.getLogger(__name__)
+
+ENTITY_TYPES = ('employee', 'event', 'task', 'activity', 'info')
+
+
+class SearchDocument(NamedTuple):
+    doc_id: str  # "<entity_type>:<id>"
+    entity_type: str
+    entity_id: int
+    title: str
+    text: str
+    payload: dict
+
+
+class SearchHit(NamedTuple):
+    score: float
+    bm25: float
+    similarity: float
+    document: SearchDocument
+
+
+class SearchResults(NamedTuple):
+    hits: List[SearchHit]
+    facets: Dict[str, int]  # entity_type -> число совпавших документов (до фильтра по типам)
+    total: int
+
+
+def _iso(value) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def _enum_value(value) -> Optional[str]:
+    return value.value if value is not None else None
+
+
+def _join(*parts) -> str:
+    return ' '.join(str(part) for part in parts if part)
+
+
+def _tags(raw: Optional[str]) -> str:
+    try:
+        tags = json.loads(raw) if raw else []
+    except ValueError:
+        return raw or ''
+    return ' '.join(str(tag) for tag in tags) if isinstance(tags, list) else str(tags)
+
+
+def employee_document(employee: Employee) -> SearchDocument:
+    title = f"{employee.name} {employee.surname}"
+    return SearchDocument(
+        f'employee:{employee.id}', 'employee', employee.id, title,
+        _join(employee.position, employee.department, employee.skills, employee.interests, employee.bio),
+        {'name': employee.name, 'surname': employee.surname, 'position': employee.position,
+         'department': employee.department, 'email': employee.email, 'phone': employee.phone,
+         'skills': employee.skills, 'interests': employee.interests},
+    )
+
+
+def event_document(item: Event) -> SearchDocument:
+    return SearchDocument(
+        f'event:{item.id}', 'event', item.id, item.title,
+        _join(item.description, item.location, _enum_value(item.event_type)),
+        {'title': item.title, 'description': item.description, 'type': _enum_value(item.event_type),
+         'start_time': _iso(item.start_time), 'end_time': _iso(item.end_time),
+         'location': item.location, 'is_online': item.is_online},
+    )
+
+
+def task_document(task: Task) -> SearchDocument:
+    return SearchDocument(
+        f'task:{task.id}', 'task', task.id, task.title,
+        _join(task.description, _tags(task.tags)),
+        {'title': task.title, 'description': task.description, 'status': _enum_value(task.status),
+         'priority': task.priority, 'due_date': _iso(task.due_date)},
+    )
+
+
+def activity_document(activity: Activity) -> SearchDocument:
+    return SearchDocument(
+        f'activity:{activity.id}', 'activity', activity.id, activity.title,
+        _join(activity.description, activity.location, _enum_value(activity.activity_type)),
+        {'title': activity.title, 'description': activity.description,
+         'type': _enum_value(activity.activity_type), 'start_time': _iso(activity.start_time),
+         'location': activity.location, 'max_participants': activity.max_participants,
+         'current_participants': activity.current_participants},
+    )
+
+
+def info_document(info: GeneralInfo) -> SearchDocument:
+    return SearchDocument(
+        f'info:{info.id}', 'info', info.id, info.title,
+        _join(info.content, info.category, _tags(info.tags)),
+        {'title': info.title, 'content': info.content, 'category': info.category},
+    )
+
+
+def build_postings(term_lists: Sequence[List[str]], k1: float, b: float) -> Tuple[Dict[str, tuple], np.ndarray]:
+    """Inverted index for BM25: {term: (doc indices, term frequencies)} and per-document length norms."""
+    raw_postings: Dict[str, Dict[int, int]] = {}
+    lengths = np.zeros(len(term_lists), dtype=np.float32)
+    for i, terms in enumerate(term_lists):
+        lengths[i] = len(terms)
+        for term in terms:
+            counts = raw_postings.setdefault(term, {})
+            counts[i] = counts.get(i, 0) + 1
+    postings = {
+        term: (np.fromiter(counts.keys(), dtype=np.int32, count=len(counts)),
+               np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+        for term, counts in raw_postings.items()
+    }
+    average_length = float(lengths.mean()) if len(term_lists) else 1.0
+    return postings, k1 * (1 - b + b * lengths / max(average_length, 1e-9))
+
+
+def bm25_scores(postings: Dict[str, tuple], length_norm: np.ndarray, terms: Sequence[str], k1: float) -> np.ndarray:
+    """BM25 of every document for the query ``terms`` (zero for documents without any of them)."""
+    scores = np.zeros(len(length_norm), dtype=np.float32)
+    total = len(length_norm)
+    for term in set(terms):
+        posting = postings.get(term)
+        if posting is None:
+            continue
+        indices, frequencies = posting
+        idf = np.log(1 + (total - len(indices) + 0.5) / (len(indices) + 0.5))
+        scores[indices] += idf * frequencies * (k1 + 1) / (frequencies + length_norm[indices])
+    return scores
+
+
+class EntitySource(NamedTuple):
+    model: type
+    condition: Callable  # () -> условие WHERE для строк, попадающих в индекс
+    to_document: Callable
+
+
+ENTITY_SOURCES = {
+    'employee': EntitySource(Employee, lambda: Employee.is_active == True, employee_document),
+    'event': EntitySource(Event, lambda: Event.status == 'active', event_document),
+    'task': EntitySource(Task, lambda: Task.status != TaskStatus.DONE, task_document),
+    'activity': EntitySource(Activity, lambda: Activity.status == 'active', activity_document),
+    'info': EntitySource(GeneralInfo, lambda: GeneralInfo.is_active == True, info_document),
+}
+
+
+def generation(session: Session) -> tuple:
+    """Fingerprint of the indexed rows: (count, max id, last updated_at) per entity type, one query each."""
+    return tuple(row_generation(session, source.model, source.condition()) for source in ENTITY_SOURCES.values())
+
+
+def load_documents(session: Session) -> List[SearchDocument]:
+    """One query per entity type."""
+    documents = []
+    for source in ENTITY_SOURCES.values():
+        documents.extend(source.to_document(row) for row in session.query(source.model).filter(source.condition()))
+    return documents
+
+
+class _IndexState(NamedTuple):
+    documents: List[SearchDocument]
+    types: np.ndarray  # индекс типа в ENTITY_TYPES для каждого документа
+    postings: Dict[str, tuple]  # term -> (doc indices, term frequencies)
+    length_norm: np.ndarray  # k1 * (1 - b + b * dl / avgdl)
+    embeddings: Optional[np.ndarray]  # (documents, dim), нормированы
+
+
+_EMPTY_STATE = _IndexState([], np.zeros(0, dtype=np.int8), {}, np.zeros(0), None)
+
+
+class SearchIndex(SnapshotIndex):
+    """In-memory hybrid (BM25 + embeddings) index over all searchable entities."""
+
+    models = tuple(source.model for source in ENTITY_SOURCES.values())
+
+    def __init__(self, encoder=None, settings: dict = SEARCH_INDEX_SETTINGS):
+        super().__init__()
+        self.encoder = encoder
+        self.settings = settings
+        self._state = _EMPTY_STATE
+        self._embedding_cache: Dict[str, tuple] = {}  # doc_id -> (text, vector)
+
+    def __len__(self) -> int:
+        return len(self._state.documents)
+
+    def _embed(self, documents: List[SearchDocument]) -> Optional[np.ndarray]:
+        if self.encoder is None or not documents:
+            return None
+        texts = [f"{document.title}. {document.text}" for document in documents]
+        missing = [i for i, (document, text) in enumerate(zip(documents, texts))
+                   if self._embedding_cache.get(document.doc_id, (None,))[0] != text]
+        if missing:
+            vectors = np.asarray(self.encoder.encode([texts[i] for i in missing]), dtype=np.float32)
+            for i, vector in zip(missing, vectors):
+                self._embedding_cache[documents[i].doc_id] = (texts[i], vector)
+        # Удаленные и отфильтрованные документы больше не держим в кэше
+        self._embedding_cache = {document.doc_id: self._embedding_cache[document.doc_id] for document in documents}
+        matrix = np.stack([self._embedding_cache[document.doc_id][1] for document in documents])
+        matrix /= np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-9, None)
+        logger.debug("Search index: encoded %d of %d documents", len(missing), len(documents))
+        return matrix
+
+    def generation(self, session: Session) -> tuple:
+        return generation(session)
+
+    def warm_up(self):
+        """Rebuild with the new encoder in the calling (model-loader) thread.
+
+        The index is not invalidated first: lookups do not wait for the
+        lock and keep serving the current documents until the swap.
+        """
+        if self.encoder is None:
+            return
+        session = get_session()
+        try:
+            self.refresh(session)
+        finally:
+            session.close()
+
+    def _rebuild(self, session: Session):
+        started = time.perf_counter()
+        documents = load_documents(session)
+        # Заголовок весит больше текста: его термы учитываются title_boost раз
+        postings, length_norm = build_postings(
+            [index_terms(document.title) * self.settings['title_boost'] + index_terms(document.text)
+             for document in documents],
+            self.settings['bm25_k1'], self.settings['bm25_b'],
+        )
+        types = np.array([ENTITY_TYPES.index(document.entity_type) for document in documents], dtype=np.int8)
+        self._state = _IndexState(documents, types, postings, length_norm, self._embed(documents))
+        logger.info("Search index rebuilt: %d documents, %d terms in %.2fs",
+                    len(documents), len(postings), time.perf_counter() - started)
+
+    def search(self, query: str, types: Optional[Sequence[str]] = None,
+               limit: Optional[int] = None) -> SearchResults:
+        """Rank all documents for ``query``; ``types`` keeps only these entity types in the hits."""
+        state = self._state
+        if not state.documents:
+            return SearchResults([], {}, 0)
+        bm25 = bm25_scores(state.postings, state.length_norm, analyze(query).terms, self.settings['bm25_k1'])
+        top = float(bm25.max())
+        combined = self.settings['bm25_weight'] * (bm25 / top if top > 0 else bm25)
+        matched = bm25 > 0
+        similarity = np.zeros_like(bm25)
+        if state.embeddings is not None:
+            vector = np.asarray(self.encoder.encode(query), dtype=np.float32)
+            similarity = state.embeddings @ (vector / max(float(np.linalg.norm(vector)), 1e-9))
+            combined += self.settings['embedding_weight'] * np.clip(similarity, 0, None)
+            matched |= similarity >= self.settings['min_similarity']
+
+        counts = np.bincount(state.types[matched], minlength=len(ENTITY_TYPES))
+        facets = {entity_type: int(count) for entity_type, count in zip(ENTITY_TYPES, counts) if count}
+        if types:
+            wanted = [ENTITY_TYPES.index(entity_type) for entity_type in types if entity_type in ENTITY_TYPES]
+            matched &= np.isin(state.types, wanted)
+        candidates = np.flatnonzero(matched)
+        total = len(candidates)
+        if limit and total > limit:
+            candidates = candidates[np.argpartition(-combined[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.argsort(-combined[candidates], kind='stable')]
+        hits = [SearchHit(float(combined[i]), float(bm25[i]), float(similarity[i]), state.documents[i])
+                for i in candidates]
+        return SearchResults(hits, facets, total)
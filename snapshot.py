@@ -0,0 +1,164 @@
+"""In-memory snapshots of database rows: one staleness protocol, one invalidation hook.
+
+search_index, employee_search, fuzzy_index, directory and birthdays each
+serve lookups from rows kept in memory. ``SnapshotIndex`` is what they share:
+
+  * a stale flag and ``ensure_fresh(session)``. The flag is checked twice,
+    the second time under the rebuild lock, so concurrent requests trigger
+    one ``_rebuild``. The rebuild reads through ``replica.on_primary``: a
+    snapshot is served until the next write, so it must not keep replica lag;
+  * ``models``: the mapped classes whose writes make a snapshot stale. Mapper
+    events only tag the session with the written classes. On commit every
+    snapshot watching one of them is invalidated; a rollback drops the tag.
+    Invalidating at flush would let a rebuild running before the commit read
+    the old rows and clear the flag;
+  * a registry of live snapshots: ``invalidate_all()`` marks them all stale
+    after writes that bypass the ORM (archive.py, data.load);
+  * a generation: mapper events and ``invalidate_all`` only reach the process
+    that wrote, so other processes (webhook shards, web_app workers, a bot
+    running while ``data.py --load`` runs) compare ``generation(session)``
+    with the one the snapshot was built from. It is the row count, the max id
+    and the last updated_at of each watched model (``row_generation``), read
+    at most every SNAPSHOT_SETTINGS['generation_check_seconds'] by
+    ``ensure_fresh``; a difference marks the snapshot stale.
+"""
+import logging
+import threading
+import time
+import weakref
+from typing import Iterable, Optional, Set, Tuple
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session, object_session
+
+from config import SNAPSHOT_SETTINGS
+from replica import on_primary
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = 'snapshot_changed_models'
+
+_snapshots = weakref.WeakSet()
+_watched: Set[type] = set()
+
+
+class SnapshotIndex:
+    """Rows kept in memory and rebuilt on demand after committed writes (see module docstring).
+
+    Subclasses set ``models`` and implement ``_rebuild(session, *args)``.
+    Extra arguments of ``ensure_fresh`` and ``refresh`` go to ``is_stale``
+    and ``_rebuild`` (the birthday index passes the current time).
+    ``generation`` may be narrowed to the rows the snapshot actually loads.
+    """
+
+    models: Tuple[type, ...] = ()
+    generation_check_seconds: float = SNAPSHOT_SETTINGS['generation_check_seconds']
+
+    def __init__(self):
+        self._stale = True
+        self._lock = threading.Lock()  # одна пересборка за раз
+        self._generation: Optional[tuple] = None
+        self._next_check = 0.0
+        for model in self.models:
+            _watch(model)
+        _snapshots.add(self)
+
+    def invalidate(self):
+        self._stale = True
+
+    def is_stale(self, *args) -> bool:
+        return self._stale
+
+    def generation(self, session: Session) -> tuple:
+        """Fingerprint of the rows behind the snapshot, one query per model."""
+        return tuple(row_generation(session, model) for model in self.models)
+
+    def _check_generation(self, session: Session):
+        # Изменения из других процессов событиями маппера сюда не доходят
+        self._next_check = time.monotonic() + self.generation_check_seconds
+        with on_primary(session) as primary:
+            current = self.generation(primary)
+        if current != self._generation:
+            logger.info("%s generation changed, rebuilding", type(self).__name__)
+            self.invalidate()
+
+    def ensure_fresh(self, session: Session, *args):
+        if not self._stale and time.monotonic() >= self._next_check:
+            self._check_generation(session)
+        if self.is_stale(*args):
+            with self._lock:
+                if self.is_stale(*args):  # другой поток мог уже пересобрать снимок
+                    self._rebuild_from_primary(session, *args)
+
+    def refresh(self, session: Session, *args):
+        """Rebuild now, stale or not."""
+        with self._lock:
+            self._rebuild_from_primary(session, *args)
+
+    def _rebuild_from_primary(self, session: Session, *args):
+        self._stale = False  # коммиты во время сборки снова пометят снимок устаревшим
+        try:
+            with on_primary(session) as primary:
+                # Поколение до чтения строк: изменение во время сборки даст еще одну пересборку, а не потерю
+                self._generation = self.generation(primary)
+                self._next_check = time.monotonic() + self.generation_check_seconds
+                self._rebuild(primary, *args)
+        except BaseException:
+            self._stale = True  # не собрали - следующий запрос попробует снова
+            raise
+
+    def _rebuild(self, session: Session, *args):
+        raise NotImplementedError
+
+
+def row_generation(session: Session, model: type, condition=None) -> tuple:
+    """(count, max id, last updated_at) of the ``model`` rows matching ``condition``."""
+    columns = [func.count(model.id), func.max(model.id)]
+    if hasattr(model, 'updated_at'):
+        columns.append(func.max(model.updated_at))
+    query = select(*columns)
+    if condition is not None:
+        query = query.where(condition)
+    return tuple(session.execute(query).one())
+
+
+def invalidate_all():
+    """Mark every snapshot stale after writes that bypass the ORM (Core inserts, updates and deletes)."""
+    for snapshot in list(_snapshots):
+        snapshot.invalidate()
+
+
+def invalidate_models(models: Iterable[type]):
+    """Mark stale the snapshots that watch any of ``models``."""
+    models = set(models)
+    for snapshot in list(_snapshots):
+        if models.intersection(snapshot.models):
+            snapshot.invalidate()
+
+
+def _record_change(mapper, connection, target):
+    session = object_session(target)
+    if session is None:
+        invalidate_models([mapper.class_])
+    else:
+        session.info.setdefault(PENDING_KEY, set()).add(mapper.class_)
+
+
+def _watch(model: type):
+    if model in _watched:
+        return
+    _watched.add(model)
+    for event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(model, event_name, _record_change)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    models = session.info.pop(PENDING_KEY, None)
+    if models:
+        invalidate_models(models)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_changes(session):
+    session.info.pop(PENDING_KEY, None)
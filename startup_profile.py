@@ -0,0 +1,95 @@
+"""Import-time budget for the entry points.
+
+Each module is imported in a fresh interpreter with ``python -X importtime``,
+the same way a restarted bot process starts. The script reports the wall time
+and the most expensive imports, both cumulative (with everything they pull in)
+and self. It exits with 1 when a module takes longer than the budget
+(STARTUP_SETTINGS['import_budget_seconds'], or ``--budget``), so CI catches a
+heavy import that slips back in at module level.
+
+Usage:
+    python startup_profile.py                       # telegram_bot bot web_app webhook
+    python startup_profile.py telegram_bot --top 15 --budget 2.5
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from typing import List, NamedTuple
+
+from config import STARTUP_SETTINGS
+
+DEFAULT_MODULES = ['telegram_bot', 'bot', 'web_app', 'webhook']
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+PROBE = "import time; started = time.perf_counter(); import {module}; print(time.perf_counter() - started)"
+
+
+class ImportCost(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+class Profile(NamedTuple):
+    module: str
+    wall_seconds: float
+    imports: List[ImportCost]
+    error: str
+
+
+def profile_import(module: str, env: dict) -> Profile:
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE.format(module=module)],
+        env=env, cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True,
+    )
+    imports = []
+    errors = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports.append(ImportCost(name, int(self_us), int(cumulative_us), len(indent) // 2))
+        elif not line.startswith('import time:'):
+            errors.append(line)
+    if result.returncode != 0:
+        return Profile(module, float('nan'), imports, '\n'.join(errors[-5:]))
+    return Profile(module, float(result.stdout.strip().splitlines()[-1]), imports, '')
+
+
+def report(profile: Profile, top: int, budget: float) -> bool:
+    if profile.error:
+        print(f"\n{profile.module}: FAILED to import\n{profile.error}")
+        return False
+    ok = profile.wall_seconds <= budget
+    print(f"\n{profile.module}: {profile.wall_seconds:.2f}s (budget {budget:.2f}s) {'ok' if ok else 'OVER BUDGET'}")
+    print(f"  {'cumulative ms':>13} {'self ms':>8}  module")
+    # Модули, импортированные первыми в своей цепочке: их cumulative - полная цена строки import
+    roots = sorted((item for item in profile.imports if item.depth <= 1),
+                   key=lambda item: -item.cumulative_us)[:top]
+    for item in roots:
+        print(f"  {item.cumulative_us / 1000:>13.1f} {item.self_us / 1000:>8.1f}  {item.module}")
+    heaviest = sorted(profile.imports, key=lambda item: -item.self_us)[:top]
+    print(f"  heaviest by self time: " + ', '.join(f"{item.module} {item.self_us / 1000:.0f}ms" for item in heaviest))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+    parser.add_argument('--budget', type=float, default=STARTUP_SETTINGS['import_budget_seconds'],
+                        help='seconds per module')
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Пустая БД: импорт не должен зависеть от данных
+        env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(tmp, 'startup.db'))
+        results = [report(profile_import(module, env), args.top, args.budget) for module in args.modules]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+"""Skills and tags as indexed relational data.
+
+``Employee.skills`` (comma-separated), ``Task.tags`` and ``GeneralInfo.tags``
+(JSON lists) stay the columns that the code writes. Their contents are also
+kept in normalized tables:
+
+    skills(id, name, normalized UNIQUE)   employee_skills(employee_id, skill_id)
+    tags(id, name, normalized UNIQUE)     task_tags(task_id, tag_id), info_tags(info_id, tag_id)
+
+A label is matched by its normalized key: the lowercased word sequence, so
+"B2B-продажи" and "b2b продажи" are the same skill. A filter on it is an
+equi-join on indexed columns that returns exact matches. ``ILIKE '%sql%'``
+had to scan every row and also matched "PostgreSQL" and "MySQL".
+
+The link rows follow the text columns the way ``birth_md`` follows
+``birthday``. Mapper events rewrite the links of a row when its column
+changes, on the same connection and in the same transaction. Core bulk inserts
+(generate_data.py) call ``rebuild``, and ``init_db`` backfills empty link
+tables from the existing strings.
+
+Usage:
+    python taxonomy.py --database-url sqlite:///eval.db --rebuild
+    python taxonomy.py --database-url sqlite:///eval.db --bench SQL Java Excel Python
+"""
+import json
+import logging
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from sqlalchemy import delete, event, func, inspect, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+import cli
+from models import Employee, GeneralInfo, Skill, Tag, Task, employee_skills, info_tags, task_tags
+from text_pipeline import WORD
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+# Диалекты с INSERT ... ON CONFLICT DO NOTHING
+UPSERT_INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+
+class LabelLink(NamedTuple):
+    model: type  # владелец текстовой колонки
+    attribute: str  # текстовая колонка
+    link: object  # таблица связей
+    owner_column: object
+    label_column: object
+    vocabulary: object  # таблица skills или tags
+
+
+LINKS = {
+    'employee_skills': LabelLink(Employee, 'skills', employee_skills, employee_skills.c.employee_id,
+                                 employee_skills.c.skill_id, Skill.__table__),
+    'task_tags': LabelLink(Task, 'tags', task_tags, task_tags.c.task_id, task_tags.c.tag_id, Tag.__table__),
+    'info_tags': LabelLink(GeneralInfo, 'tags', info_tags, info_tags.c.info_id, info_tags.c.tag_id, Tag.__table__),
+}
+
+
+def normalize_label(label: str) -> str:
+    return ' '.join(WORD.findall((label or '').lower().replace('ё', 'е')))
+
+
+def parse_labels(raw: Optional[str]) -> Dict[str, str]:
+    """normalized -> label as written, from a JSON list or a comma-separated string."""
+    if not raw:
+        return {}
+    labels = None
+    if raw.lstrip().startswith('['):
+        try:
+            labels = json.loads(raw)
+        except ValueError:
+            pass
+    if not isinstance(labels, list):
+        labels = raw.split(',')
+    parsed = {}
+    for label in labels:
+        label = str(label).strip()
+        key = normalize_label(label)
+        if key and len(key) <= 100:
+            parsed.setdefault(key, label)
+    return parsed
+
+
+def _select_ids(conn: Connection, vocabulary, keys: List[str]) -> Dict[str, int]:
+    ids = {}
+    for start in range(0, len(keys), CHUNK_SIZE):
+        chunk = keys[start:start + CHUNK_SIZE]
+        ids.update(conn.execute(
+            select(vocabulary.c.normalized, vocabulary.c.id).where(vocabulary.c.normalized.in_(chunk))
+        ).all())
+    return ids
+
+
+def _label_ids(conn: Connection, vocabulary, labels: Dict[str, str]) -> Dict[str, int]:
+    """Ids of the labels in the vocabulary table; missing labels are inserted.
+
+    Two writers can add the same new label between the select and the insert.
+    On SQLite and PostgreSQL the insert skips keys that already exist and the
+    ids are selected again, so the loser of that race still gets the winner's id.
+    """
+    ids = _select_ids(conn, vocabulary, list(labels))
+    missing = [key for key in labels if key not in ids]
+    if not missing:
+        return ids
+    upsert = UPSERT_INSERTS.get(conn.dialect.name)
+    for start in range(0, len(missing), CHUNK_SIZE):
+        rows = [{'name': labels[key], 'normalized': key} for key in missing[start:start + CHUNK_SIZE]]
+        if upsert:
+            conn.execute(upsert(vocabulary).on_conflict_do_nothing(index_elements=['normalized']), rows)
+        else:
+            conn.execute(insert(vocabulary), rows)
+    ids.update(_select_ids(conn, vocabulary, missing))
+    return ids
+
+
+def sync(conn: Connection, spec: LabelLink, raw_by_owner: Dict[int, Optional[str]]):
+    """Replace the link rows of these owners with the labels parsed from their text column."""
+    parsed = {owner_id: parse_labels(raw) for owner_id, raw in raw_by_owner.items()}
+    labels: Dict[str, str] = {}
+    for owner_labels in parsed.values():
+        for key, label in owner_labels.items():
+            labels.setdefault(key, label)
+    ids = _label_ids(conn, spec.vocabulary, labels) if labels else {}
+    owners = list(parsed)
+    for start in range(0, len(owners), CHUNK_SIZE):
+        conn.execute(delete(spec.link).where(spec.owner_column.in_(owners[start:start + CHUNK_SIZE])))
+    rows = [{spec.owner_column.name: owner_id, spec.label_column.name: ids[key]}
+            for owner_id, owner_labels in parsed.items() for key in owner_labels]
+    for start in range(0, len(rows), CHUNK_SIZE):
+        conn.execute(insert(spec.link), rows[start:start + CHUNK_SIZE])
+
+
+def rebuild(bind: Engine, names: Iterable[str] = LINKS) -> Dict[str, int]:
+    """Re-derive link tables from the text columns; returns link rows per table."""
+    counts = {}
+    for name in names:
+        spec = LINKS[name]
+        started = time.perf_counter()
+        column = getattr(spec.model, spec.attribute)
+        with bind.begin() as conn:
+            conn.execute(delete(spec.link))
+            raw = dict(conn.execute(select(spec.model.id, column).where(column.isnot(None))).all())
+            sync(conn, spec, raw)
+            counts[name] = conn.execute(select(func.count()).select_from(spec.link)).scalar()
+        logger.info("Rebuilt %s: %d links in %.2fs", name, counts[name], time.perf_counter() - started)
+    return counts
+
+
+def backfill(bind: Engine):
+    """Parse the existing strings into link tables that are still empty (databases older than the tables)."""
+    pending = []
+    with bind.connect() as conn:
+        for name, spec in LINKS.items():
+            column = getattr(spec.model, spec.attribute)
+            has_links = conn.execute(select(spec.owner_column).limit(1)).first() is not None
+            has_text = conn.execute(select(spec.model.id).where(column.isnot(None), column != '').limit(1)).first() is not None
+            if has_text and not has_links:
+                pending.append(name)
+    if pending:
+        rebuild(bind, pending)
+
+
+def _listen(spec: LabelLink):
+    @event.listens_for(spec.model, 'after_insert')
+    def _inserted(mapper, connection, target):
+        sync(connection, spec, {target.id: getattr(target, spec.attribute)})
+
+    @event.listens_for(spec.model, 'after_update')
+    def _updated(mapper, connection, target):
+        if inspect(target).attrs[spec.attribute].history.has_changes():
+            sync(connection, spec, {target.id: getattr(target, spec.attribute)})
+
+    @event.listens_for(spec.model, 'before_delete')
+    def _deleted(mapper, connection, target):
+        connection.execute(delete(spec.link).where(spec.owner_column == target.id))
+
+
+for _spec in LINKS.values():
+    _listen(_spec)
+
+
+# --- filters ----------------------------------------------------------------
+
+def skill_filter(*skills: str):
+    """Condition on Employee: has any of these skills (exact, normalized)."""
+    keys = [normalize_label(skill) for skill in skills]
+    return Employee.id.in_(
+        select(employee_skills.c.employee_id)
+        .join(Skill, Skill.id == employee_skills.c.skill_id)
+        .where(Skill.normalized.in_(keys))
+    )
+
+
+def tag_filter(*tags: str):
+    """Condition on Task: has any of these tags (exact, normalized)."""
+    keys = [normalize_label(tag) for tag in tags]
+    return Task.id.in_(
+        select(task_tags.c.task_id)
+        .join(Tag, Tag.id == task_tags.c.tag_id)
+        .where(Tag.normalized.in_(keys))
+    )
+
+
+def known_labels(session: Session, model, candidates: Iterable[str]) -> List[str]:
+    """Which of the candidate phrases (e.g. query n-grams) are known skills or tags; one indexed IN lookup."""
+    keys = {normalize_label(candidate) for candidate in candidates} - {''}
+    if not keys:
+        return []
+    return session.execute(select(model.name).where(model.normalized.in_(keys))).scalars().all()
+
+
+def main():
+    parser = cli.parser(__doc__, bench="compare ILIKE '%%x%%' scans with the joins")
+    parser.add_argument('labels', nargs='*', default=['SQL', 'Java', 'Excel', 'Python', 'Docker', 'CRM'])
+    parser.add_argument('--rebuild', action='store_true', help='re-derive all link tables')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    bind = cli.connect(args)
+    if args.rebuild:
+        rebuild(bind)
+    if not args.bench:
+        return
+
+    def timed(query):
+        best, ids = float('inf'), set()
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            ids = set(session.execute(query).scalars())
+            best = min(best, time.perf_counter() - started)
+        return ids, best
+
+    session = Session(bind=bind)
+    try:
+        print(f"{'label':<10} {'kind':<6} {'ILIKE rows':>10} {'ms':>7} {'join rows':>10} {'ms':>7} {'false +':>8}")
+        for label in args.labels:
+            for kind, model, column, condition in (
+                ('skill', Employee, Employee.skills, skill_filter(label)),
+                ('tag', Task, Task.tags, tag_filter(label)),
+            ):
+                scanned, scan_time = timed(select(model.id).where(column.ilike(f'%{label}%')))
+                joined, join_time = timed(select(model.id).where(condition))
+                print(f"{label:<10} {kind:<6} {len(scanned):>10} {scan_time * 1000:>7.1f} "
+                      f"{len(joined):>10} {join_time * 1000:>7.1f} {len(scanned - joined):>8}")
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
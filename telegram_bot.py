@@ -1,79 +1,75 @@
 import os
+import asyncio
 import logging
 from datetime import datetime, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler, ConversationHandler
-from sentence_transformers import SentenceTransformer
+from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
 from models import (
     get_session, Employee, Event, Task, TaskStatus, 
     Activity, activity_participants, EventType, ActivityType, 
-    Session, Base, engine, GeneralInfo
+    Session, Base, engine, read_engine, GeneralInfo, Tag
 )
 from models import init_db  # Explicitly import init_db
 from sqlalchemy import or_, and_, extract
 import re
 from typing import List, Dict, Tuple, Optional, Union
-import json
-import requests
-from dotenv import load_dotenv
-import torch
-import difflib
-import nltk
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
-from nltk.stem import SnowballStemmer
-from collections import defaultdict
-from functools import lru_cache
-from Levenshtein import distance as levenshtein_distance
 import traceback
-from dateutil import parser
 import pytz
 from config import (
     TELEGRAM_TOKEN, DATABASE_URL, MODEL_NAME, DEBUG, TIMEZONE,
     DEFAULT_LANGUAGE, ADMIN_USER_IDS, WELCOME_MESSAGE, HELP_MESSAGE,
     ERROR_MESSAGES, SEARCH_SETTINGS, ACTIVITY_SETTINGS, TASK_SETTINGS,
-    EVENT_SETTINGS
+    EVENT_SETTINGS, REMINDER_SETTINGS, TELEGRAM_API_BASE_URL, BOT_MODE, WEBHOOK_SETTINGS,
+    CONVERSATION_SETTINGS, STARTUP_SETTINGS, ARCHIVE_SETTINGS, RENDER_SETTINGS
+)
+import tracing
+from logging_setup import configure_logging
+from embeddings import attach_encoder, load_zero_shot_classifier
+from intent_router import CATEGORIES, IntentRouter
+from birthdays import BirthdayEntry, birthday_index, query_month
+from outbound import reply, start_outbound, stop_outbound
+from rendering import PARSE_MODES, MessageBuilder, Template, escape, or_default, render_list, strftime
+from reminders import ReminderEngine
+from search_fanout import FanOutSearch, SearchSource
+from search_index import SearchHit, SearchIndex
+from employee_search import EmployeeSearch
+from directory import DirectoryEntry, directory
+from employee_summary import active_count, listing as summary_listing, local_now
+from text_pipeline import analyze
+from taxonomy import known_labels
+from archive import run as archive_run
+from async_repository import (
+    create_repository, fetch_page, open_tasks_count, open_tasks_query, upcoming_activities_count,
+    upcoming_activities_query, upcoming_events_count, upcoming_events_query
+)
+from conversation_context import (
+    ChatContext, chat_locks, conversation_store, extract_entities, is_more_request, resolve_follow_up, split_results
 )
-
-# Download all required NLTK data
-required_nltk_data = ['punkt', 'stopwords', 'punkt_tab']
-for item in required_nltk_data:
-    try:
-        nltk.data.find(f'tokenizers/{item}')
-    except LookupError:
-        nltk.download(item, quiet=True)
 
 # Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.DEBUG if DEBUG else logging.INFO
-)
+configure_logging()
 logger = logging.getLogger(__name__)
-
-# States for conversation handler
-CHOOSING, TYPING_REPLY = range(2)
-
-# Инициализация модели для семантического поиска
-try:
-    model = SentenceTransformer(MODEL_NAME)
-    logger.info(f"Successfully loaded model: {MODEL_NAME}")
-except Exception as e:
-    logger.error(f"Error initializing sentence transformer: {e}")
-    model = None
-
-# Define categories for classification
-categories = [
-    "поиск сотрудника",
-    "информация о мероприятии",
-    "информация о задаче",
-    "социальные активности",
-    "приветствие",
-    "общая информация",
-    "день рождения",
-    "календарь занятости",
-    "напоминания",
-    "неопределенный запрос"
-]
+# Per-message logs go through a separate logger so they can be sampled; fixed name, because
+# run as a script __name__ is '__main__' and LOG_SAMPLE_RATES would not match
+message_logger = logging.getLogger('telegram_bot.messages')
+
+# Модель эмбеддингов загружается в фоне после старта (post_init), а не при импорте:
+# пока ее нет, работают правила, BM25 и лексический поиск сотрудников
+# Каскад классификаторов: правила -> эмбеддинги -> NLI (загружается при первой необходимости)
+router = IntentRouter(CATEGORIES, nli_factory=load_zero_shot_classifier)
+# Единый индекс (BM25 + эмбеддинги) для общей информации; пересобирается после изменений в БД
+search_index = SearchIndex()
+employee_search = EmployeeSearch()
+# Асинхронный доступ к БД (aiosqlite/asyncpg); создается в post_init, None - поиски в потоках
+repository = None
+
+# Разметка ответов (rendering.py): plain или html; статические тексты бота не содержат <, > и &
+RENDER_MODE = RENDER_SETTINGS['mode'] if RENDER_SETTINGS['mode'] in ('plain', 'html') else 'plain'
+if RENDER_MODE != RENDER_SETTINGS['mode']:
+    logger.warning("RENDER_MODE=%s is not supported, replies are plain text", RENDER_SETTINGS['mode'])
+REPLY_OPTIONS = {'parse_mode': PARSE_MODES[RENDER_MODE]} if PARSE_MODES[RENDER_MODE] else {}
+# Сколько карточек форматируется в ответ: столько, сколько можно пролистать «ещё»
+RESULT_ROWS = CONVERSATION_SETTINGS['page_size'] * CONVERSATION_SETTINGS['cached_pages']
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
@@ -139,116 +135,126 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Произошла ошибка при отправке справки. Попробуйте позже.")
 
 def classify_query(query: str) -> Tuple[str, float]:
-    """Классификация запроса с использованием семантического поиска"""
+    """Классификация запроса каскадом правила -> эмбеддинги -> NLI"""
     try:
-        if model is None:
-            logger.error("Model is not initialized")
-            return "поиск сотрудника", 0.5  # Возвращаем базовую категорию
-        
-        # Получаем эмбеддинги запроса
-        query_embedding = model.encode(query)
-        logger.debug(f"Query embedding shape: {query_embedding.shape}")
-        
-        # Получаем эмбеддинги категорий
-        category_embeddings = model.encode(categories)
-        logger.debug(f"Category embeddings shape: {category_embeddings.shape}")
-        
-        # Преобразуем в тензоры PyTorch
-        query_tensor = torch.tensor(query_embedding).unsqueeze(0)  # [1, dim]
-        category_tensor = torch.tensor(category_embeddings)  # [num_categories, dim]
-        
-        # Вычисляем схожесть
-        similarities = torch.nn.functional.cosine_similarity(
-            query_tensor,
-            category_tensor,
-            dim=1
-        )
-        logger.debug(f"Similarities shape: {similarities.shape}")
-        logger.debug(f"Similarities: {similarities}")
-        
-        # Находим наиболее подходящую категорию
-        max_similarity, max_idx = torch.max(similarities, dim=0)
-        max_idx = max_idx.item()  # Convert tensor to int
-        logger.debug(f"Max similarity: {max_similarity.item()}, Max index: {max_idx}")
-        
-        # Проверяем, что индекс находится в пределах списка категорий
-        if 0 <= max_idx < len(categories):
-            category = categories[max_idx]
-            confidence = max_similarity.item()
-            logger.info(f"Classified query '{query}' as '{category}' with confidence {confidence:.2f}")
-            return category, confidence
-        else:
-            logger.warning(f"Invalid category index {max_idx} for query: {query}")
-            return "поиск сотрудника", 0.5  # Возвращаем базовую категорию
-        
+        return router.classify(query)
     except Exception as e:
         logger.error(f"Error in classify_query: {str(e)}")
         logger.error(f"Traceback: {traceback.format_exc()}")
         return "поиск сотрудника", 0.5  # Возвращаем базовую категорию
 
+def _now():
+    return datetime.now(pytz.timezone(TIMEZONE))
+
+async def answer_query_async(query: str, category: str, session) -> str:
+    """answer_query с запросами через AsyncSession: на цикле событий только ожидание БД.
+
+    Форматирование карточек - в потоке; категории, где работа - вычисления (индексы в памяти,
+    дни рождения, перебор сводки для занятости), целиком идут через answer_query в потоке.
+    """
+    if category not in ASYNC_CATEGORIES:
+        return await asyncio.to_thread(answer_query, query, category, session)
+    try:
+        if category == "информация о мероприятии":
+            events, total = await repository.upcoming_events(_now(), RESULT_ROWS)
+            return await asyncio.to_thread(render_events, events, total)
+        if category == "информация о задаче":
+            tags, tasks, total = await repository.open_tasks(_now(), analyze(query).ngrams, RESULT_ROWS)
+            return await asyncio.to_thread(render_tasks, tags, tasks, total)
+        activities, total = await repository.upcoming_activities(_now(), RESULT_ROWS)
+        return await asyncio.to_thread(render_activities, activities, total)
+    except Exception as e:
+        logger.error(f"Error in answer_query_async ({category}): {e}")
+        return ERROR_MESSAGES['general']
+
+# Категории, где ответ - запрос к БД и карточки; остальные - вычисления, они в потоках
+ASYNC_CATEGORIES = {"информация о мероприятии", "информация о задаче", "социальные активности"}
+
+def answer_query(query: str, category: str, session) -> str:
+    """Ответ на запрос по определенной категории"""
+    response = ""
+    if category == "поиск сотрудника":
+        message_logger.debug("Searching for employees")
+        response = search_employees(query)
+    elif category == "информация о мероприятии":
+        message_logger.debug("Searching for events")
+        response = search_events(query, session)
+    elif category == "информация о задаче":
+        message_logger.debug("Searching for tasks")
+        response = search_tasks(session, query)
+    elif category == "социальные активности":
+        message_logger.debug("Searching for activities")
+        response = search_activities(session, query)
+    elif category == "день рождения":
+        message_logger.debug("Searching for birthdays")
+        response = search_birthdays(query, session)
+    elif category == "календарь занятости":
+        message_logger.debug("Searching for availability")
+        response = search_availability(query, session)
+    elif category == "приветствие":
+        message_logger.debug("Sending welcome message")
+        response = WELCOME_MESSAGE
+    elif category == "общая информация":
+        message_logger.debug("Searching for general info")
+        response = search_general_info(session, query)
+    else:
+        # Если категория не определена, все поиски выполняются параллельно, у каждого своя сессия и дедлайн
+        message_logger.debug("Trying all search methods")
+        blocks, timed_out = fallback_search.search(
+            query, FALLBACK_SOURCES, limit=CONVERSATION_SETTINGS['page_size'] * CONVERSATION_SETTINGS['cached_pages']
+        )
+        if blocks:
+            header = "Я нашел следующую информацию"
+            if timed_out:
+                header += f" (не успели ответить: {', '.join(timed_out)})"
+            response = escape(header + ":", RENDER_MODE) + "\n\n" + "\n\n".join(item.block for item in blocks)
+        else:
+            response = ERROR_MESSAGES['not_found']
+    return response
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик входящих сообщений с улучшенной классификацией и обработкой запросов"""
+    # Сообщения одного чата - по очереди: обработка читает и переписывает его контекст
+    async with chat_locks.hold(update.effective_chat.id):
+        with tracing.request('telegram_bot.handle_message'):
+            await _handle_message(update, context)
+
+async def _handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         query = update.message.text.lower()
-        logger.info(f"Received query: {query}")
-        
-        # Классифицируем запрос
-        category, confidence = classify_query(query)
-        logger.info(f"Query classified as: {category} with confidence: {confidence}")
+        message_logger.info("Received query: %s", query)
+        chat_id = update.effective_chat.id
+        chat_context = conversation_store.get(chat_id)
+        
+        # «ещё»: следующая страница из контекста, без классификации и запросов к БД
+        if chat_context is not None and chat_context.has_more and is_more_request(query):
+            response = chat_context.next_page()
+            conversation_store.put(chat_id, chat_context)
+            with tracing.span('reply'):
+                await reply(update, context, response, **REPLY_OPTIONS)
+            return
         
         session = get_session()
         try:
-            response = ""
-            
-            if category == "поиск сотрудника":
-                logger.info("Searching for employees")
-                response = search_employees(query)
-            elif category == "информация о мероприятии":
-                logger.info("Searching for events")
-                response = search_events(query, session)
-            elif category == "информация о задаче":
-                logger.info("Searching for tasks")
-                response = search_tasks(session, query)
-            elif category == "социальные активности":
-                logger.info("Searching for activities")
-                response = search_activities(session, query)
-            elif category == "день рождения":
-                logger.info("Searching for birthdays")
-                response = search_birthdays(query, session)
-            elif category == "календарь занятости":
-                logger.info("Searching for availability")
-                response = search_availability(query, session)
-            elif category == "приветствие":
-                logger.info("Sending welcome message")
-                response = WELCOME_MESSAGE
-            elif category == "общая информация":
-                logger.info("Searching for general info")
-                response = search_general_info(session, query)
+            # Уточнение («а в мае?») использует категорию предыдущего вопроса
+            # также хранит список отделов для разбора уточнений; пересборка - запросы и сортировка, в поток
+            await asyncio.to_thread(birthday_index.ensure_fresh, session)
+            follow_up_query = resolve_follow_up(query, chat_context, birthday_index.find_department)
+            if follow_up_query:
+                query, category, confidence = follow_up_query, chat_context.category, chat_context.confidence
+                message_logger.info("Follow-up resolved to %r (%s)", query, category)
             else:
-                # Если категория не определена, пробуем все поиски
-                logger.info("Trying all search methods")
-                responses = []
-                
-                emp_response = search_employees(query)
-                if emp_response != ERROR_MESSAGES['not_found']:
-                    responses.append(emp_response)
-                
-                event_response = search_events(query, session)
-                if event_response != ERROR_MESSAGES['not_found']:
-                    responses.append(event_response)
-                
-                task_response = search_tasks(session, query)
-                if task_response != ERROR_MESSAGES['not_found']:
-                    responses.append(task_response)
-                
-                activity_response = search_activities(session, query)
-                if activity_response != ERROR_MESSAGES['not_found']:
-                    responses.append(activity_response)
-                
-                if responses:
-                    response = "\n\n".join(responses)
+                # Классифицируем запрос
+                with tracing.span('classify'):
+                    category, confidence = await asyncio.to_thread(classify_query, query)
+                message_logger.info("Query classified as: %s with confidence: %.2f", category, confidence)
+            
+            with tracing.span('search'):
+                if repository is not None:
+                    response = await answer_query_async(query, category, session)
                 else:
-                    response = "Я нашел следующую информацию:\n\n" + search_general_info(session, query)
+                    # Синхронный поиск (модель, индексы) - в отдельном потоке, чтобы не блокировать другие апдейты
+                    response = await asyncio.to_thread(answer_query, query, category, session)
             
             if not response or response == ERROR_MESSAGES['not_found']:
                 response = "Я могу помочь вам найти информацию о:\n" + \
@@ -259,303 +265,388 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                           "🎂 Днях рождения\n" + \
                           "📊 Занятости\n\n" + \
                           "Задайте вопрос, и я постараюсь найти нужную информацию!"
+                conversation_store.discard(chat_id)
+            else:
+                header, results = split_results(response)
+                chat_context = ChatContext(
+                    category, confidence, query, extract_entities(query, birthday_index.find_department),
+                    header, results
+                )
+                response = chat_context.next_page()
+                conversation_store.put(chat_id, chat_context)
             
-            logger.info(f"Generated response: {response[:100]}...")  # Log first 100 chars of response
-            await update.message.reply_text(response)
+            message_logger.info("Generated response: %s", response)  # обрезается до LOG_MAX_PAYLOAD
+            with tracing.span('reply'):
+                await reply(update, context, response, **REPLY_OPTIONS)
             
         except Exception as e:
             logger.error(f"Error processing query: {str(e)}")
             logger.error(f"Traceback: {traceback.format_exc()}")
-            await update.message.reply_text("Я могу помочь вам найти информацию о сотрудниках, мероприятиях, задачах и многом другом. Попробуйте задать вопрос по-другому!")
+            await reply(update, context, "Я могу помочь вам найти информацию о сотрудниках, мероприятиях, задачах и многом другом. Попробуйте задать вопрос по-другому!")
         finally:
             session.close()
             
     except Exception as e:
         logger.error(f"Error in handle_message: {str(e)}")
         logger.error(f"Traceback: {traceback.format_exc()}")
-        await update.message.reply_text("Я могу помочь вам найти информацию о сотрудниках, мероприятиях, задачах и многом другом. Попробуйте задать вопрос по-другому!")
+        await reply(update, context, "Я могу помочь вам найти информацию о сотрудниках, мероприятиях, задачах и многом другом. Попробуйте задать вопрос по-другому!")
 
 def search_employees(query: str) -> str:
-    """Улучшенный поиск сотрудников с использованием семантического поиска"""
+    """Поиск сотрудников: кандидаты по словам и навыкам, затем переранжирование эмбеддингами"""
+    session = get_session()
     try:
-        session = get_session()
-        query_embedding = model.encode(query) if model else None
-        
-        # Получаем всех сотрудников
-        employees = session.query(Employee).filter(Employee.is_active == True).all()
-        
-        # Создаем эмбеддинги для каждого сотрудника
-        employee_embeddings = []
-        for emp in employees:
-            emp_text = f"{emp.name} {emp.position} {emp.department} {emp.skills}"
-            emp_embedding = model.encode(emp_text) if model else None
-            employee_embeddings.append((emp, emp_embedding))
-        
-        # Находим наиболее похожих сотрудников
-        results = []
-        for emp, emp_embedding in employee_embeddings:
-            if query_embedding is not None and emp_embedding is not None:
-                similarity = torch.nn.functional.cosine_similarity(
-                    torch.tensor(query_embedding),
-                    torch.tensor(emp_embedding),
-                    dim=0
-                )
-                results.append((emp, similarity.item()))
-        
-        # Сортируем результаты по схожести
-        results.sort(key=lambda x: x[1], reverse=True)
-        
-        # Форматируем результаты
-        if not results:
+        # Несколько страниц сразу: продолжение («ещё») отдается из контекста чата без повторного поиска
+        matches = employee_search.search(
+            session, query, limit=SEARCH_SETTINGS['max_results'] * CONVERSATION_SETTINGS['cached_pages']
+        )
+        if not matches:
             return ERROR_MESSAGES['not_found']
-        
-        response = "Вот что я нашел:\n\n"
-        for emp, similarity in results[:SEARCH_SETTINGS['max_results']]:
-            response += format_employee_info(emp)
-            response += f"\nРелевантность: {similarity:.2f}\n\n"
-        
-        return response
-        
+
+        # Карточки из снимка справочника: без второго запроса и ORM-объектов
+        directory.ensure_fresh(session)
+        message = MessageBuilder(RENDER_MODE, limit=None)
+        message.add("Вот что я нашел:", counted=False)
+        for match in matches:
+            emp = directory.get(match.employee_id)
+            if emp is None:
+                continue
+            message.add(format_employee_info(emp) + escape(f"\nРелевантность: {match.score:.2f}", RENDER_MODE))
+
+        return message.text()
+
     except Exception as e:
         logger.error(f"Error in search_employees: {e}")
         return ERROR_MESSAGES['general']
+    finally:
+        session.close()
+
+def _full_name(person) -> str:
+    return f"{person.name} {person.surname}" if person is not None else "Не назначен"
+
+# Карточки ответов: шаблоны разбираются один раз при импорте (rendering.Template)
+DESCRIPTION = f"{{description:{RENDER_SETTINGS['description_length']}}}"
+
+EMPLOYEE_CARD = Template(
+    "👤 {full_name:b}\n"
+    "📋 Должность: {position}\n"
+    "🏢 Отдел: {department}\n"
+    "📧 Email: {email}\n"
+    "📱 Телефон: {phone}\n"
+    "💡 Навыки: {skills}\n"
+    "🎯 Интересы: {interests}",
+    full_name=_full_name, phone=or_default('phone', 'Не указан'),
+    skills=or_default('skills', 'Не указаны'), interests=or_default('interests', 'Не указаны'),
+)
+
+def render_cards(title: str, rows: list, template: Template, total: Optional[int] = None) -> str:
+    """Заголовок и карточки первых RESULT_ROWS строк; остальные не форматируются.
 
-def format_employee_info(emp: Employee) -> str:
+    ``total`` - сколько строк всего, когда ``rows`` уже ограничены запросом (LIMIT RESULT_ROWS).
+    """
+    total = len(rows) if total is None else total
+    if total > min(len(rows), RESULT_ROWS):
+        title += f" (первые {min(len(rows), RESULT_ROWS)} из {total})"
+    return render_list(title + ":", rows, template, RENDER_MODE, limit=None, max_rows=RESULT_ROWS)
+
+def format_employee_info(emp: DirectoryEntry) -> str:
     """Форматирование информации о сотруднике"""
-    return f"""👤 {emp.name} {emp.surname}
-📋 Должность: {emp.position}
-🏢 Отдел: {emp.department}
-📧 Email: {emp.email}
-📱 Телефон: {emp.phone or 'Не указан'}
-💡 Навыки: {emp.skills or 'Не указаны'}
-🎯 Интересы: {emp.interests or 'Не указаны'}"""
+    return EMPLOYEE_CARD.render(emp, RENDER_MODE)
 
 def search_events(query: str, session) -> str:
     """Поиск мероприятий"""
     try:
-        # Получаем текущую дату
-        now = datetime.now(pytz.timezone(TIMEZONE))
-        
-        # Ищем предстоящие мероприятия
-        events = session.query(Event).filter(
-            Event.start_time >= now,
-            Event.status == 'active'
-        ).order_by(Event.start_time).all()
-        
-        if not events:
-            return "На ближайшее время мероприятий не запланировано."
-        
-        response = "Предстоящие мероприятия:\n\n"
-        for event in events:
-            response += format_event_info(event)
-        
-        return response
+        # Предстоящие мероприятия вместе с организаторами и участниками (без ленивых загрузок при форматировании)
+        now = _now()
+        events, total = fetch_page(
+            session, upcoming_events_query(now, RESULT_ROWS), upcoming_events_count(now), RESULT_ROWS)
+        return render_events(events, total)
         
     except Exception as e:
         logger.error(f"Error in search_events: {e}")
         return ERROR_MESSAGES['general']
 
+def render_events(events: List[Event], total: Optional[int] = None) -> str:
+    if not events:
+        return "На ближайшее время мероприятий не запланировано."
+    
+    with tracing.span('format'):
+        return render_cards("Предстоящие мероприятия", events, EVENT_CARD, total)
+
+EVENT_CARD = Template(
+    "📅 {title:b}\n"
+    f"📝 {DESCRIPTION}\n"
+    "🕒 Время: {start} - {end}\n"
+    "📍 Место: {location}\n"
+    "👥 Организатор: {organizer}\n"
+    "👥 Участников: {participants}/{capacity}",
+    description=or_default('description', 'Описание отсутствует'),
+    start=strftime('start_time', '%d.%m.%Y %H:%M'), end=strftime('end_time', '%H:%M'),
+    location=or_default('location', 'Не указано'),
+    organizer=lambda event: _full_name(event.organizer),
+    participants=lambda event: len(event.participants),
+    capacity=or_default('max_participants', '∞'),
+)
+
 def format_event_info(event: Event) -> str:
     """Форматирование информации о мероприятии"""
-    return f"""📅 {event.title}
-📝 {event.description or 'Описание отсутствует'}
-🕒 Время: {event.start_time.strftime('%d.%m.%Y %H:%M')} - {event.end_time.strftime('%H:%M')}
-📍 Место: {event.location or 'Не указано'}
-👥 Организатор: {event.organizer.name} {event.organizer.surname}
-👥 Участников: {len(event.participants)}/{event.max_participants or '∞'}\n\n"""
+    return EVENT_CARD.render(event, RENDER_MODE)
 
 def search_tasks(session, query: str) -> str:
     """Поиск задач"""
     try:
-        # Получаем текущую дату
-        now = datetime.now(pytz.timezone(TIMEZONE))
-        
-        # Ищем активные задачи
-        tasks = session.query(Task).filter(
-            Task.status != TaskStatus.DONE,
-            Task.due_date >= now
-        ).order_by(Task.priority.desc(), Task.due_date).all()
-        
-        if not tasks:
-            return "У вас нет активных задач."
-        
-        response = "Ваши задачи:\n\n"
-        for task in tasks:
-            response += format_task_info(task)
-        
-        return response
+        # Ищем активные задачи; теги из запроса ("задачи по docker") - точное совпадение через task_tags
+        tags = known_labels(session, Tag, analyze(query).ngrams)
+        now = _now()
+        tasks, total = fetch_page(
+            session, open_tasks_query(now, tags, RESULT_ROWS), open_tasks_count(now, tags), RESULT_ROWS)
+        return render_tasks(tags, tasks, total)
         
     except Exception as e:
         logger.error(f"Error in search_tasks: {e}")
         return ERROR_MESSAGES['general']
 
+def render_tasks(tags: List[str], tasks: List[Task], total: Optional[int] = None) -> str:
+    if not tasks:
+        return "У вас нет активных задач."
+    
+    with tracing.span('format'):
+        return render_cards(f"Задачи с тегами {', '.join(tags)}" if tags else "Ваши задачи", tasks, TASK_CARD, total)
+
+TASK_STATUS_EMOJI = {
+    TaskStatus.TODO: "📝",
+    TaskStatus.IN_PROGRESS: "🔄",
+    TaskStatus.DONE: "✅",
+    TaskStatus.BLOCKED: "⛔"
+}
+
+TASK_CARD = Template(
+    "{status} {title:b}\n"
+    f"📝 {DESCRIPTION}\n"
+    "👤 Исполнитель: {assignee}\n"
+    "📅 Срок: {due}\n"
+    "⭐ Приоритет: {stars}",
+    status=lambda task: TASK_STATUS_EMOJI.get(task.status, "📋"),
+    description=or_default('description', 'Описание отсутствует'),
+    assignee=lambda task: _full_name(task.assignee),
+    due=strftime('due_date', '%d.%m.%Y', 'Не указан'),
+    stars=lambda task: '⭐' * task.priority,
+)
+
 def format_task_info(task: Task) -> str:
     """Форматирование информации о задаче"""
-    status_emoji = {
-        TaskStatus.TODO: "📝",
-        TaskStatus.IN_PROGRESS: "🔄",
-        TaskStatus.DONE: "✅",
-        TaskStatus.BLOCKED: "⛔"
-    }
-    
-    return f"""{status_emoji.get(task.status, "📋")} {task.title}
-📝 {task.description or 'Описание отсутствует'}
-👤 Исполнитель: {task.assignee.name} {task.assignee.surname}
-📅 Срок: {task.due_date.strftime('%d.%m.%Y') if task.due_date else 'Не указан'}
-⭐ Приоритет: {'⭐' * task.priority}\n\n"""
+    return TASK_CARD.render(task, RENDER_MODE)
 
 def search_activities(session, query: str) -> str:
     """Поиск социальных активностей"""
     try:
-        # Получаем текущую дату
-        now = datetime.now(pytz.timezone(TIMEZONE))
-        
         # Ищем активные мероприятия
-        activities = session.query(Activity).filter(
-            Activity.start_time >= now,
-            Activity.status == 'active'
-        ).order_by(Activity.start_time).all()
-        
-        if not activities:
-            return "На ближайшее время активностей не запланировано."
-        
-        response = "Доступные активности:\n\n"
-        for activity in activities:
-            response += format_activity_info(activity)
-        
-        return response
+        now = _now()
+        activities, total = fetch_page(
+            session, upcoming_activities_query(now, RESULT_ROWS), upcoming_activities_count(now), RESULT_ROWS)
+        return render_activities(activities, total)
         
     except Exception as e:
         logger.error(f"Error in search_activities: {e}")
         return ERROR_MESSAGES['general']
 
+def render_activities(activities: List[Activity], total: Optional[int] = None) -> str:
+    if not activities:
+        return "На ближайшее время активностей не запланировано."
+    
+    with tracing.span('format'):
+        return render_cards("Доступные активности", activities, ACTIVITY_CARD, total)
+
+ACTIVITY_CARD = Template(
+    "🎯 {title:b}\n"
+    f"📝 {DESCRIPTION}\n"
+    "🕒 Время: {start} - {end}\n"
+    "📍 Место: {location}\n"
+    "👥 Организатор: {organizer}\n"
+    "👥 Участников: {current_participants}/{capacity}",
+    description=or_default('description', 'Описание отсутствует'),
+    start=strftime('start_time', '%d.%m.%Y %H:%M'), end=strftime('end_time', '%H:%M'),
+    location=or_default('location', 'Не указано'),
+    organizer=lambda activity: _full_name(activity.organizer),
+    capacity=or_default('max_participants', '∞'),
+)
+
 def format_activity_info(activity: Activity) -> str:
     """Форматирование информации об активности"""
-    return f"""🎯 {activity.title}
-📝 {activity.description or 'Описание отсутствует'}
-🕒 Время: {activity.start_time.strftime('%d.%m.%Y %H:%M')} - {activity.end_time.strftime('%H:%M')}
-📍 Место: {activity.location or 'Не указано'}
-👥 Организатор: {activity.organizer.name} {activity.organizer.surname}
-👥 Участников: {activity.current_participants}/{activity.max_participants or '∞'}\n\n"""
+    return ACTIVITY_CARD.render(activity, RENDER_MODE)
+
+BIRTHDAY_MONTHS = {
+    'январ': 1, 'феврал': 2, 'март': 3, 'апрел': 4, 'июн': 6, 'июл': 7,
+    'август': 8, 'сентябр': 9, 'октябр': 10, 'ноябр': 11, 'декабр': 12
+}
+BIRTHDAY_MAY_FORMS = {'май', 'мая', 'мае'}
+
+BIRTHDAY_NUMERALS = {'две': 2, 'двух': 2, 'три': 3, 'трех': 3}
+
+def _parse_birthday_month(words: List[str]) -> Optional[int]:
+    for word in words:
+        if word in BIRTHDAY_MAY_FORMS:
+            return 5
+        for stem, month in BIRTHDAY_MONTHS.items():
+            if word.startswith(stem):
+                return month
+    return None
+
+def _birthday_when(entry: BirthdayEntry) -> str:
+    if entry.days_until == 0:
+        return "сегодня"
+    if entry.days_until == 1:
+        return "завтра"
+    return f"через {entry.days_until} дн."
+
+BIRTHDAY_CARD = Template(
+    "🎂 {full_name:b}\n"
+    "📅 {date} ({when})\n"
+    "🏢 Отдел: {department}",
+    full_name=_full_name, date=strftime('birthday', '%d.%m.%Y'), when=_birthday_when,
+)
+
+def format_birthday_entry(entry: BirthdayEntry) -> str:
+    """Форматирование дня рождения"""
+    return BIRTHDAY_CARD.render(entry, RENDER_MODE)
 
 def search_birthdays(query: str, session) -> str:
-    """Поиск дней рождения"""
+    """Поиск дней рождения: месяц, ближайшие N, следующие N дней, по отделу"""
     try:
-        # Получаем текущую дату
         now = datetime.now(pytz.timezone(TIMEZONE))
+        text = query.lower()
+        words = analyze(query).words
+        birthday_index.ensure_fresh(session)
+        department = birthday_index.find_department(query)
+        suffix = f" ({department})" if department else ""
+        
+        month = _parse_birthday_month(words)
+        days_match = re.search(r'(\d+)\s*(?:дн|день)', text)
+        weeks_match = re.search(r'(\d+|две|двух|три|трех)?\s*недел', text)
+        if month:
+            entries = query_month(session, month, department)
+            title = f"Дни рождения в месяце {month:02d}{suffix}:"
+        elif days_match or weeks_match:
+            if days_match:
+                days = int(days_match.group(1))
+            else:
+                weeks = weeks_match.group(1)
+                days = 7 * (BIRTHDAY_NUMERALS.get(weeks) or int(weeks) if weeks else 1)
+            entries = birthday_index.upcoming(session, days, department)
+            title = f"Дни рождения в ближайшие {days} дн.{suffix}:"
+        elif ('ближайш' in text or 'следующ' in text) and 'месяц' not in text:
+            numbers = [int(word) for word in words if word.isdigit()]
+            n = numbers[0] if numbers else SEARCH_SETTINGS['max_results']
+            entries = birthday_index.next_n(session, n, department)
+            title = f"Ближайшие дни рождения{suffix}:"
+        else:
+            month = now.month
+            if 'следующ' in text:
+                month = month % 12 + 1
+            entries = query_month(session, month, department)
+            title = ("Дни рождения в этом месяце" if month == now.month else "Дни рождения в следующем месяце") + suffix + ":"
         
-        # Ищем дни рождения в текущем месяце
-        employees = session.query(Employee).filter(
-            Employee.is_active == True,
-            extract('month', Employee.birthday) == now.month
-        ).order_by(extract('day', Employee.birthday)).all()
-        
-        if not employees:
-            return "В этом месяце нет дней рождения."
-        
-        response = "Дни рождения в этом месяце:\n\n"
-        for emp in employees:
-            response += f"""🎂 {emp.name} {emp.surname}
-📅 {emp.birthday.strftime('%d.%m.%Y')}
-🏢 Отдел: {emp.department}\n\n"""
+        if not entries:
+            return "В этот период нет дней рождения."
         
-        return response
+        return render_cards(title.rstrip(':'), entries, BIRTHDAY_CARD)
         
     except Exception as e:
         logger.error(f"Error in search_birthdays: {e}")
         return ERROR_MESSAGES['general']
 
+def _week_status(row) -> str:
+    week_end = local_now() + timedelta(days=7)
+    upcoming = [(at, title) for at, title in ((row.next_event_at, row.next_event_title),
+                                             (row.next_activity_at, row.next_activity_title))
+                if at is not None and at <= week_end]
+    if not upcoming:
+        return "✅ Свободен на этой неделе"
+    at, title = min(upcoming)
+    return f"📅 Ближайшее: {title} ({at.strftime('%d.%m.%Y %H:%M')}), всего впереди: {row.upcoming_events + row.upcoming_activities}"
+
+# Строка сводки employee_summary; "Открытых задач" пропускается, когда их нет
+AVAILABILITY_CARD = Template(
+    "👤 {full_name}\n"
+    "🏢 Отдел: {department}\n"
+    "{week}\n"
+    "📋 Открытых задач: {open_tasks:?}",
+    full_name=_full_name, week=_week_status,
+)
+
 def search_availability(query: str, session) -> str:
-    """Поиск занятости сотрудников"""
+    """Поиск занятости сотрудников (одно чтение сводки employee_summary)"""
     try:
-        # Получаем текущую дату
-        now = datetime.now(pytz.timezone(TIMEZONE))
-        
-        # Ищем сотрудников и их мероприятия
-        employees = session.query(Employee).filter(Employee.is_active == True).all()
-        
-        response = "Занятость сотрудников:\n\n"
-        for emp in employees:
-            # Получаем мероприятия сотрудника
-            events = session.query(Event).join(
-                Event.participants
-            ).filter(
-                Employee.id == emp.id,
-                Event.start_time >= now,
-                Event.end_time <= now + timedelta(days=7)
-            ).all()
-            
-            response += f"""👤 {emp.name} {emp.surname}
-🏢 Отдел: {emp.department}\n"""
-            
-            if events:
-                response += "📅 Занят на мероприятиях:\n"
-                for event in events:
-                    response += f"• {event.title} ({event.start_time.strftime('%d.%m.%Y %H:%M')})\n"
-            else:
-                response += "✅ Свободен на этой неделе\n"
-            
-            response += "\n"
+        birthday_index.ensure_fresh(session)  # заодно знает названия отделов ("занятость отдела продаж")
+        department = birthday_index.find_department(query)
+        rows = summary_listing(session, department, local_now(), limit=RESULT_ROWS)
+        if not rows:
+            return ERROR_MESSAGES['not_found']
+        total = active_count(session, department) if len(rows) == RESULT_ROWS else len(rows)
         
-        return response
+        with tracing.span('format'):
+            return render_cards("Занятость сотрудников", rows, AVAILABILITY_CARD, total)
         
     except Exception as e:
         logger.error(f"Error in search_availability: {e}")
         return ERROR_MESSAGES['general']
 
-def search_general_info(session, query: str) -> str:
-    """Поиск общей информации"""
+ENTITY_LABELS = {
+    'employee': ('👤', 'сотрудники'),
+    'event': ('📅', 'мероприятия'),
+    'task': ('📋', 'задачи'),
+    'activity': ('🎯', 'активности'),
+    'info': ('📌', 'общая информация'),
+}
+
+def format_search_hit(hit: SearchHit) -> str:
+    """Форматирование результата единого поискового индекса"""
+    document = hit.document
+    payload = document.payload
+    emoji, label = ENTITY_LABELS[document.entity_type]
+    if document.entity_type == 'info':
+        details = f"📝 {payload['content']}\n🏷️ Категория: {payload['category']}"
+    elif document.entity_type == 'employee':
+        details = f"💼 {payload['position']}, {payload['department']}\n📧 {payload['email']}"
+    else:
+        details = f"📝 {payload.get('description') or ''}"
+        when = payload.get('start_time') or payload.get('due_date')
+        if when:
+            details += f"\n🕒 {datetime.fromisoformat(when).strftime('%d.%m.%Y %H:%M')}"
+    return escape(f"{emoji} {document.title}\n{details}\n⭐ Релевантность: {hit.score:.2f}", RENDER_MODE)
+
+def search_general_info(session, query: str, types: Optional[Tuple[str, ...]] = None) -> str:
+    """Поиск по единому индексу: сотрудники, мероприятия, задачи, активности и общая информация"""
     try:
-        # Получаем эмбеддинги запроса
-        query_embedding = model.encode(query) if model else None
-        
-        # Получаем всю информацию
-        info_items = session.query(GeneralInfo).filter(
-            GeneralInfo.is_active == True
-        ).all()
-        
-        # Создаем эмбеддинги для каждого элемента
-        info_embeddings = []
-        for item in info_items:
-            item_text = f"{item.title} {item.content} {item.category}"
-            item_embedding = model.encode(item_text) if model else None
-            info_embeddings.append((item, item_embedding))
-        
-        # Находим наиболее похожие элементы
-        results = []
-        for item, item_embedding in info_embeddings:
-            if query_embedding is not None and item_embedding is not None:
-                similarity = torch.nn.functional.cosine_similarity(
-                    torch.tensor(query_embedding),
-                    torch.tensor(item_embedding),
-                    dim=0
-                )
-                results.append((item, similarity.item()))
-        
-        # Сортируем результаты по схожести
-        results.sort(key=lambda x: x[1], reverse=True)
-        
-        # Форматируем результаты
-        if not results:
+        search_index.ensure_fresh(session)
+        results = search_index.search(
+            query, types=types, limit=SEARCH_SETTINGS['max_results'] * CONVERSATION_SETTINGS['cached_pages']
+        )
+        if not results.hits:
             return ERROR_MESSAGES['not_found']
-        
-        response = "Вот что я нашел:\n\n"
-        for item, similarity in results[:SEARCH_SETTINGS['max_results']]:
-            response += f"""📌 {item.title}
-📝 {item.content}
-🏷️ Категория: {item.category}
-⭐ Релевантность: {similarity:.2f}\n\n"""
-        
+
+        facets = ', '.join(f"{ENTITY_LABELS[entity_type][1]}: {count}" for entity_type, count in results.facets.items())
+        response = escape(f"Вот что я нашел ({facets}):", RENDER_MODE) + "\n\n"
+        response += "\n\n".join(format_search_hit(hit) for hit in results.hits)
         return response
-        
+
     except Exception as e:
         logger.error(f"Error in search_general_info: {e}")
         return ERROR_MESSAGES['general']
 
+# Источники запасного поиска, по порядку приоритета при равной релевантности
+FALLBACK_SOURCES = [
+    SearchSource('сотрудники', lambda session, query: search_employees(query)),
+    SearchSource('мероприятия', lambda session, query: search_events(query, session)),
+    SearchSource('задачи', search_tasks),
+    SearchSource('активности', search_activities),
+    SearchSource('общая информация', lambda session, query: search_general_info(session, query, types=('info',))),
+]
+fallback_search = FanOutSearch()
+
 def init_test_data():
     """Инициализация тестовых данных в базе данных"""
     try:
-        session = get_session()
+        session = get_session(primary=True)
         
         # Проверяем, есть ли уже данные
         if session.query(Employee).first() is not None:
@@ -663,25 +754,103 @@ def init_test_data():
     finally:
         session.close()
 
+async def post_init(application: Application):
+    """Запуск фоновых компонентов после инициализации приложения"""
+    global repository
+    outbound = await start_outbound(application)
+    repository = create_repository()
+    if repository is not None:
+        tracing.instrument_engine(repository.engine.sync_engine)
+        if repository.read_engine is not None:
+            tracing.instrument_engine(repository.read_engine.sync_engine)
+    # Модель грузится в фоне: бот начинает отвечать сразу, эмбеддинги подключаются, когда готовы
+    if STARTUP_SETTINGS['load_models']:
+        application.bot_data['model_loading'] = asyncio.create_task(
+            asyncio.to_thread(attach_encoder, [router, search_index, employee_search])
+        )
+    # В шардированном webhook-режиме напоминания рассылает только один воркер
+    if REMINDER_SETTINGS['enabled'] and application.bot_data.get('background_jobs', True):
+        reminder_engine = application.bot_data['reminders'] = ReminderEngine(outbound)
+        application.job_queue.run_repeating(
+            reminder_engine.tick, interval=REMINDER_SETTINGS['interval_seconds'], first=5
+        )
+
+async def post_shutdown(application: Application):
+    global repository
+    await stop_outbound(application)
+    if 'reminders' in application.bot_data:
+        await application.bot_data['reminders'].close()
+    if repository is not None:
+        await repository.dispose()
+        repository = None
+
+async def refresh_birthday_index(context: ContextTypes.DEFAULT_TYPE):
+    """Фоновое обновление индекса дней рождения"""
+    session = get_session()
+    try:
+        # Пересборка - синхронные запросы к БД: в потоке, чтобы не останавливать цикл событий
+        await asyncio.to_thread(birthday_index.ensure_fresh, session)
+    finally:
+        session.close()
+
+async def archive_history(context: ContextTypes.DEFAULT_TYPE):
+    """Фоновый перенос прошедших мероприятий и давно выполненных задач в архивные таблицы"""
+    await asyncio.to_thread(archive_run, engine)
+
+async def purge_conversation_contexts(context: ContextTypes.DEFAULT_TYPE):
+    """Фоновая очистка устаревших контекстов диалогов"""
+    dropped = conversation_store.purge_expired()
+    if dropped:
+        logger.info("Purged %d expired conversation contexts", dropped)
+
+def build_application(background_jobs: bool = True) -> Application:
+    """Создание приложения с обработчиками (используется и в polling, и в webhook-режиме)"""
+    # Метрики и трассировка (no-op, если TRACING_ENABLED=false); один раз на процесс
+    tracing.instrument_engine(engine, Session)
+    if read_engine is not None:
+        tracing.instrument_engine(read_engine)
+    
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .concurrent_updates(WEBHOOK_SETTINGS['concurrent_updates'])
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if TELEGRAM_API_BASE_URL:
+        builder = builder.base_url(TELEGRAM_API_BASE_URL)
+    application = builder.build()
+    application.bot_data['background_jobs'] = background_jobs
+    
+    # Добавление обработчиков
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    
+    # Индекс дней рождения пересчитывается, когда в каком-либо часовом поясе наступают новые сутки
+    application.job_queue.run_repeating(refresh_birthday_index, interval=3600, first=0)
+    application.job_queue.run_repeating(purge_conversation_contexts, interval=600, first=600)
+    # Как и напоминания, в шардированном webhook-режиме архив переносит один воркер
+    if ARCHIVE_SETTINGS['enabled'] and background_jobs:
+        application.job_queue.run_repeating(archive_history, interval=ARCHIVE_SETTINGS['interval_seconds'], first=60)
+    return application
+
 def main():
     """Основная функция запуска бота"""
     try:
         # Инициализация базы данных
         init_db()
+        tracing.start_metrics_server()
         
         # Инициализация тестовых данных
         init_test_data()
         
-        # Создание приложения
-        application = Application.builder().token(TELEGRAM_TOKEN).build()
-        
-        # Добавление обработчиков
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(CommandHandler("help", help_command))
-        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-        
         # Запуск бота
-        application.run_polling()
+        if BOT_MODE == 'webhook':
+            from webhook import run_webhook
+            run_webhook(build_application)
+        else:
+            build_application().run_polling()
         
     except Exception as e:
         logger.error(f"Error in main: {str(e)}")
@@ -0,0 +1,113 @@
+"""Query normalization, done once per message.
+
+``analyze(text)`` returns a ``QueryTokens`` with everything the classifiers
+and searches need:
+
+  * ``text``  - lowercased, punctuation stripped, intent stopwords dropped
+                (what the rule stage matches keywords against);
+  * ``words`` - every lowercased word, in order;
+  * ``terms`` - stems of the content words (search stopwords and words
+                shorter than 3 letters dropped), the vocabulary of the BM25
+                indexes;
+  * ``ngrams`` - words, bigrams and trigrams ("машинное обучение").
+
+Results are kept in an LRU keyed by the lowercased text. The router, the
+fallback ranking and the search indexes each call ``analyze`` on the same
+message, and all of them get the object computed the first time.
+Document text goes through ``index_terms``, which uses the same stemmer, so
+queries and documents share one vocabulary.
+
+Stemming uses NLTK Snowball (Russian for Cyrillic words, English for Latin
+ones) behind its own LRU. Stopwords come from the prepared NLTK_DATA_DIR. Both
+load on first use, not at import. Without nltk the stem is the first
+STEM_LENGTH letters and the built-in stopword list is used.
+"""
+import logging
+import re
+from functools import lru_cache
+from typing import FrozenSet, List, NamedTuple, Tuple
+
+logger = logging.getLogger(__name__)
+
+STEM_LENGTH = 5
+MIN_TERM_LENGTH = 3
+PUNCTUATION = re.compile(r'[^\w\s\-]')
+WORD = re.compile(r'[\w+#]+')  # "c++" и "c#" остаются словами
+TERM = re.compile(r'\w+')
+CYRILLIC = re.compile(r'[а-яё]')
+LATIN = re.compile(r'^[a-z]+$')
+
+# Стоп-слова правил классификации (как в прежнем preprocess_query; пороги правил откалиброваны под них)
+RULE_STOPWORDS = frozenset({
+    'и', 'в', 'на', 'с', 'по', 'для', 'не', 'ни', 'но', 'а', 'или', 'что', 'как', 'когда', 'где', 'почему', 'зачем',
+})
+# Стоп-слова поиска, если данные NLTK не подготовлены
+BUILTIN_SEARCH_STOPWORDS = RULE_STOPWORDS | frozenset({
+    'кто', 'это', 'так', 'вот', 'мне', 'меня', 'мой', 'мои', 'моя', 'наш', 'наши', 'все', 'всех', 'есть', 'был',
+    'была', 'были', 'будет', 'его', 'ее', 'её', 'они', 'она', 'оно', 'мы', 'вы', 'ты', 'он', 'из', 'от', 'до',
+    'за', 'про', 'при', 'под', 'над', 'уже', 'еще', 'ещё', 'ли', 'бы', 'же', 'то', 'там', 'тут', 'здесь',
+    'какой', 'какая', 'какие', 'каких', 'который', 'которые', 'чтобы', 'если', 'очень', 'можно', 'нужно', 'надо',
+    'the', 'and', 'for', 'with', 'who', 'what', 'where', 'when',
+})
+
+
+class QueryTokens(NamedTuple):
+    text: str
+    words: Tuple[str, ...]
+    terms: Tuple[str, ...]
+    ngrams: FrozenSet[str]
+
+
+@lru_cache(maxsize=1)
+def search_stopwords() -> FrozenSet[str]:
+    from download_nltk_data import nltk_data_ready
+
+    if nltk_data_ready():
+        from nltk.corpus import stopwords
+        return BUILTIN_SEARCH_STOPWORDS | frozenset(stopwords.words('russian')) | frozenset(stopwords.words('english'))
+    return BUILTIN_SEARCH_STOPWORDS
+
+
+@lru_cache(maxsize=1)
+def _stemmers():
+    try:
+        from nltk.stem import SnowballStemmer
+    except ImportError:
+        logger.warning("nltk is not installed, stemming falls back to %d-letter prefixes", STEM_LENGTH)
+        return None
+    return SnowballStemmer('russian'), SnowballStemmer('english')
+
+
+@lru_cache(maxsize=50000)
+def stem(word: str) -> str:
+    stemmers = _stemmers()
+    if stemmers is None:
+        return word[:STEM_LENGTH]
+    russian, english = stemmers
+    if CYRILLIC.search(word):
+        return russian.stem(word)
+    if LATIN.match(word):
+        return english.stem(word)
+    return word
+
+
+def index_terms(text: str) -> List[str]:
+    """Stemmed content words of a document (or any text), same vocabulary as ``QueryTokens.terms``."""
+    stopwords = search_stopwords()
+    return [stem(word) for word in TERM.findall((text or '').lower())
+            if len(word) >= MIN_TERM_LENGTH and word not in stopwords]
+
+
+@lru_cache(maxsize=2048)
+def _analyze(lowered: str) -> QueryTokens:
+    cleaned = ' '.join(PUNCTUATION.sub(' ', lowered).split())
+    text = ' '.join(word for word in cleaned.split() if word not in RULE_STOPWORDS)
+    words = tuple(WORD.findall(lowered))
+    ngrams = set(words)
+    for size in (2, 3):
+        ngrams.update(' '.join(words[i:i + size]) for i in range(len(words) - size + 1))
+    return QueryTokens(text, words, tuple(index_terms(lowered)), frozenset(ngrams))
+
+
+def analyze(text: str) -> QueryTokens:
+    return _analyze((text or '').lower())
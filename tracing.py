@@ -0,0 +1,240 @@
+"""Lightweight per-stage latency tracing with Prometheus-style histograms.
+
+Usage:
+    with tracing.request('telegram_bot.handle_message'):
+        with tracing.span('classify'):
+            ...
+
+When ``TRACING_ENABLED`` is false ``request``/``span`` return a shared no-op
+context manager and no SQLAlchemy listeners are installed, so the overhead is
+a single attribute check per call.
+"""
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+from config import METRICS_PORT, TRACING_ENABLED
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    """Cumulative histogram in the Prometheus exposition format."""
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[Tuple[str, str], ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [счетчики по корзинам..., +Inf, сумма]
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        for key, series in items:
+            base_labels = ','.join(f'{k}="{v}"' for k, v in key)
+            prefix = base_labels + ',' if base_labels else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series[:-1]):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+            suffix = f'{{{base_labels}}}' if base_labels else ''
+            lines.append(f'{self.name}_sum{suffix} {series[-1]}')
+            lines.append(f'{self.name}_count{suffix} {cumulative}')
+        return '\n'.join(lines)
+
+
+REQUEST_SECONDS = Histogram('bot_request_seconds', 'End-to-end handler latency')
+STAGE_SECONDS = Histogram('bot_stage_seconds', 'Latency per pipeline stage')
+DB_QUERY_SECONDS = Histogram('bot_db_query_seconds', 'Latency of individual SQL statements')
+REQUEST_DB_QUERIES = Histogram('bot_request_db_queries', 'SQL statements per request', COUNT_BUCKETS)
+REQUEST_DB_SECONDS = Histogram('bot_request_db_seconds', 'Total SQL time per request')
+REQUEST_LAZY_LOADS = Histogram('bot_request_lazy_loads', 'ORM relationship lazy loads per request', COUNT_BUCKETS)
+MODEL_SECONDS = Histogram('bot_model_forward_seconds', 'Model forward pass latency')
+
+HISTOGRAMS = [
+    REQUEST_SECONDS, STAGE_SECONDS, DB_QUERY_SECONDS, REQUEST_DB_QUERIES,
+    REQUEST_DB_SECONDS, REQUEST_LAZY_LOADS, MODEL_SECONDS,
+]
+
+
+class RequestTrace:
+    __slots__ = ('name', 'queries', 'query_seconds', 'lazy_loads')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.lazy_loads = 0
+
+
+_current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar(
+    'current_trace', default=None
+)
+
+
+class _NoopContext:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopContext()
+
+
+class _Span:
+    __slots__ = ('stage', 'started')
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        STAGE_SECONDS.observe(time.perf_counter() - self.started, stage=self.stage)
+        return False
+
+
+class _Request:
+    __slots__ = ('trace', 'token', 'started')
+
+    def __init__(self, name: str):
+        self.trace = RequestTrace(name)
+
+    def __enter__(self):
+        self.token = _current_trace.set(self.trace)
+        self.started = time.perf_counter()
+        return self.trace
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        _current_trace.reset(self.token)
+        handler = self.trace.name
+        REQUEST_SECONDS.observe(elapsed, handler=handler)
+        REQUEST_DB_QUERIES.observe(self.trace.queries, handler=handler)
+        REQUEST_DB_SECONDS.observe(self.trace.query_seconds, handler=handler)
+        REQUEST_LAZY_LOADS.observe(self.trace.lazy_loads, handler=handler)
+        return False
+
+
+def request(name: str):
+    """Trace one handled message: total latency plus per-request DB counters."""
+    if not TRACING_ENABLED:
+        return _NOOP
+    return _Request(name)
+
+
+def span(stage: str):
+    """Time one stage of the pipeline (classification, search, formatting...)."""
+    if not TRACING_ENABLED:
+        return _NOOP
+    return _Span(stage)
+
+
+def instrument_engine(engine, session_class=None):
+    """Count SQL statements and lazy loads per request. No-op when tracing is disabled."""
+    if not TRACING_ENABLED:
+        return
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start_time'].pop()
+        DB_QUERY_SECONDS.observe(elapsed)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.queries += 1
+            trace.query_seconds += elapsed
+
+    if session_class is not None:
+        @event.listens_for(session_class, 'do_orm_execute')
+        def _do_orm_execute(orm_execute_state):
+            if orm_execute_state.is_relationship_load:
+                trace = _current_trace.get()
+                if trace is not None:
+                    trace.lazy_loads += 1
+
+
+def _timed(fn: Callable, model_name: str) -> Callable:
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            MODEL_SECONDS.observe(time.perf_counter() - started, model=model_name)
+    return wrapper
+
+
+def instrument_model(model, model_name: str):
+    """Time ``model.encode`` calls. Returns the model unchanged when disabled."""
+    if TRACING_ENABLED and model is not None:
+        model.encode = _timed(model.encode, model_name)
+    return model
+
+
+def instrument_callable(fn: Optional[Callable], model_name: str):
+    """Time calls of a callable model such as a transformers pipeline."""
+    if TRACING_ENABLED and fn is not None:
+        return _timed(fn, model_name)
+    return fn
+
+
+def render_metrics() -> str:
+    return '\n'.join(histogram.render() for histogram in HISTOGRAMS) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render_metrics().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Не засоряем лог каждым опросом Prometheus
+        pass
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = '127.0.0.1') -> Optional[ThreadingHTTPServer]:
+    """Serve ``/metrics`` from a daemon thread. Returns None when tracing is disabled."""
+    if not TRACING_ENABLED:
+        return None
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info("Metrics endpoint listening on http://%s:%d/metrics", host, port)
+    return server
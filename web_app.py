@@ -1,21 +1,51 @@
-from flask import Flask, render_template, request, jsonify
-from models import get_session, Employee, Event, Task, Activity
+from flask import Flask, Response, render_template, request, jsonify
+from models import get_session, engine, read_engine, Session
 from datetime import datetime, timedelta
-from transformers import pipeline
-import torch
 import json
-from telegram_bot import analyze_query, classify_query
+import tracing
+from logging_setup import configure_logging
+import threading
+from embeddings import attach_encoder, load_zero_shot_classifier
+from intent_router import FALLBACK_CATEGORY, IntentRouter
+from search_index import ENTITY_TYPES, SearchIndex
+from employee_summary import listing as summary_listing
+from archive import POLICIES as ARCHIVE_POLICIES, archived
+from config import SEARCH_SETTINGS, STARTUP_SETTINGS
 
+configure_logging()
 app = Flask(__name__)
+tracing.instrument_engine(engine, Session)
+if read_engine is not None:
+    tracing.instrument_engine(read_engine)
 
-# Initialize the AI model
-classifier = pipeline(
-    "zero-shot-classification",
-    model="facebook/bart-large-mnli",
-    device=0 if torch.cuda.is_available() else -1,
-    framework="pt",
-    top_k=3
-)
+# Categories the web search answers; the same cascade as the bots (rules -> embeddings -> NLI).
+# Models are clients of inference_server when INFERENCE_SOCKET is set; BART is loaded on first use,
+# the encoder in a background thread started by the first request (importing the app loads no model).
+categories = [
+    "поиск сотрудника",
+    "информация о мероприятии",
+    "информация о задаче",
+    "социальные активности",
+    "общая информация",
+    FALLBACK_CATEGORY
+]
+router = IntentRouter(categories, nli_factory=load_zero_shot_classifier)
+_model_loader = None
+_model_loader_lock = threading.Lock()
+
+@app.before_request
+def start_model_loading():
+    global _model_loader
+    if _model_loader is None and STARTUP_SETTINGS['load_models']:
+        with _model_loader_lock:
+            if _model_loader is None:
+                _model_loader = threading.Thread(
+                    target=attach_encoder, args=([router, search_index],), name='model-loader', daemon=True
+                )
+                _model_loader.start()
+
+def classify_query(query):
+    return router.classify(query)
 
 @app.route('/')
 def index():
@@ -23,13 +53,24 @@ def index():
 
 @app.route('/search', methods=['POST'])
 def search():
-    query = request.json.get('query', '')
-    if not query:
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    query = payload.get('query', '')
+    if not query or not isinstance(query, str):
         return jsonify({'error': 'No query provided'}), 400
+    types = payload.get('types')
+    if types is not None and (not isinstance(types, list) or not all(t in ENTITY_TYPES for t in types)):
+        return jsonify({'error': f"'types' must be a list of {', '.join(ENTITY_TYPES)}"}), 400
 
     # Analyze the query using the same AI model as the bot
-    category, confidence = classify_query(query)
-    
+    with tracing.request('web_app.search'):
+        with tracing.span('classify'):
+            category, confidence = classify_query(query)
+        with tracing.span('search'):
+            return _search(query, category, confidence, types)
+
+def _search(query, category, confidence, types=None):
     session = get_session()
     try:
         if category == "поиск сотрудника":
@@ -41,7 +82,7 @@ def search():
         elif category == "социальные активности":
             results = search_activities(session, query)
         else:
-            results = search_general_info(session, query)
+            results = search_general_info(session, query, types)
         
         return jsonify({
             'category': category,
@@ -51,84 +92,89 @@ def search():
     finally:
         session.close()
 
+@app.route('/directory')
+def directory():
+    # Employee directory with task and event counters: one scan of employee_summary, no per-person joins
+    session = get_session()
+    try:
+        rows = summary_listing(session, request.args.get('department'))
+        return jsonify([{
+            'id': row.employee_id,
+            'name': f"{row.name} {row.surname}",
+            'position': row.position,
+            'department': row.department,
+            'open_tasks': row.open_tasks,
+            'next_due_date': row.next_due_date.isoformat() if row.next_due_date else None,
+            'upcoming_events': row.upcoming_events,
+            'next_event': {'title': row.next_event_title, 'start_time': row.next_event_at.isoformat()} if row.next_event_at else None,
+            'upcoming_activities': row.upcoming_activities,
+            'next_activity': {'title': row.next_activity_title, 'start_time': row.next_activity_at.isoformat()} if row.next_activity_at else None,
+        } for row in rows])
+    finally:
+        session.close()
+
+@app.route('/archive/<name>')
+def archive(name):
+    # History is not searched by default; events, activities and tasks moved out of the hot tables are read here
+    if name not in ARCHIVE_POLICIES:
+        return jsonify({'error': f"Unknown archive {name!r}"}), 404
+    try:
+        since, until = (datetime.fromisoformat(request.args[key]) if request.args.get(key) else None
+                        for key in ('since', 'until'))
+        limit = min(int(request.args.get('limit', 100)), 1000)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    session = get_session()
+    try:
+        return jsonify([{
+            key: value.isoformat() if isinstance(value, datetime) else getattr(value, 'value', value)
+            for key, value in row._mapping.items()
+        } for row in archived(session, name, since, until, limit)])
+    finally:
+        session.close()
+
+@app.route('/metrics')
+def metrics():
+    return Response(tracing.render_metrics(), mimetype='text/plain; version=0.0.4')
+
+# All web searches are lookups in one in-memory index (search_index.py); the category picks the facet.
+search_index = SearchIndex()
+
+CATEGORY_TYPES = {
+    "поиск сотрудника": ('employee',),
+    "информация о мероприятии": ('event',),
+    "информация о задаче": ('task',),
+    "социальные активности": ('activity',),
+}
+
+def _hit_to_dict(hit):
+    document = hit.document
+    return dict(document.payload, type=document.entity_type, id=document.entity_id, score=round(hit.score, 4))
+
+def _lookup(session, query, types=None):
+    search_index.ensure_fresh(session)
+    return search_index.search(query, types=types, limit=SEARCH_SETTINGS['max_results'] * 4)
+
 def search_employees(session, query):
-    employees = session.query(Employee).all()
-    results = []
-    for emp in employees:
-        if any(term.lower() in emp.name.lower() or 
-               term.lower() in emp.department.lower() or 
-               term.lower() in emp.skills.lower() or 
-               term.lower() in emp.interests.lower() 
-               for term in query.split()):
-            results.append({
-                'name': emp.name,
-                'position': emp.position,
-                'department': emp.department,
-                'skills': emp.skills,
-                'interests': emp.interests
-            })
-    return results
+    return [_hit_to_dict(hit) for hit in _lookup(session, query, CATEGORY_TYPES["поиск сотрудника"]).hits]
 
 def search_events(session, query):
-    events = session.query(Event).all()
-    results = []
-    for event in events:
-        if any(term.lower() in event.name.lower() or 
-               term.lower() in event.description.lower() 
-               for term in query.split()):
-            results.append({
-                'name': event.name,
-                'type': event.type.value,
-                'date': event.date.strftime('%Y-%m-%d'),
-                'time': event.time.strftime('%H:%M'),
-                'location': event.location,
-                'description': event.description
-            })
-    return results
+    return [_hit_to_dict(hit) for hit in _lookup(session, query, CATEGORY_TYPES["информация о мероприятии"]).hits]
 
 def search_tasks(session, query):
-    tasks = session.query(Task).all()
-    results = []
-    for task in tasks:
-        if any(term.lower() in task.title.lower() or 
-               term.lower() in task.description.lower() 
-               for term in query.split()):
-            results.append({
-                'title': task.title,
-                'description': task.description,
-                'status': task.status.value,
-                'priority': task.priority,
-                'deadline': task.deadline.strftime('%Y-%m-%d') if task.deadline else None
-            })
-    return results
+    return [_hit_to_dict(hit) for hit in _lookup(session, query, CATEGORY_TYPES["информация о задаче"]).hits]
 
 def search_activities(session, query):
-    activities = session.query(Activity).filter(Activity.is_active == True).all()
-    results = []
-    for activity in activities:
-        if any(term.lower() in activity.name.lower() or 
-               term.lower() in activity.description.lower() 
-               for term in query.split()):
-            results.append({
-                'name': activity.name,
-                'type': activity.type.value,
-                'date': activity.date.strftime('%Y-%m-%d'),
-                'time': activity.time.strftime('%H:%M'),
-                'location': activity.location,
-                'description': activity.description,
-                'max_participants': activity.max_participants
-            })
-    return results
-
-def search_general_info(session, query):
-    # Combine results from all categories
-    results = {
-        'employees': search_employees(session, query),
-        'events': search_events(session, query),
-        'tasks': search_tasks(session, query),
-        'activities': search_activities(session, query)
+    return [_hit_to_dict(hit) for hit in _lookup(session, query, CATEGORY_TYPES["социальные активности"]).hits]
+
+def search_general_info(session, query, types=None):
+    # One ranked list across all entity types plus per-type hit counts (facets)
+    results = _lookup(session, query, types)
+    return {
+        'hits': [_hit_to_dict(hit) for hit in results.hits],
+        'facets': results.facets,
+        'total': results.total,
     }
-    return results
 
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
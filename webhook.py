@@ -0,0 +1,265 @@
+"""Webhook ingestion for the Telegram bots (BOT_MODE=webhook).
+
+Telegram POSTs updates to a FastAPI endpoint served by uvicorn. The endpoint
+answers 200 as soon as an update is queued. Processing happens in the
+``telegram.ext.Application`` with ``concurrent_updates``, so one slow query
+does not hold up the next update.
+
+With ``WEBHOOK_SETTINGS['workers'] > 1`` the HTTP process only routes.
+It reads the chat id from the raw JSON and puts the update on the queue of
+worker ``chat_id % workers``. Each worker process runs its own Application,
+so updates of one chat always land in the same process, in order. Only
+worker 0 runs background jobs (reminders). Each worker gets an equal share
+of the outbound rate limit.
+
+Each bot module exposes a factory ``build_application(background_jobs=True)``.
+``BOT_MODE=webhook`` in the bot's own ``main`` serves a single process. Sharded
+mode runs from this module, which stays light: the spawned workers import the
+bot from a ``"module:function"`` spec themselves.
+
+Usage:
+    BOT_MODE=webhook python telegram_bot.py
+    python webhook.py telegram_bot:build_application --workers 4
+"""
+import argparse
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import queue
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Optional, Union
+
+from fastapi import FastAPI, Request, Response
+from telegram import Bot, Update
+from telegram.ext import Application
+
+from config import TELEGRAM_API_BASE_URL, TELEGRAM_TOKEN, WEBHOOK_SETTINGS
+from logging_setup import configure_logging
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def load_factory(spec: str) -> Callable[..., Application]:
+    module_name, _, attr = spec.partition(':')
+    return getattr(importlib.import_module(module_name), attr or 'build_application')
+
+
+def extract_chat_id(update: dict) -> Optional[int]:
+    """Chat (or, failing that, user) id of a raw update, without building telegram objects."""
+    for key, payload in update.items():
+        if not isinstance(payload, dict):
+            continue
+        if key == 'callback_query' and isinstance(payload.get('message'), dict):
+            payload = payload['message']
+        chat = payload.get('chat') or payload.get('from')
+        if isinstance(chat, dict) and 'id' in chat:
+            return chat['id']
+    return None
+
+
+def shard_for(update: dict, shards: int) -> int:
+    chat_id = extract_chat_id(update)
+    return chat_id % shards if chat_id is not None else 0
+
+
+async def start_application(application: Application):
+    """Same lifecycle as ``run_polling``/``run_webhook`` minus the updater."""
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+
+
+async def stop_application(application: Application):
+    if application.running:
+        await application.stop()
+    if application.post_stop:
+        await application.post_stop(application)
+    await application.shutdown()
+    if application.post_shutdown:
+        await application.post_shutdown(application)
+
+
+async def register_webhook(bot: Bot):
+    """Point Telegram at WEBHOOK_SETTINGS['url'] (skipped when no public URL is configured)."""
+    if not WEBHOOK_SETTINGS['url']:
+        logger.info("WEBHOOK_URL is not set, not calling setWebhook")
+        return
+    await bot.set_webhook(
+        url=WEBHOOK_SETTINGS['url'].rstrip('/') + WEBHOOK_SETTINGS['path'],
+        secret_token=WEBHOOK_SETTINGS['secret_token'],
+        max_connections=WEBHOOK_SETTINGS['max_connections'],
+        allowed_updates=Update.ALL_TYPES,
+    )
+    logger.info("Webhook registered at %s", WEBHOOK_SETTINGS['url'])
+
+
+class LocalIngest:
+    """Single process: updates go straight into the Application's update queue."""
+
+    def __init__(self, factory: Callable[..., Application]):
+        self.application = factory()
+        self.received = 0
+
+    async def start(self):
+        await start_application(self.application)
+        await register_webhook(self.application.bot)
+
+    async def stop(self):
+        await stop_application(self.application)
+
+    async def put(self, data: dict) -> bool:
+        self.received += 1
+        await self.application.update_queue.put(Update.de_json(data, self.application.bot))
+        return True
+
+    def stats(self) -> dict:
+        return {'workers': 1, 'received': self.received, 'queued': self.application.update_queue.qsize()}
+
+
+def worker_main(factory_spec: str, index: int, workers: int, updates: multiprocessing.Queue):
+    configure_logging()
+    asyncio.run(_worker(factory_spec, index, workers, updates))
+
+
+async def _worker(factory_spec: str, index: int, workers: int, updates: multiprocessing.Queue):
+    application = load_factory(factory_spec)(background_jobs=index == 0)
+    application.bot_data['outbound_share'] = 1.0 / workers
+    await start_application(application)
+    logger.info("Webhook worker %d/%d started", index + 1, workers)
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            data = await loop.run_in_executor(None, updates.get)
+            if data is None:
+                break
+            await application.update_queue.put(Update.de_json(data, application.bot))
+    finally:
+        await stop_application(application)
+
+
+class ShardedIngest:
+    """Routes updates to worker processes by chat id; the HTTP process never loads the bot."""
+
+    def __init__(self, factory_spec: str, workers: int):
+        # spawn: воркеры не наследуют состояние родителя (модели, соединения с БД)
+        context = multiprocessing.get_context('spawn')
+        self.queues = [context.Queue(WEBHOOK_SETTINGS['queue_size']) for _ in range(workers)]
+        self.processes = [
+            context.Process(target=worker_main, args=(factory_spec, index, workers, updates),
+                            name=f'webhook-worker-{index}', daemon=True)
+            for index, updates in enumerate(self.queues)
+        ]
+        self.received = [0] * workers
+        self.rejected = 0
+
+    async def start(self):
+        for process in self.processes:
+            process.start()
+        bot = Bot(TELEGRAM_TOKEN, base_url=TELEGRAM_API_BASE_URL or 'https://api.telegram.org/bot')
+        async with bot:
+            await register_webhook(bot)
+
+    async def stop(self):
+        # put/join блокируют - в отдельном потоке, чтобы цикл событий продолжал закрывать соединения
+        await asyncio.to_thread(self._stop_workers)
+
+    def _stop_workers(self):
+        deadline = time.monotonic() + 10
+        for updates in self.queues:
+            try:
+                updates.put(None, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                pass  # очередь так и не освободилась - процесс будет остановлен terminate ниже
+        for process in self.processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()
+
+    async def put(self, data: dict) -> bool:
+        shard = shard_for(data, len(self.queues))
+        try:
+            self.queues[shard].put_nowait(data)
+        except queue.Full:
+            self.rejected += 1
+            return False
+        self.received[shard] += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            'workers': len(self.processes),
+            'alive': sum(process.is_alive() for process in self.processes),
+            'received': self.received,
+            'rejected': self.rejected,
+        }
+
+
+def create_app(ingest) -> FastAPI:
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        await ingest.start()
+        try:
+            yield
+        finally:
+            await ingest.stop()
+
+    app = FastAPI(lifespan=lifespan, docs_url=None, redoc_url=None, openapi_url=None)
+
+    @app.post(WEBHOOK_SETTINGS['path'])
+    async def telegram_webhook(request: Request):
+        secret = WEBHOOK_SETTINGS['secret_token']
+        if secret and request.headers.get(SECRET_HEADER) != secret:
+            return Response(status_code=403)
+        try:
+            data = await request.json()
+        except ValueError:
+            return Response(status_code=400)
+        # 503 - Telegram повторит доставку позже
+        return Response(status_code=200 if await ingest.put(data) else 503)
+
+    @app.get('/healthz')
+    async def healthz():
+        return ingest.stats()
+
+    return app
+
+
+def run_webhook(factory: Union[str, Callable[..., Application]], workers: int = WEBHOOK_SETTINGS['workers'],
+                host: str = WEBHOOK_SETTINGS['listen'], port: int = WEBHOOK_SETTINGS['port']):
+    """Serve the webhook. ``factory`` is a callable or a ``"module:function"`` spec (required for workers > 1)."""
+    import uvicorn
+
+    if workers > 1 and callable(factory):
+        logger.warning("WEBHOOK_WORKERS=%d needs a module:function spec (python webhook.py ...), "
+                       "serving in a single process", workers)
+        workers = 1
+    if workers > 1:
+        ingest = ShardedIngest(factory, workers)
+    else:
+        ingest = LocalIngest(load_factory(factory) if isinstance(factory, str) else factory)
+    logger.info("Serving webhook on %s:%d%s (%d worker(s))", host, port, WEBHOOK_SETTINGS['path'], workers)
+    uvicorn.run(create_app(ingest), host=host, port=port, log_level='warning', access_log=False)
+
+
+def main():
+    configure_logging()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('factory', nargs='?', default='telegram_bot:build_application',
+                        help='"module:function" returning a configured Application')
+    parser.add_argument('--workers', type=int, default=WEBHOOK_SETTINGS['workers'])
+    parser.add_argument('--host', default=WEBHOOK_SETTINGS['listen'])
+    parser.add_argument('--port', type=int, default=WEBHOOK_SETTINGS['port'])
+    args = parser.parse_args()
+    # Схема БД создается один раз здесь, а не в каждом воркере
+    from models import init_db
+    init_db()
+    run_webhook(args.factory, args.workers, args.host, args.port)
+
+
+if __name__ == '__main__':
+    main()